@@ -51,7 +51,7 @@ audit_log(){
   # Ensure logs dir
   local lf_dir="$GEMX_LOGS"; mkdir -p "$lf_dir"
   local lf="$lf_dir/audit-$(date -u +%Y%m%d).jsonl"
-  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv}' >> "$lf"
+  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" --arg run "${GEMX_RUN_ID:-}" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv} + (if $run != "" then {run:$run} else {} end)' >> "$lf"
 }
 
 # Confirmação opcional antes de executar comandos (plugin confirm_before_run)
@@ -77,6 +77,8 @@ run_cmd(){
     audit_log "cancel" "$1" "${@:2}"
     return 130
   fi
+  # run id liga start/finish da mesma execução (pareamento exato nos relatórios)
+  local GEMX_RUN_ID; GEMX_RUN_ID="$(date -u +%s)-$$-$RANDOM"
   audit_log "start" "$1" "${@:2}"
   "$@"; local st=$?
   audit_log "finish" "$1" "${@:2}"
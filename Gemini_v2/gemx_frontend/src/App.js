@@ -55,7 +55,9 @@ function App() {
     setOutput('');
 
     try {
-      const response = await fetch(`${API_BASE_URL}/automations/run`, {
+      // Streaming endpoint: the backend forwards stdout as Server-Sent Events,
+      // so output shows up as soon as the model emits its first tokens.
+      const response = await fetch(`${API_BASE_URL}/automations/run/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -72,8 +74,25 @@ function App() {
         throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      setOutput(data.output);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = (raw.match(/^event: (.*)$/m) || [])[1];
+          const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || '{}');
+          if (event === 'chunk') {
+            setOutput((prev) => prev + data.text);
+          } else if (event === 'error') {
+            throw new Error(data.detail || `exit code ${data.rc}`);
+          }
+        }
+      }
     } catch (e) {
       setError(`Failed to run automation: ${e.message}`);
       console.error("Failed to run automation:", e);
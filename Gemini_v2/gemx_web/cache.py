@@ -0,0 +1,153 @@
+# Cache de respostas endereçado por conteúdo
+#
+# Cópia de gemx_python/src/gemx/cache.py (mesmo formato em disco, para que CLI e
+# web compartilhem as entradas). São três cópias: gemx_python/src/gemx/cache.py,
+# Gemini_v2/gemx_web/cache.py e matheus_apple_med_dev_suite/k8s/gemini_megapack/web/cache.py;
+# mantenha as três idênticas abaixo deste cabeçalho (o tests/self-test.sh do megapack confere).
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+CACHE_DIR = Path(
+    os.environ.get("GEMX_CACHE_DIR")
+    or Path(os.environ.get("GEMX_HOME") or Path.home() / ".config" / "gemx") / "cache"
+)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class ResponseCache:
+    """Cache em disco com TTL, limite de tamanho (evicção LRU) e contadores."""
+
+    def __init__(
+        self,
+        root: Path = CACHE_DIR,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        max_temperature: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes if max_bytes is not None else int(_env_float("GEMX_CACHE_MAX_MB", 64) * 1024 * 1024)
+        self.ttl = ttl if ttl is not None else _env_float("GEMX_CACHE_TTL", 7 * 24 * 3600)
+        # Só faz sentido cachear execuções (quase) determinísticas
+        self.max_temperature = max_temperature if max_temperature is not None else _env_float("GEMX_CACHE_MAX_TEMP", 0.3)
+        self.enabled = enabled if enabled is not None else os.environ.get("GEMX_CACHE", "1") != "0"
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "bypass": 0}
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, temperature: float, system: str, prompt: str, extra_args: Sequence[str] = (),
+            backend: str = "cli") -> str:
+        """`backend` separa saídas de backends diferentes (o gemx.sh usa o binário: "cli")."""
+        payload = json.dumps(
+            [backend, model, float(temperature), system or "", prompt, list(extra_args)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature: float, bypass: bool = False) -> bool:
+        """Indica se a chamada deve passar pelo cache; conta como bypass caso contrário."""
+        ok = self.enabled and not bypass and float(temperature) <= self.max_temperature
+        if not ok:
+            self.stats["bypass"] += 1
+        return ok
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self.stats["misses"] += 1
+            return None
+        if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+            self._remove(path)
+            self.stats["misses"] += 1
+            return None
+        try:
+            os.utime(path)  # marca acesso recente para a evicção LRU
+        except OSError:
+            pass
+        self.stats["hits"] += 1
+        return entry.get("response")
+
+    def put(self, key: str, response: str, meta: Optional[Dict[str, Any]] = None):
+        path = self._path(key)
+        data = json.dumps(
+            {"created": time.time(), "meta": meta or {}, "response": response},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            old = path.stat().st_size if path.exists() else 0
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self.stats["writes"] += 1
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(data) - old
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> List[tuple]:
+        """Lista (mtime, tamanho, caminho) de todas as entradas."""
+        entries = []
+        if not self.root.is_dir():
+            return entries
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                if e.name.endswith(".json"):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, e.path))
+        return entries
+
+    def _evict(self):
+        """Remove as entradas menos recentemente usadas até ficar em 90% do limite."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            if self._remove(Path(p)):
+                total -= size
+                self.stats["evictions"] += 1
+        self._size = total
+
+    @staticmethod
+    def _remove(path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except OSError:
+            return False
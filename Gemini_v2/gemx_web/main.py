@@ -1,12 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import subprocess
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.utils import formatdate
+import asyncio
+import codecs
+import hashlib
+import json
 import os
+import signal
+import time
 
 from fastapi.middleware.cors import CORSMiddleware
+from .cache import ResponseCache
+
+try:
+    import yaml  # type: ignore
+except Exception:  # PyYAML opcional: sem ele só não há metadados
+    yaml = None
 from typing import List, Tuple, Optional, Dict
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Catálogo de automations montado uma vez na inicialização
+    REGISTRY.refresh(force=True)
+    yield
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Gemini Megapack v2 Web API",
     description="API para interagir com as automações do Gemini Megapack v2.",
     version="0.1.0",
@@ -25,17 +48,128 @@ class AutomationRequest(BaseModel):
     automation_name: str
     prompt: str
     extra_args: list[str] = []
+    no_cache: bool = False
 
-@app.post("/automations/run")
-async def run_automation(request: AutomationRequest):
-    """
-    Executa uma automação do Gemini Megapack v2.
+# --- Execução assíncrona com pool limitado ---
+# Limites configuráveis por ambiente para dimensionar o pool sob carga.
+MAX_CONCURRENCY = max(1, int(os.environ.get("GEMX_WEB_MAX_CONCURRENCY", "4")))
+MAX_QUEUE = max(0, int(os.environ.get("GEMX_WEB_MAX_QUEUE", "32")))
+RUN_TIMEOUT = float(os.environ.get("GEMX_WEB_RUN_TIMEOUT", "300"))
+STREAM_CHUNK_BYTES = 1024
+
+
+async def _wait_disconnect(request: Request, interval: float = 0.5):
+    """Retorna quando o cliente HTTP desconecta."""
+    while not await request.is_disconnected():
+        await asyncio.sleep(interval)
+
+
+async def _race_disconnect(aw, request: Request, timeout: Optional[float] = None) -> Tuple[bool, object]:
+    """Aguarda `aw` até concluir, estourar `timeout` ou o cliente desconectar.
+
+    Retorna (True, resultado) em sucesso ou (False, "timeout"|"disconnect").
     """
-    # Caminho para o script gemx.sh (assumindo que está no diretório pai de gemx_web)
+    task = asyncio.ensure_future(aw)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if task.done():
+        return True, task.result()
+    task.cancel()
+    return False, ("disconnect" if watcher.done() and not watcher.cancelled() else "timeout")
+
+
+class AutomationPool:
+    """Pool limitado de execuções do gemx.sh com fila de tamanho máximo e métricas."""
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.queued = 0
+        self.running = 0
+        self.finished: Dict[str, int] = {
+            "success": 0, "error": 0, "timeout": 0, "cancelled": 0, "rejected": 0,
+        }
+        self.busy_seconds = 0.0
+
+    def record(self, outcome: str):
+        self.finished[outcome] = self.finished.get(outcome, 0) + 1
+
+    def check_queue(self):
+        """Falha com 429 se a fila estiver cheia (antes de aceitar a requisição)."""
+        if self.queued >= self.max_queue and self._sem.locked():
+            self.record("rejected")
+            raise HTTPException(status_code=429, detail="Fila de automações cheia; tente novamente.")
+
+    async def acquire(self, request: Request) -> float:
+        """Reserva uma vaga de execução; falha com 429 se a fila estiver cheia.
+
+        Retorna o instante de início, a ser repassado para `release`.
+        """
+        self.check_queue()
+        self.queued += 1
+        try:
+            acquired, _ = await _race_disconnect(self._sem.acquire(), request)
+        finally:
+            self.queued -= 1
+        if not acquired:
+            self.record("cancelled")
+            raise HTTPException(status_code=499, detail="Cliente desconectou antes da execução.")
+        self.running += 1
+        return time.monotonic()
+
+    def release(self, started: float):
+        self.busy_seconds += time.monotonic() - started
+        self.running -= 1
+        self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self, request: Request):
+        started = await self.acquire(request)
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout_seconds": RUN_TIMEOUT,
+            "queued": self.queued,
+            "running": self.running,
+            "finished": dict(self.finished),
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+POOL = AutomationPool(MAX_CONCURRENCY, MAX_QUEUE)
+
+
+async def _kill(proc: asyncio.subprocess.Process):
+    """Encerra o gemx.sh e todos os filhos (o processo roda em sessão própria)."""
+    if proc.returncode is None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+def _gemx_script_path() -> str:
+    """Caminho para o script gemx.sh (no diretório pai de gemx_web)."""
     gemx_script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "gemx.sh"))
-    
     if not os.path.exists(gemx_script_path):
         raise HTTPException(status_code=500, detail=f"gemx.sh script not found at {gemx_script_path}")
+    return gemx_script_path
+
+
+def _automation_command(request: AutomationRequest) -> Tuple[List[str], Dict[str, str], str]:
+    """Monta (argv, env, cwd) para `gemx.sh auto run <yaml>`."""
+    gemx_script_path = _gemx_script_path()
 
     # Resolver caminho seguro do YAML (suporta subpastas e múltiplas bases)
     target_yaml = _safe_automation_path(request.automation_name)
@@ -52,30 +186,208 @@ async def run_automation(request: AutomationRequest):
     ]
     command.extend(request.extra_args)
 
+    env = os.environ.copy()
+    env["GEMX_PROMPT"] = request.prompt or ""
+    env["GEMX_QUIET"] = "1"
+    cwd = os.path.join(os.path.dirname(__file__), "..")  # Executar do diretório Gemini_v2
+    return command, env, cwd
+
+
+# Cache em disco compartilhado com o CLI; handlers async fazem a E/S dele via asyncio.to_thread
+CACHE = ResponseCache()
+
+
+def _gemx_config_system() -> str:
+    """System prompt do config.json do gemx (usado pelo gemx.sh quando o YAML não define)."""
+    home = os.environ.get("GEMX_HOME") or os.path.join(os.path.expanduser("~"), ".config", "gemx")
     try:
-        # Executar o comando gemx.sh
-        env = os.environ.copy()
-        env["GEMX_PROMPT"] = request.prompt or ""
-        env["GEMX_QUIET"] = "1"
-        process = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=os.path.join(os.path.dirname(__file__), ".."), # Executar do diretório Gemini_v2
-            env=env,
-        )
-        return {"status": "success", "output": process.stdout.strip()}
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Erro ao executar automação: {e.stderr.strip()}"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro inesperado: {str(e)}")
+        with open(os.path.join(home, "config.json"), "r", encoding="utf-8") as f:
+            system = json.load(f).get("system") or ""
+    except (OSError, ValueError, AttributeError):
+        return ""
+    return system if isinstance(system, str) else ""
+
+
+def _automation_cache_key(request: AutomationRequest) -> Optional[str]:
+    """Chave de cache da execução, resolvendo o prompt como o `auto_run` do gemx.sh.
+
+    Retorna None quando a execução não deve passar pelo cache (bypass, temperatura alta).
+    """
+    entry = _lookup_automation(request.automation_name)
+    if entry.prompt is None:
+        return None
+    temperature = entry.temperature if entry.temperature is not None else 0.2
+    if not CACHE.cacheable(temperature, bypass=request.no_cache):
+        return None
+    # gemx.sh sempre força o modelo (GEMX_FORCE_MODEL, padrão gemini-2.5-pro)
+    model = os.environ.get("GEMX_FORCE_MODEL") or "gemini-2.5-pro"
+    prompt = entry.prompt
+    if request.prompt:
+        if "{{INPUT}}" in prompt:
+            prompt = prompt.replace("{{INPUT}}", request.prompt, 1)
+        else:
+            prompt = f"{prompt}\n\n---\nUser input:\n{request.prompt}"
+    return ResponseCache.key(model, temperature, _gemx_config_system(), prompt, request.extra_args)
+
+
+@app.post("/automations/run")
+async def run_automation(request: AutomationRequest, http_request: Request):
+    """
+    Executa uma automação do Gemini Megapack v2.
+    """
+    command, env, cwd = _automation_command(request)
+    cache_key = await asyncio.to_thread(_automation_cache_key, request)
+    if cache_key:
+        cached = await asyncio.to_thread(CACHE.get, cache_key)
+        if cached is not None:
+            return {"status": "success", "output": cached, "cached": True}
+
+    async with POOL.slot(http_request):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            )
+        except Exception as e:
+            POOL.record("error")
+            raise HTTPException(status_code=500, detail=f"Erro inesperado: {str(e)}")
+
+        try:
+            ok, result = await _race_disconnect(proc.communicate(), http_request, timeout=RUN_TIMEOUT)
+        finally:
+            await _kill(proc)
+
+        if not ok:
+            if result == "timeout":
+                POOL.record("timeout")
+                raise HTTPException(status_code=504, detail=f"Automação excedeu {RUN_TIMEOUT:g}s")
+            POOL.record("cancelled")
+            raise HTTPException(status_code=499, detail="Cliente desconectou; automação cancelada.")
+
+        stdout, stderr = result
+        if proc.returncode != 0:
+            POOL.record("error")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erro ao executar automação: {stderr.decode('utf-8', 'replace').strip()}"
+            )
+        POOL.record("success")
+        output = stdout.decode("utf-8", "replace").strip()
+        if cache_key and output:
+            await asyncio.to_thread(CACHE.put, cache_key, output, {"automation": request.automation_name})
+        return {"status": "success", "output": output}
+
+
+def _sse(event: str, data: object) -> bytes:
+    """Formata um evento Server-Sent Events com payload JSON (preserva quebras de linha)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+@app.post("/automations/run/stream")
+async def run_automation_stream(request: AutomationRequest, http_request: Request):
+    """
+    Executa uma automação e repassa o stdout incrementalmente como Server-Sent Events.
+
+    Eventos: `chunk` (texto parcial), `done` (código de saída) e `error`.
+    O stdout só é lido quando o cliente consome o evento anterior (backpressure);
+    se o cliente desconectar, o processo é encerrado.
+    """
+    command, env, cwd = _automation_command(request)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    cache_key = await asyncio.to_thread(_automation_cache_key, request)
+    if cache_key:
+        cached = await asyncio.to_thread(CACHE.get, cache_key)
+        if cached is not None:
+            async def cached_events():
+                yield _sse("chunk", {"text": cached})
+                yield _sse("done", {"rc": 0, "cached": True})
+
+            return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+
+    POOL.check_queue()
+
+    async def events():
+        # vaga e processo são obtidos dentro do gerador: se o cliente desconectar
+        # antes do primeiro byte, o finally ainda libera a vaga e mata o processo
+        outcome = "cancelled"
+        started: Optional[float] = None
+        proc: Optional[asyncio.subprocess.Process] = None
+        stderr_task: Optional[asyncio.Future] = None
+        # decodificador incremental: um caractere multibyte pode vir dividido entre chunks
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        collected: List[bytes] = []
+        try:
+            try:
+                started = await POOL.acquire(http_request)
+                proc = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=cwd,
+                    env=env,
+                    start_new_session=True,
+                )
+            except HTTPException as e:
+                yield _sse("error", {"status": e.status_code, "detail": e.detail})
+                return
+            except Exception as e:
+                outcome = "error"
+                yield _sse("error", {"detail": f"Erro inesperado: {str(e)}"})
+                return
+            deadline = time.monotonic() + RUN_TIMEOUT
+            # stderr drenado em paralelo para o pipe não encher e travar o processo
+            stderr_task = asyncio.ensure_future(proc.stderr.read())
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    outcome = "timeout"
+                    yield _sse("error", {"detail": f"Automação excedeu {RUN_TIMEOUT:g}s"})
+                    return
+                try:
+                    chunk = await asyncio.wait_for(proc.stdout.read(STREAM_CHUNK_BYTES), timeout=remaining)
+                except asyncio.TimeoutError:
+                    continue
+                if not chunk:
+                    break
+                collected.append(chunk)
+                text = decoder.decode(chunk)
+                if text:
+                    yield _sse("chunk", {"text": text})
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield _sse("chunk", {"text": text})
+            stderr = await stderr_task
+            rc = await proc.wait()
+            if rc != 0:
+                outcome = "error"
+                yield _sse("error", {"rc": rc, "detail": stderr.decode("utf-8", "replace").strip()})
+            else:
+                outcome = "success"
+                output = b"".join(collected).decode("utf-8", "replace").strip()
+                if cache_key and output:
+                    await asyncio.to_thread(CACHE.put, cache_key, output, {"automation": request.automation_name})
+                yield _sse("done", {"rc": rc})
+        finally:
+            if stderr_task is not None:
+                stderr_task.cancel()
+            if proc is not None:
+                await _kill(proc)
+            if started is not None:
+                POOL.record(outcome)
+                POOL.release(started)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas do pool de execução (fila, em execução, concluídos por resultado) e do cache."""
+    return {**POOL.snapshot(), "cache": dict(CACHE.stats)}
 
-import glob
-from typing import Dict, Tuple, Optional
 
 
 def _project_dirs() -> Tuple[str, str]:
@@ -130,79 +442,165 @@ def _automations_base_dirs() -> List[str]:
     return uniq
 
 
+def _read_yaml(path: str) -> Optional[Dict]:
+    if yaml is None:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f)  # type: ignore
+    except Exception:
+        return None
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return -1.0
+
+
+@dataclass
+class AutomationEntry:
+    """Metadados de uma automação já parseada."""
+    name: str
+    path: str
+    mtime: float
+    data: Optional[Dict] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    prompt: Optional[str] = None
+    has_input_placeholder: Optional[bool] = None
+
+    @classmethod
+    def load(cls, name: str, path: str, mtime: float) -> "AutomationEntry":
+        data = _read_yaml(path)
+        entry = cls(name=name, path=path, mtime=mtime, data=data if isinstance(data, dict) else None)
+        if entry.data is not None:
+            model = entry.data.get("model")
+            temp = entry.data.get("temperature")
+            prompt = entry.data.get("prompt")
+            entry.model = model if isinstance(model, str) else None
+            entry.temperature = float(temp) if isinstance(temp, (int, float)) else None
+            entry.prompt = prompt if isinstance(prompt, str) else None
+            entry.has_input_placeholder = ("{{INPUT}}" in prompt) if isinstance(prompt, str) else False
+        return entry
+
+
+class AutomationRegistry:
+    """Catálogo em memória das automations (nome → metadados), com lookup O(1).
+
+    A revalidação é feita por mtime no máximo a cada `min_interval` segundos:
+    diretórios alterados (arquivos criados/removidos) disparam nova listagem e
+    só os YAMLs com mtime diferente são parseados de novo.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.bases: List[str] = []
+        self.entries: Dict[str, AutomationEntry] = {}
+        self.names: List[str] = []
+        self.etag = ""
+        self.last_modified = 0.0
+        self._dirs: Dict[str, float] = {}
+        self._files: Dict[str, AutomationEntry] = {}
+        self._checked: Optional[float] = None
+
+    def refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._checked is not None and now - self._checked < self.min_interval:
+            return
+        self._checked = now
+        bases = _automations_base_dirs()
+        stale = (
+            force
+            or bases != self.bases
+            or any(_mtime(d) != m for d, m in self._dirs.items())
+            or any(_mtime(p) != e.mtime for p, e in self._files.items())
+        )
+        if stale:
+            self._rebuild(bases)
+
+    def _rebuild(self, bases: List[str]):
+        dirs: Dict[str, float] = {}
+        files: Dict[str, AutomationEntry] = {}
+        entries: Dict[str, AutomationEntry] = {}
+        for base in bases:
+            for dirpath, _, filenames in os.walk(base):
+                dirs[dirpath] = _mtime(dirpath)
+                for fn in filenames:
+                    if not fn.endswith(".yaml"):
+                        continue
+                    path = os.path.join(dirpath, fn)
+                    mtime = _mtime(path)
+                    name = os.path.splitext(os.path.relpath(path, base))[0].replace(os.sep, "/")
+                    cached = self._files.get(path)
+                    if cached is None or cached.mtime != mtime or cached.name != name:
+                        cached = AutomationEntry.load(name, path, mtime)
+                    files[path] = cached
+                    # A primeira base tem precedência para nomes repetidos
+                    entries.setdefault(name, cached)
+        self.bases, self._dirs, self._files, self.entries = bases, dirs, files, entries
+        self.names = sorted(entries)
+        fingerprint = json.dumps([(n, entries[n].path, entries[n].mtime) for n in self.names])
+        self.etag = '"' + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest() + '"'
+        self.last_modified = max([e.mtime for e in files.values()] + list(dirs.values()) + [0.0])
+
+    def get(self, name: str) -> Optional[AutomationEntry]:
+        self.refresh()
+        return self.entries.get(name.replace("\\", "/").lstrip("/."))
+
+
+REGISTRY = AutomationRegistry(float(os.environ.get("GEMX_WEB_CATALOG_REFRESH", "2")))
+
+
+def _catalog_headers() -> Dict[str, str]:
+    return {
+        "ETag": REGISTRY.etag,
+        "Last-Modified": formatdate(REGISTRY.last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
 @app.get("/automations")
-async def list_automations():
+async def list_automations(request: Request):
     """
     Lista todas as automações disponíveis no Megapack (inclui subpastas como 'matheus').
     Retorna caminhos relativos sem a extensão .yaml.
+    Responde 304 quando o If-None-Match do cliente bate com o ETag atual do catálogo.
     """
-    bases = _automations_base_dirs()
-    all_names: set[str] = set()
-    for base in bases:
-        yaml_files: List[str] = [
-            os.path.relpath(p, base)
-            for p in glob.glob(os.path.join(base, "**", "*.yaml"), recursive=True)
-        ]
-        for p in yaml_files:
-            name = os.path.splitext(p)[0].replace(os.sep, "/")
-            all_names.add(name)
-    return {"automations": sorted(all_names)}
+    REGISTRY.refresh()
+    headers = _catalog_headers()
+    if request.headers.get("if-none-match") == REGISTRY.etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"automations": REGISTRY.names}, headers=headers)
 
-def _safe_automation_path(name: str) -> str:
-    """Resolve nome (com subpastas) para caminho seguro dentro das bases de automations.
-    Bloqueia path traversal e exige que o arquivo exista em alguma base.
-    """
-    norm = name.replace("\\", "/").lstrip("/.")
-    bases = _automations_base_dirs()
-    candidates: List[str] = []
-    for base in bases:
-        tgt = os.path.abspath(os.path.join(base, f"{norm}.yaml"))
-        # garantir que está sob a base
-        if not tgt.startswith(base + os.sep):
-            continue
-        candidates.append(tgt)
-    for c in candidates:
-        if os.path.exists(c):
-            return c
-    raise HTTPException(status_code=404, detail=f"Automação '{name}' não encontrada em bases: {bases}")
 
+def _lookup_automation(name: str) -> AutomationEntry:
+    entry = REGISTRY.get(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Automação '{name}' não encontrada em bases: {REGISTRY.bases}")
+    return entry
 
-def _read_yaml(path: str) -> Optional[Dict]:
-    try:
-        import yaml  # type: ignore
-    except Exception:
-        return None
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)  # type: ignore
-    except Exception:
-        return None
+
+def _safe_automation_path(name: str) -> str:
+    """Resolve nome (com subpastas) para o caminho do YAML dentro das bases de automations.
+    Só aceita nomes presentes no catálogo, o que bloqueia path traversal.
+    """
+    return _lookup_automation(name).path
 
 
 @app.get("/automations/{name}")
 async def automation_info(name: str):
     """Retorna metadados básicos da automação (model, temperature, prompt presence)."""
-    target = _safe_automation_path(name)
-    data = _read_yaml(target)
+    entry = _lookup_automation(name)
     info: Dict[str, Optional[str | float | bool]] = {
         "name": name,
-        "path": target,
-        "model": None,
-        "temperature": None,
-        "has_input_placeholder": None,
+        "path": entry.path,
+        "model": entry.model,
+        "temperature": entry.temperature,
+        "has_input_placeholder": entry.has_input_placeholder,
     }
-    if data:
-        model = data.get("model") if isinstance(data, dict) else None
-        temp = data.get("temperature") if isinstance(data, dict) else None
-        prompt = data.get("prompt") if isinstance(data, dict) else None
-        info.update(
-            {
-                "model": model if isinstance(model, str) else None,
-                "temperature": float(temp) if isinstance(temp, (int, float)) else None,
-                "has_input_placeholder": ("{{INPUT}}" in prompt) if isinstance(prompt, str) else False,
-            }
-        )
-    return info
+    return JSONResponse(info, headers=_catalog_headers())
 
 @app.get("/")
 async def root():
@@ -0,0 +1,262 @@
+# Backends de geração: como o prompt chega ao modelo
+#
+# Cada backend é criado uma única vez por processo (CLI ou web) e reutilizado
+# entre prompts; a resolução do binário também é feita uma vez só.
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class GenerationError(RuntimeError):
+    """Falha ao gerar uma resposta em qualquer backend."""
+
+
+@dataclass(frozen=True)
+class GenerationSettings:
+    """Parâmetros de uma chamada de geração (snapshot do estado)."""
+    model: str
+    temperature: float
+    system: str = ""
+
+
+@lru_cache(maxsize=1)
+def resolve_gemini_binary() -> Optional[str]:
+    """Resolve o binário 'gemini' ou 'gmini' uma única vez por processo.
+
+    Respeita GEMINI_BIN (mesma convenção do gemx.sh). Retorna o caminho absoluto.
+    """
+    candidates = [os.environ.get("GEMINI_BIN", ""), "gemini", "gmini"]
+    for binary in candidates:
+        if binary:
+            path = shutil.which(binary)
+            if path:
+                return path
+    return None
+
+
+class GenerationBackend:
+    """Interface comum dos backends."""
+    name = "base"
+
+    @property
+    def cache_id(self) -> str:
+        """Identifica o backend nas chaves de cache (saídas de backends diferentes não se misturam)."""
+        return self.name
+
+    def generate(self, prompt: str, settings: GenerationSettings) -> str:
+        return "".join(self.stream(prompt, settings)).strip()
+
+    def stream(self, prompt: str, settings: GenerationSettings) -> Iterator[str]:
+        raise NotImplementedError
+
+    def close(self):
+        """Libera recursos persistentes (conexões, processos)."""
+
+
+class CliBackend(GenerationBackend):
+    """Executa o binário oficial diretamente (sem `bash -c` nem shell=True)."""
+    name = "cli"
+
+    def __init__(self, binary: Optional[str] = None):
+        self.binary = binary or resolve_gemini_binary()
+
+    def _argv(self, settings: GenerationSettings) -> List[str]:
+        if not self.binary:
+            raise GenerationError("Binário do Gemini não encontrado.")
+        args = [
+            self.binary,
+            "generate",
+            "--model", settings.model,
+            "--temperature", str(settings.temperature),
+        ]
+        if settings.system:
+            args.extend(["--system", settings.system])
+        return args
+
+    def generate(self, prompt: str, settings: GenerationSettings) -> str:
+        try:
+            result = subprocess.run(self._argv(settings), input=prompt, capture_output=True, text=True, check=True)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            raise GenerationError(str(e)) from e
+        return result.stdout.strip()
+
+    def stream(self, prompt: str, settings: GenerationSettings) -> Iterator[str]:
+        try:
+            proc = subprocess.Popen(
+                self._argv(settings),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+        except FileNotFoundError as e:
+            raise GenerationError(str(e)) from e
+        try:
+            proc.stdin.write(prompt)
+            proc.stdin.close()
+            for line in proc.stdout:
+                yield line
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        if proc.returncode != 0:
+            raise GenerationError(f"'{self.binary}' terminou com código {proc.returncode}")
+
+
+class HttpBackend(GenerationBackend):
+    """Cliente HTTP direto para a API do Gemini com conexão keep-alive persistente.
+
+    Requer GEMINI_API_KEY (ou GOOGLE_API_KEY). Cada thread abre sua conexão na
+    primeira chamada e a reaproveita nas seguintes (HTTPSConnection não é
+    thread-safe); o lock protege só a criação e o fechamento das conexões.
+    """
+    name = "http"
+    host = "generativelanguage.googleapis.com"
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 300.0):
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY", "")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conns: List[http.client.HTTPSConnection] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cache_id(self) -> str:
+        return f"{self.name}:{self.host}"
+
+    def _connection(self) -> http.client.HTTPSConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+            with self._lock:
+                self._conns.append(conn)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        """Fecha a conexão da thread atual (será reaberta na próxima chamada)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+            with self._lock:
+                if conn in self._conns:
+                    self._conns.remove(conn)
+
+    def _body(self, prompt: str, settings: GenerationSettings) -> bytes:
+        body: Dict = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": settings.temperature},
+        }
+        if settings.system:
+            body["systemInstruction"] = {"parts": [{"text": settings.system}]}
+        return json.dumps(body).encode("utf-8")
+
+    @staticmethod
+    def _text_of(payload: Dict) -> str:
+        parts = []
+        for cand in payload.get("candidates", [])[:1]:
+            for part in cand.get("content", {}).get("parts", []):
+                parts.append(part.get("text", ""))
+        return "".join(parts)
+
+    def stream(self, prompt: str, settings: GenerationSettings) -> Iterator[str]:
+        if not self.api_key:
+            raise GenerationError("GEMINI_API_KEY não definido para o backend http.")
+        path = f"/v1beta/models/{settings.model}:streamGenerateContent?alt=sse"
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request("POST", path, body=self._body(prompt, settings), headers=headers)
+                resp = conn.getresponse()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                # Conexão keep-alive pode ter sido fechada pelo servidor: reabre uma vez
+                self._drop()
+                if attempt == 2:
+                    raise GenerationError(str(e)) from e
+        if resp.status != 200:
+            detail = resp.read().decode("utf-8", "replace")
+            raise GenerationError(f"HTTP {resp.status}: {detail}")
+        for raw in resp:
+            line = raw.decode("utf-8", "replace").strip()
+            if not line.startswith("data:"):
+                continue
+            try:
+                chunk = self._text_of(json.loads(line[5:]))
+            except json.JSONDecodeError:
+                continue
+            if chunk:
+                yield chunk
+
+    def close(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+
+class FakeBackend(GenerationBackend):
+    """Backend local sem rede, para testes e benchmark de latência por chamada.
+
+    A latência simulada vem de GEMX_FAKE_LATENCY_MS (padrão 0).
+    """
+    name = "fake"
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        if latency_ms is None:
+            latency_ms = float(os.environ.get("GEMX_FAKE_LATENCY_MS", "0") or 0)
+        self.latency = latency_ms / 1000.0
+
+    def stream(self, prompt: str, settings: GenerationSettings) -> Iterator[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        yield f"[{settings.model} t={settings.temperature}] "
+        for word in prompt.split():
+            yield word + " "
+
+
+BACKENDS: Dict[str, Callable[[], GenerationBackend]] = {
+    "cli": CliBackend,
+    "http": HttpBackend,
+    "fake": FakeBackend,
+}
+
+_instances: Dict[str, GenerationBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], GenerationBackend]):
+    """Registra um backend adicional (ex.: plugins)."""
+    BACKENDS[name] = factory
+
+
+def get_backend(name: str) -> GenerationBackend:
+    """Retorna a instância única do backend `name` para este processo."""
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            factory = BACKENDS.get(name)
+            if factory is None:
+                raise GenerationError(f"Backend desconhecido: '{name}'. Disponíveis: {', '.join(sorted(BACKENDS))}")
+            backend = factory()
+            _instances[name] = backend
+        return backend
+
+
+def close_backends():
+    """Fecha todos os backends abertos (chamado no encerramento do processo)."""
+    with _instances_lock:
+        for backend in _instances.values():
+            backend.close()
+        _instances.clear()
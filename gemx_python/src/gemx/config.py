@@ -1,5 +1,6 @@
 # Lógica para carregar e gerenciar o config.json e o estado da aplicação
 import json
+import os
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, Any, Optional
@@ -13,6 +14,8 @@ class GemxState:
     model: str = "gemini-2.5-pro"
     temperature: float = 0.2
     system: str = ""
+    # Backend de geração: "cli" (binário oficial), "http" (API direta) ou "fake"
+    backend: str = "cli"
     # Adicione outros campos conforme necessário
     plugins: Dict[str, bool] = field(default_factory=dict)
 
@@ -55,6 +58,7 @@ def load_and_init_state():
     STATE.model = config_data.get("model", STATE.model)
     STATE.temperature = config_data.get("temperature", STATE.temperature)
     STATE.system = config_data.get("system", STATE.system)
+    STATE.backend = os.environ.get("GEMX_BACKEND") or config_data.get("backend", STATE.backend)
     STATE.plugins = config_data.get("plugins", STATE.plugins)
 
 def apply_profile(profile_name: str) -> bool:
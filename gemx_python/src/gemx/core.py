@@ -1,68 +1,92 @@
 # Funções principais do core da aplicação
-import subprocess
-import shlex
+import sys
+import time
 from . import config
+from .backends import GenerationBackend, GenerationError, GenerationSettings, get_backend, resolve_gemini_binary
+from .cache import ResponseCache
 from rich.console import Console
-from typing import List
+from typing import List, Optional
 
-console = Console()
+# Mensagens de status vão para stderr: stdout fica só com a resposta (gemx gen > arquivo, flow run --json)
+console = Console(stderr=True)
+
+# Cache de respostas compartilhado pelo processo (ver cache.py)
+CACHE = ResponseCache()
 
 def find_gemini_binary():
-    """Encontra o binário 'gemini' ou 'gmini' no PATH."""
-    for binary in ["gemini", "gmini"]:
-        try:
-            subprocess.run(["which", binary], check=True, capture_output=True)
-            return binary
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            continue
-    return None
+    """Encontra o binário 'gemini' ou 'gmini' no PATH (resolvido uma vez por processo)."""
+    return resolve_gemini_binary()
 
-def _build_gemini_args() -> List[str]:
-    """Constrói a lista de argumentos para chamar o binário do Gemini."""
-    args = [
-        "generate",
-        "--model", config.STATE.model,
-        "--temperature", str(config.STATE.temperature),
-    ]
-    if config.STATE.system:
-        args.extend(["--system", config.STATE.system])
-    return args
+def current_settings() -> GenerationSettings:
+    """Snapshot dos parâmetros de geração do estado global."""
+    return GenerationSettings(
+        model=config.STATE.model,
+        temperature=config.STATE.temperature,
+        system=config.STATE.system,
+    )
 
-def get_generation(prompt: str) -> str:
-    """Executa o Gemini e captura a saída como uma string."""
-    gemini_bin = find_gemini_binary()
-    if not gemini_bin:
-        console.print("[red]Erro:[/red] Binário do Gemini não encontrado.")
-        return ""
+def current_backend() -> GenerationBackend:
+    """Backend configurado (config.json 'backend' ou GEMX_BACKEND), reutilizado entre prompts."""
+    return get_backend(config.STATE.backend)
+
+def _cache_key(prompt: str, settings: GenerationSettings) -> str:
+    return ResponseCache.key(settings.model, settings.temperature, settings.system, prompt,
+                             backend=current_backend().cache_id)
 
-    args = [gemini_bin] + _build_gemini_args()
-    # Construímos o comando para ser executado explicitamente pelo bash
-    cmd_string = " ".join(map(shlex.quote, args))
-    bash_cmd = f"bash -c {shlex.quote(cmd_string)}"
+def get_generation(prompt: str, use_cache: bool = True, settings: Optional[GenerationSettings] = None) -> str:
+    """Executa o Gemini e captura a saída como uma string (settings padrão: estado global)."""
+    settings = settings or current_settings()
+    key = _cache_key(prompt, settings) if CACHE.cacheable(settings.temperature, bypass=not use_cache) else None
+    if key:
+        cached = CACHE.get(key)
+        if cached is not None:
+            console.print(f"[dim]Resposta servida do cache ({key[:12]}).[/dim]")
+            return cached
+
+    console.print(f"[cyan]Gerando resposta com o modelo [bold]{settings.model}[/bold]...[/cyan]")
 
-    console.print(f"[cyan]Gerando resposta com o modelo [bold]{config.STATE.model}[/bold]...[/cyan]")
-    
     try:
-        result = subprocess.run(bash_cmd, input=prompt, capture_output=True, text=True, check=True, shell=True)
-        return result.stdout.strip()
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        output = current_backend().generate(prompt, settings)
+    except GenerationError as e:
         console.print(f"[red]Falha ao executar o comando do Gemini:[/red]\n{e}")
         return ""
+    if key and output:
+        CACHE.put(key, output, {"model": settings.model, "temperature": settings.temperature})
+    return output
 
-def run_generation(prompt: str):
+def run_generation(prompt: str, use_cache: bool = True):
     """Executa o comando de geração do Gemini e exibe a saída diretamente."""
-    gemini_bin = find_gemini_binary()
-    if not gemini_bin:
-        console.print("[red]Erro:[/red] Binário do Gemini não encontrado.")
-        return
-
-    args = [gemini_bin] + _build_gemini_args()
-    cmd_string = " ".join(map(shlex.quote, args))
-    bash_cmd = f"bash -c {shlex.quote(cmd_string)}"
+    settings = current_settings()
+    key = _cache_key(prompt, settings) if CACHE.cacheable(settings.temperature, bypass=not use_cache) else None
+    if key:
+        cached = CACHE.get(key)
+        if cached is not None:
+            console.print(f"[dim]Resposta servida do cache ({key[:12]}).[/dim]")
+            sys.stdout.write(cached + "\n")
+            return
 
     console.print(f"[cyan]Executando com o modelo [bold]{config.STATE.model}[/bold] (temp: {config.STATE.temperature})...[/cyan]")
-    
+
+    chunks: List[str] = []
     try:
-        subprocess.run(bash_cmd, input=prompt, text=True, shell=True)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        for chunk in current_backend().stream(prompt, settings):
+            chunks.append(chunk)
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+    except GenerationError as e:
         console.print(f"[red]Falha ao executar o comando do Gemini:[/red]\n{e}")
+        return
+    output = "".join(chunks).strip()
+    if key and output:
+        CACHE.put(key, output, {"model": settings.model, "temperature": settings.temperature})
+
+def benchmark_generation(prompt: str, n: int) -> List[float]:
+    """Mede a latência (em segundos) de `n` chamadas consecutivas ao backend atual."""
+    backend = current_backend()
+    settings = current_settings()
+    timings: List[float] = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        backend.generate(prompt, settings)
+        timings.append(time.perf_counter() - t0)
+    return timings
@@ -0,0 +1,272 @@
+# Recuperação densa (embeddings) sobre os trechos do índice do rag.py
+#
+# Cada trecho vira um vetor float32 normalizado, guardado numa matriz em disco
+# aberta com np.memmap (<índice>.<embedder>.f32); a tabela dense_rows do mesmo
+# SQLite liga linha da matriz -> trecho. Ids de trecho nunca se repetem
+# (AUTOINCREMENT): trecho reescrito ganha id novo, e a linha do antigo é zerada e
+# reaproveitada. Consultas são produtos matriz x vetores (várias de uma vez em
+# search_many) seguidos de argpartition para o top-k.
+#
+# Embedders (registro em EMBEDDERS):
+#   hash — padrão, sem download: palavras + n-gramas de caracteres com hashing,
+#          tf sublinear e IDF por bucket aplicado na consulta;
+#   st   — modelo local do sentence-transformers (GEMX_RAG_MODEL), captura sinônimos.
+import math
+import os
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # o modo denso é opcional
+    np = None
+
+from .rag import RagError, RagIndex, normalize_words
+
+HASH_DIM = int(os.environ.get("GEMX_RAG_HASH_DIM", "1024"))
+CHAR_NGRAMS = (3, 4, 5)
+CHAR_WEIGHT = 0.5          # peso dos n-gramas de caracteres em relação à palavra inteira
+EMBED_BATCH = 256
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+DENSE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS dense_rows(
+  embedder TEXT NOT NULL,
+  row INTEGER NOT NULL,
+  chunk_id INTEGER NOT NULL,
+  PRIMARY KEY(embedder, row)
+);
+CREATE TABLE IF NOT EXISTS dense_meta(
+  embedder TEXT PRIMARY KEY,
+  model TEXT NOT NULL,
+  dim INTEGER NOT NULL
+);
+"""
+
+
+class HashingEmbedder:
+    """Vetorizador por hashing (sem modelo): tolera flexões, acentos e erros de digitação."""
+    name = "hash"
+    uses_idf = True
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+        self._features: Dict[str, Tuple["np.ndarray", "np.ndarray"]] = {}
+
+    def _word(self, word: str):
+        feat = self._features.get(word)
+        if feat is None:
+            marked = f"<{word}>"
+            grams = ["w:" + word] + [marked[i:i + n] for n in CHAR_NGRAMS for i in range(len(marked) - n + 1)]
+            hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+            cols = np.array([h % self.dim for h in hashes], dtype=np.int64)
+            vals = np.array([(1.0 if i == 0 else CHAR_WEIGHT) * (1.0 if h & 0x80000000 else -1.0)
+                             for i, h in enumerate(hashes)], dtype=np.float64)
+            if len(self._features) > 500_000:
+                self._features.clear()
+            feat = self._features[word] = (cols, vals)
+        return feat
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            cols, vals = [], []
+            for word, tf in Counter(normalize_words(text)).items():
+                c, v = self._word(word)
+                cols.append(c)
+                vals.append(v * (1.0 + math.log(tf)))
+            if cols:
+                out[i] = np.bincount(np.concatenate(cols), weights=np.concatenate(vals), minlength=self.dim)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbedder:
+    """Modelo local de embeddings (CPU) via sentence-transformers."""
+    name = "st"
+    uses_idf = False
+
+    def __init__(self, model: Optional[str] = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RagError("embedder 'st' requer sentence-transformers (pip install sentence-transformers).") from e
+        self.model = model or os.environ.get("GEMX_RAG_MODEL", DEFAULT_MODEL)
+        self._st = SentenceTransformer(self.model, device="cpu")
+        self.dim = self._st.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        vecs = self._st.encode(list(texts), batch_size=64, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+EMBEDDERS: Dict[str, Callable[[], object]] = {
+    "hash": HashingEmbedder,
+    "st": SentenceTransformerEmbedder,
+}
+
+
+def register_embedder(name: str, factory: Callable[[], object]):
+    """Registra um embedder adicional (precisa de name, model, dim, uses_idf e embed)."""
+    EMBEDDERS[name] = factory
+
+
+def get_embedder(name: Optional[str] = None):
+    if np is None:
+        raise RagError("modo denso requer numpy (pip install numpy).")
+    name = name or os.environ.get("GEMX_RAG_EMBEDDER", "hash")
+    factory = EMBEDDERS.get(name)
+    if factory is None:
+        raise RagError(f"embedder desconhecido: '{name}'. Disponíveis: {', '.join(sorted(EMBEDDERS))}")
+    return factory()
+
+
+class DenseIndex:
+    """Matriz de embeddings (memmap) sincronizada com os trechos de um RagIndex."""
+
+    def __init__(self, index: RagIndex, embedder=None):
+        self.index = index
+        self.embedder = embedder or get_embedder()
+        base = index.db_path.with_suffix(f".{self.embedder.name}")
+        self.matrix_path = base.with_suffix(base.suffix + ".f32")
+        self.df_path = base.with_suffix(base.suffix + ".df.npy")
+        self._matrix = None          # memmap somente leitura, reaberto após sync
+        self._row_chunk = None       # linha -> id do trecho (-1 = livre)
+        self._chunk_row: Dict[int, int] = {}
+        self._df = None
+        with index._lock:
+            index._con.executescript(DENSE_SCHEMA_SQL)
+
+    # --- armazenamento ---
+
+    def _capacity(self) -> int:
+        try:
+            return os.path.getsize(self.matrix_path) // (4 * self.embedder.dim)
+        except OSError:
+            return 0
+
+    def _grow(self, rows: int):
+        """Aumenta o arquivo (x1.5) para caber `rows` linhas; o novo trecho fica zerado."""
+        cap = self._capacity()
+        if rows <= cap:
+            return
+        new_cap = max(rows, int(cap * 1.5), 1024)
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_cap * 4 * self.embedder.dim)
+
+    def _writable(self):
+        return np.memmap(self.matrix_path, dtype=np.float32, mode="r+",
+                         shape=(self._capacity(), self.embedder.dim))
+
+    def _load(self):
+        con = self.index._con
+        with self.index._lock:
+            rows = con.execute("SELECT row, chunk_id FROM dense_rows WHERE embedder = ?",
+                               (self.embedder.name,)).fetchall()
+        cap = self._capacity()
+        self._row_chunk = np.full(cap, -1, dtype=np.int64)
+        for row, chunk_id in rows:
+            self._row_chunk[row] = chunk_id
+        self._chunk_row = {c: r for r, c in rows}
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r",
+                                 shape=(cap, self.embedder.dim)) if cap else None
+        self._df = np.load(self.df_path) if self.df_path.exists() else np.zeros(self.embedder.dim)
+
+    # --- sincronização com os trechos ---
+
+    def sync(self, rebuild: bool = False) -> Dict[str, int]:
+        """Embeda trechos novos e libera as linhas de trechos removidos."""
+        con, name = self.index._con, self.embedder.name
+        with self.index._lock:
+            meta = con.execute("SELECT model, dim FROM dense_meta WHERE embedder = ?", (name,)).fetchone()
+            if rebuild or meta != (self.embedder.model, self.embedder.dim):
+                # modelo/dimensão mudou: matriz antiga não serve
+                with con:
+                    con.execute("DELETE FROM dense_rows WHERE embedder = ?", (name,))
+                    con.execute("INSERT OR REPLACE INTO dense_meta(embedder, model, dim) VALUES (?,?,?)",
+                                (name, self.embedder.model, self.embedder.dim))
+                for p in (self.matrix_path, self.df_path):
+                    if p.exists():
+                        p.unlink()
+            mapped = dict(con.execute("SELECT chunk_id, row FROM dense_rows WHERE embedder = ?", (name,)).fetchall())
+            live = {r[0] for r in con.execute("SELECT id FROM chunks")}
+        stale = [mapped[c] for c in mapped.keys() - live]
+        missing = sorted(live - mapped.keys())
+        stats = {"embedded": len(missing), "freed": len(stale)}
+        if not stale and not missing and self._matrix is not None:
+            return stats
+
+        df = np.load(self.df_path) if self.df_path.exists() else np.zeros(self.embedder.dim)
+        used = set(mapped.values()) - set(stale)
+        free = sorted(set(stale) | (set(range(self._capacity())) - used))
+        next_row = max(used, default=-1) + 1
+        assign: List[Tuple[int, int]] = []
+        for chunk_id in missing:
+            # menor linha livre primeiro; sem nenhuma, cresce a matriz
+            row = free.pop(0) if free else next_row
+            next_row = max(next_row, row + 1)
+            assign.append((row, chunk_id))
+        self._grow(next_row)
+        if not self._capacity():
+            self._load()
+            return stats
+        matrix = self._writable()
+        for row in stale:
+            df -= matrix[row] != 0
+            matrix[row] = 0
+        for start in range(0, len(assign), EMBED_BATCH):
+            batch = assign[start:start + EMBED_BATCH]
+            with self.index._lock:
+                texts = dict(con.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                    [c for _, c in batch]).fetchall())
+            vecs = self.embedder.embed([texts.get(c, "") for _, c in batch])
+            rows = [r for r, _ in batch]
+            matrix[rows] = vecs
+            df += (vecs != 0).sum(axis=0)
+        matrix.flush()
+        del matrix
+        np.save(self.df_path, np.maximum(df, 0))
+        with self.index._lock, con:
+            con.executemany("DELETE FROM dense_rows WHERE embedder = ? AND row = ?", [(name, r) for r in stale])
+            con.executemany("INSERT OR REPLACE INTO dense_rows(embedder, row, chunk_id) VALUES (?,?,?)",
+                            [(name, r, c) for r, c in assign])
+        self._load()
+        return stats
+
+    # --- consulta ---
+
+    def _queries(self, queries: Sequence[str]) -> "np.ndarray":
+        q = self.embedder.embed(queries)
+        if self.embedder.uses_idf:
+            n_docs = max(1, len(self._chunk_row))
+            q = q * (np.log((n_docs + 1) / (self._df + 1)) + 1).astype(np.float32)
+        return q
+
+    def search_many(self, queries: Sequence[str], k: int = 8) -> List[List[Tuple[int, float]]]:
+        """Top-k (id do trecho, score) para cada consulta, num único produto de matrizes."""
+        if self._matrix is None:
+            self._load()
+        if self._matrix is None or not len(self._chunk_row):
+            return [[] for _ in queries]
+        scores = self._matrix @ self._queries(queries).T          # (linhas, consultas)
+        scores[self._row_chunk < 0] = -np.inf
+        k = min(k, len(self._chunk_row))
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        results = []
+        for j in range(scores.shape[1]):
+            rows = top[:, j][np.argsort(-scores[top[:, j], j])]
+            results.append([(int(self._row_chunk[r]), float(scores[r, j])) for r in rows])
+        return results
+
+    def scores_for(self, query: str, chunk_ids: Sequence[int]) -> Dict[int, float]:
+        """Score denso de trechos específicos (usado pela busca híbrida)."""
+        if self._matrix is None:
+            self._load()
+        rows = [(c, self._chunk_row[c]) for c in chunk_ids if c in self._chunk_row]
+        if not rows or self._matrix is None:
+            return {}
+        vals = self._matrix[[r for _, r in rows]] @ self._queries([query])[0]
+        return {c: float(v) for (c, _), v in zip(rows, vals)}
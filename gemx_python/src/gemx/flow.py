@@ -0,0 +1,518 @@
+# Motor de flows (flows/*.yml) — substitui o flow-run.sh
+#
+# O YAML é parseado uma única vez; cada passo roda no mesmo processo, a saída
+# fica em memória (variáveis `${nome}` via `save_as`) e o tempo de cada passo
+# é registrado. Tipos de passo: rag, gen, obsidian (registro em STEP_TYPES).
+#
+# Passos com `needs:` formam um DAG: passos independentes rodam em paralelo
+# (limite em `parallel`). Sem nenhum `needs:` no arquivo, o flow é sequencial
+# como antes. Saídas de rag/gen são memoizadas pelo hash das entradas.
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import config
+from . import core
+from . import rag
+from .backends import GenerationSettings
+from .cache import CACHE_DIR, ResponseCache
+
+# Memo das saídas de passos (mesmo formato do cache de respostas, outro diretório)
+MEMO = ResponseCache(root=Path(os.environ.get("GEMX_FLOW_MEMO_DIR") or CACHE_DIR.parent / "flow-memo"))
+# Tipos de passo sem efeitos colaterais, cuja saída pode ser reaproveitada
+MEMO_STEPS = {"rag", "gen"}
+# Logs de auditoria do gemx.sh ($GEMX_HOME/logs), gravados também pelos passos gen
+AUDIT_DIR = Path(os.environ.get("GEMX_HOME") or Path.home() / ".config" / "gemx") / "logs"
+# Passos simultâneos por padrão (gemx flow run --parallel)
+DEFAULT_PARALLEL = int(os.environ.get("GEMX_FLOW_PARALLEL", "4"))
+
+
+class FlowError(RuntimeError):
+    """Flow inválido ou passo que falhou."""
+
+
+@dataclass
+class FlowStep:
+    """Um passo do flow, como declarado no YAML."""
+    name: str
+    run: str
+    args: Dict[str, Any] = field(default_factory=dict)
+    prompt: str = ""
+    title: str = ""
+    save_as: str = ""
+    from_last: bool = False
+    id: str = ""
+    needs: List[str] = field(default_factory=list)
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def output_key(self) -> str:
+        """Variável que recebe a saída (rag sem save_as alimenta ${ctx})."""
+        return self.save_as or ("ctx" if self.run == "rag" else "")
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], index: int) -> "FlowStep":
+        if not isinstance(d, dict) or not d.get("run"):
+            raise FlowError(f"Passo {index + 1}: campo 'run' obrigatório.")
+        needs = d.get("needs") or []
+        if isinstance(needs, str):
+            needs = [needs]
+        name = str(d.get("name") or f"step{index + 1}")
+        return cls(
+            name=name,
+            run=str(d["run"]),
+            args=dict(d.get("args") or {}),
+            prompt=str(d.get("prompt") or ""),
+            title=str(d.get("title") or ""),
+            save_as=str(d.get("save_as") or ""),
+            from_last=bool(d.get("from_last", False)),
+            id=str(d.get("id") or d.get("save_as") or name),
+            needs=[str(n) for n in needs],
+            raw=d,
+        )
+
+
+@dataclass
+class StepResult:
+    name: str
+    run: str
+    output: str = ""
+    seconds: float = 0.0
+    ok: bool = True
+    error: str = ""
+    cached: bool = False
+    skipped: bool = False
+
+
+@dataclass
+class FlowResult:
+    path: str
+    steps: List[StepResult] = field(default_factory=list)
+    seconds: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+    critical_seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(s.ok for s in self.steps)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "flow": self.path,
+            "ok": self.ok,
+            "seconds": round(self.seconds, 3),
+            "critical_path": self.critical_path,
+            "critical_seconds": round(self.critical_seconds, 3),
+            "steps": [
+                {"name": s.name, "run": s.run, "ok": s.ok, "seconds": round(s.seconds, 3),
+                 "cached": s.cached, "skipped": s.skipped,
+                 "error": s.error, "output_bytes": len(s.output.encode("utf-8"))}
+                for s in self.steps
+            ],
+        }
+
+
+class FlowContext:
+    """Variáveis do flow: `${nome}` é substituído pelo valor salvo com `save_as`."""
+    _VAR = re.compile(r"\$\{(\w+)\}")
+
+    def __init__(self, variables: Optional[Dict[str, str]] = None, use_cache: bool = True):
+        self.vars: Dict[str, str] = dict(variables or {})
+        self.last = ""
+        self.use_cache = use_cache
+
+    def for_step(self, last: str) -> "FlowContext":
+        """Visão para um passo: compartilha as variáveis, com a própria saída anterior."""
+        child = FlowContext(use_cache=self.use_cache)
+        child.vars = self.vars
+        child.last = last
+        return child
+
+    @classmethod
+    def references(cls, step: "FlowStep") -> List[str]:
+        """Variáveis `${nome}` usadas pelo passo (prompt, title e args)."""
+        texts = [step.prompt, step.title] + [v for v in step.args.values() if isinstance(v, str)]
+        return [m.group(1) for t in texts for m in cls._VAR.finditer(t)]
+
+    def render(self, text: str) -> str:
+        return self._VAR.sub(lambda m: self.vars.get(m.group(1), ""), text)
+
+    def render_args(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: self.render(v) if isinstance(v, str) else v for k, v in args.items()}
+
+
+def load_flow(path: str) -> List[FlowStep]:
+    """Lê o flow (YAML ou JSON) e retorna os passos."""
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".json"):
+        data = json.loads(text)
+    else:
+        try:
+            import yaml
+        except ImportError as e:
+            raise FlowError("PyYAML não instalado (pip install pyyaml).") from e
+        data = yaml.safe_load(text)
+    steps = (data or {}).get("steps") or []
+    if not isinstance(steps, list):
+        raise FlowError("'steps' deve ser uma lista.")
+    return [FlowStep.from_dict(d, i) for i, d in enumerate(steps)]
+
+
+def plan_flow(steps: List[FlowStep]) -> List[List[int]]:
+    """Dependências (índices) de cada passo.
+
+    Sem nenhum `needs:` no flow, cada passo depende do anterior (execução sequencial).
+    Com `needs:` (ids ou nomes), o uso de `${var}` gravada por outro passo também
+    conta como dependência. Valida ids, referências e ciclos.
+    """
+    if not any(s.needs for s in steps):
+        return [[i - 1] if i else [] for i in range(len(steps))]
+    index: Dict[str, int] = {}
+    for i, s in enumerate(steps):
+        if s.id in index:
+            raise FlowError(f"id duplicado: '{s.id}' (use 'id:' para diferenciar os passos).")
+        index[s.id] = i
+    for i, s in enumerate(steps):
+        index.setdefault(s.name, i)
+    producers: Dict[str, int] = {}
+    for i, s in enumerate(steps):
+        key = s.output_key
+        if key in producers:
+            raise FlowError(f"'{steps[producers[key]].name}' e '{s.name}' gravam ${{{key}}}; use save_as distintos.")
+        if key:
+            producers[key] = i
+    deps: List[List[int]] = []
+    for i, s in enumerate(steps):
+        d: List[int] = []
+        for n in s.needs:
+            if n not in index:
+                raise FlowError(f"{s.name}: needs '{n}' não corresponde a nenhum passo.")
+            if index[n] not in d:
+                d.append(index[n])
+        for var in FlowContext.references(s):
+            j = producers.get(var)
+            if j is not None and j != i and j not in d:
+                d.append(j)
+        if i in d:
+            raise FlowError(f"{s.name}: o passo depende de si mesmo.")
+        deps.append(d)
+    # Kahn: o que sobrar sem ordem está em um ciclo
+    indegree = [len(d) for d in deps]
+    ready = [i for i, n in enumerate(indegree) if n == 0]
+    seen = 0
+    while ready:
+        j = ready.pop()
+        seen += 1
+        for i, d in enumerate(deps):
+            if j in d:
+                indegree[i] -= 1
+                if indegree[i] == 0:
+                    ready.append(i)
+    if seen < len(steps):
+        cycle = [steps[i].name for i, n in enumerate(indegree) if n > 0]
+        raise FlowError(f"ciclo em needs: {', '.join(cycle)}")
+    return deps
+
+
+# --- Tipos de passo ---
+
+def _rag_search(kb: str, query: str) -> str:
+    """Mesma busca do plugins.d/rag.sh: ripgrep se disponível, senão varredura em Python."""
+    rg = shutil.which("rg")
+    if rg:
+        result = subprocess.run(
+            [rg, "-n", "--no-heading", "--color=never", "-S", "--glob", "!*{.git,.cache,node_modules}/*", query, kb],
+            capture_output=True, text=True,
+        )
+        return result.stdout
+    # smart case como o `rg -S`: só diferencia maiúsculas se a consulta tiver alguma
+    flags = 0 if query != query.lower() else re.IGNORECASE
+    pattern = re.compile(re.escape(query), flags)
+    lines: List[str] = []
+    for root, dirs, files in os.walk(kb):
+        dirs[:] = sorted(d for d in dirs if d not in (".git", ".cache", "node_modules"))
+        for name in sorted(files):
+            p = os.path.join(root, name)
+            try:
+                with open(p, "r", encoding="utf-8", errors="ignore") as f:
+                    for n, line in enumerate(f, 1):
+                        if pattern.search(line):
+                            lines.append(f"{p}:{n}:{line.rstrip()}")
+            except OSError:
+                continue
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def step_rag(step: FlowStep, ctx: FlowContext) -> str:
+    """Contexto do kb pelo índice do rag.py (`mode`: bm25, dense ou hybrid); `mode: grep` mantém a busca do rag.sh."""
+    args = ctx.render_args(step.args)
+    query = str(args.get("query", ""))
+    if not query:
+        raise FlowError("rag: 'args.query' vazio.")
+    kb = str(args.get("kb", "./kb"))
+    limit = int(args.get("max_bytes", 16000))
+    if args.get("mode", "bm25") == "grep":
+        data = _rag_search(kb, query).encode("utf-8")
+        return data[:limit].decode("utf-8", errors="ignore")
+    try:
+        return rag.retrieve(kb, query, k=int(args.get("k", 8)), max_bytes=limit,
+                            max_tokens=int(args.get("max_tokens", 0)) or None,
+                            mode=str(args.get("mode", "bm25")), alpha=float(args.get("alpha", rag.HYBRID_ALPHA)))
+    except (rag.RagError, sqlite3.Error) as e:
+        raise FlowError(f"rag: {e}") from e
+
+
+def _gen_settings() -> GenerationSettings:
+    """Settings do passo gen: estado global, com GEMX_FORCE_MODEL valendo como no gemx.sh."""
+    settings = core.current_settings()
+    force = os.environ.get("GEMX_FORCE_MODEL", "")
+    if force and force != settings.model:
+        settings = GenerationSettings(model=force, temperature=settings.temperature, system=settings.system)
+    return settings
+
+
+def _audit_log(event: str, settings: GenerationSettings, prompt: str, run_id: str):
+    """Mesmo registro do audit_log do gemx.sh (plugins.audit_log_jsonl), em audit-YYYYMMDD.jsonl."""
+    if not config.STATE.plugins.get("audit_log_jsonl"):
+        return
+    backend = core.current_backend()
+    argv = ["generate", "--model", settings.model, "--temperature", str(settings.temperature), "--prompt", prompt]
+    if settings.system:
+        argv.extend(["--system", settings.system])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    record = {
+        "ts": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "event": event,
+        "wd": os.getcwd(),
+        "bin": getattr(backend, "binary", None) or backend.name,
+        "model": settings.model,
+        "argv": argv,
+        "run": run_id,
+    }
+    try:
+        AUDIT_DIR.mkdir(parents=True, exist_ok=True)
+        with open(AUDIT_DIR / f"audit-{now:%Y%m%d}.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+    except OSError:
+        pass  # auditoria não derruba o passo
+
+
+def step_gen(step: FlowStep, ctx: FlowContext) -> str:
+    prompt = ctx.render(step.prompt or str(step.args.get("prompt", "")))
+    if not prompt.strip():
+        raise FlowError("gen: 'prompt' vazio.")
+    settings = _gen_settings()
+    # run id no formato do gemx.sh: liga start/finish da mesma execução
+    run_id = f"{int(time.time())}-{os.getpid()}-{random.randrange(32768)}"
+    _audit_log("start", settings, prompt, run_id)
+    try:
+        # get_generation usa o backend/cache do processo e já reporta GenerationError
+        output = core.get_generation(prompt, use_cache=ctx.use_cache, settings=settings)
+    finally:
+        _audit_log("finish", settings, prompt, run_id)
+    if not output:
+        raise FlowError("gen: resposta vazia.")
+    return output
+
+
+def _obsidian_vault() -> str:
+    vault = os.environ.get("OBSIDIAN_VAULT", "")
+    if vault:
+        return vault
+    # mesma configuração do others.json (integrations.obsidian_vault)
+    from .others import OTHERS_PATH
+    try:
+        data = json.loads(OTHERS_PATH.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return ""
+    for item in data.get("integrations", []):
+        if item.get("key") == "obsidian_vault":
+            return item.get("value", "")
+    return ""
+
+
+def step_obsidian(step: FlowStep, ctx: FlowContext) -> str:
+    vault = _obsidian_vault()
+    if not vault:
+        raise FlowError("obsidian: defina OBSIDIAN_VAULT ou integrations.obsidian_vault no others.json.")
+    title = ctx.render(step.title or "Gemx Note")
+    content = ctx.last if step.from_last or "content" not in step.args else ctx.render(str(step.args["content"]))
+    ts = datetime.datetime.now().astimezone().isoformat(timespec="seconds").replace(":", "-")
+    path = Path(vault) / f"{ts} {title}.md"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(f"# {title}\n\n{content}\n", encoding="utf-8")
+    return str(path)
+
+
+STEP_TYPES: Dict[str, Callable[[FlowStep, FlowContext], str]] = {
+    "rag": step_rag,
+    "gen": step_gen,
+    "obsidian": step_obsidian,
+}
+
+
+def register_step(run: str, handler: Callable[[FlowStep, FlowContext], str]):
+    """Registra um tipo de passo adicional (ex.: plugins)."""
+    STEP_TYPES[run] = handler
+
+
+def _kb_fingerprint(kb: str) -> Tuple[int, int, int]:
+    """(arquivos, bytes, mtime mais recente) da base; muda quando algum arquivo muda."""
+    count = size = newest = 0
+    for root, dirs, files in os.walk(kb):
+        dirs[:] = [d for d in dirs if d not in (".git", ".cache", "node_modules")]
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            count += 1
+            size += st.st_size
+            newest = max(newest, st.st_mtime_ns)
+    return count, size, newest
+
+
+def _memo_key(step: FlowStep, ctx: FlowContext) -> Optional[str]:
+    """Hash das entradas já resolvidas do passo; None se o tipo não é memoizável."""
+    if step.run not in MEMO_STEPS:
+        return None
+    args = ctx.render_args(step.args)
+    payload: List[Any] = [step.run, ctx.render(step.prompt), ctx.render(step.title), args,
+                          ctx.last if step.from_last else ""]
+    if step.run == "gen":
+        settings = _gen_settings()
+        payload.append([core.current_backend().cache_id, settings.model, settings.temperature, settings.system])
+    elif step.run == "rag":
+        payload.append(_kb_fingerprint(str(args.get("kb", "./kb"))))
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def run_step(step: FlowStep, ctx: FlowContext) -> StepResult:
+    """Executa um passo (ou reaproveita a saída memoizada) e atualiza o contexto."""
+    handler = STEP_TYPES.get(step.run)
+    result = StepResult(name=step.name, run=step.run)
+    t0 = time.perf_counter()
+    try:
+        if handler is None:
+            raise FlowError(f"tipo de passo desconhecido: '{step.run}'")
+        # mesma regra do cache de respostas: GEMX_CACHE=0 ou temperatura alta não memoizam
+        temperature = _gen_settings().temperature if step.run == "gen" else 0.0
+        key = None
+        if step.run in MEMO_STEPS and MEMO.cacheable(temperature, bypass=not ctx.use_cache):
+            key = _memo_key(step, ctx)
+        cached = MEMO.get(key) if key else None
+        if cached is not None:
+            result.output, result.cached = cached, True
+        else:
+            result.output = handler(step, ctx)
+            if key:
+                MEMO.put(key, result.output, {"step": step.name, "run": step.run})
+    except (FlowError, OSError) as e:
+        result.ok = False
+        result.error = str(e)
+    except Exception as e:  # args inválidos, handlers de plugins etc.: o passo falha, o flow segue
+        result.ok = False
+        result.error = f"{step.run}: {type(e).__name__}: {e}"
+    result.seconds = time.perf_counter() - t0
+    if result.ok:
+        if step.output_key:
+            ctx.vars[step.output_key] = result.output
+        if step.run != "obsidian":
+            ctx.last = result.output
+    return result
+
+
+def critical_path(steps: List[FlowStep], deps: List[List[int]],
+                  results: Dict[int, StepResult]) -> Tuple[List[str], float]:
+    """Cadeia de dependências mais longa (soma dos tempos dos passos executados)."""
+    finish: Dict[int, Tuple[float, Optional[int]]] = {}
+
+    def visit(i: int) -> float:
+        if i not in finish:
+            prev = max(((visit(d), d) for d in deps[i] if d in results), default=(0.0, None))
+            finish[i] = (prev[0] + results[i].seconds, prev[1])
+        return finish[i][0]
+
+    end = max(results, key=visit, default=None)
+    path: List[str] = []
+    node = end
+    while node is not None:
+        path.append(steps[node].name)
+        node = finish[node][1]
+    return path[::-1], finish[end][0] if end is not None else 0.0
+
+
+def run_flow(path: str, variables: Optional[Dict[str, str]] = None, use_cache: bool = True,
+             keep_going: bool = False, on_step: Optional[Callable[[FlowStep, StepResult], None]] = None,
+             parallel: Optional[int] = None) -> FlowResult:
+    """Executa o flow respeitando as dependências, com até `parallel` passos simultâneos.
+
+    Para de agendar no primeiro erro (os passos em andamento terminam), a menos que
+    keep_going; nesse caso os dependentes (via `needs:`) de um passo com erro são pulados
+    e, sem nenhum `needs:`, os passos seguintes rodam normalmente.
+    """
+    steps = load_flow(path)
+    deps = plan_flow(steps)
+    sequential = not any(s.needs for s in steps)
+    parallel = max(1, parallel or DEFAULT_PARALLEL)
+    ctx = FlowContext(variables, use_cache=use_cache)
+    results: Dict[int, StepResult] = {}
+    # saída "anterior" (from_last) que cada passo repassa aos dependentes
+    lasts: Dict[int, str] = {}
+    pending = list(range(len(steps)))
+    running: Dict[Any, int] = {}
+    failed = False
+
+    def inherited(i: int) -> str:
+        return lasts.get(deps[i][-1], "") if deps[i] else ""
+
+    def finish(i: int, result: StepResult):
+        nonlocal failed
+        results[i] = result
+        lasts[i] = result.output if result.ok and steps[i].run != "obsidian" else inherited(i)
+        failed = failed or not result.ok
+        if on_step:
+            on_step(steps[i], result)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        while pending or running:
+            if not failed or keep_going:
+                for i in list(pending):
+                    if len(running) >= parallel:
+                        break
+                    if any(d not in results for d in deps[i]):
+                        continue
+                    pending.remove(i)
+                    # no modo sequencial implícito a aresta só dá a ordem: com keep_going o
+                    # passo seguinte roda mesmo após uma falha (como o `|| true` do flow-run.sh)
+                    broken = [] if sequential else [steps[d].name for d in deps[i] if not results[d].ok]
+                    if broken:
+                        finish(i, StepResult(name=steps[i].name, run=steps[i].run, ok=False, skipped=True,
+                                             error=f"dependência falhou: {', '.join(broken)}"))
+                        continue
+                    running[pool.submit(run_step, steps[i], ctx.for_step(inherited(i)))] = i
+            if not running:
+                if failed and not keep_going:
+                    break
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in sorted(done, key=running.__getitem__):
+                finish(running.pop(fut), fut.result())
+
+    flow = FlowResult(path=path, steps=[results[i] for i in sorted(results)])
+    flow.seconds = time.perf_counter() - t0
+    flow.critical_path, flow.critical_seconds = critical_path(steps, deps, results)
+    return flow
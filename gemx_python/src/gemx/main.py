@@ -1,4 +1,7 @@
+import atexit
+import os
 import subprocess
+import time
 import typer
 from rich.console import Console
 from typing_extensions import Annotated
@@ -8,6 +11,9 @@ import shlex
 from . import config
 from . import others
 from . import core
+from . import flow
+from . import rag
+from .backends import GenerationError, close_backends
 
 # --- App Setup ---
 app = typer.Typer(help="O sucessor do gemx.sh, em Python.")
@@ -16,6 +22,12 @@ console = Console()
 profile_app = typer.Typer(name="profile", help="Gerencia os perfis de configuração.")
 app.add_typer(profile_app)
 
+flow_app = typer.Typer(name="flow", help="Executa pipelines multi-etapas (flows/*.yml).")
+app.add_typer(flow_app)
+
+rag_app = typer.Typer(name="rag", help="Índice BM25 local sobre um diretório de conhecimento (kb).")
+app.add_typer(rag_app)
+
 # --- Automation Constants ---
 META_PROMPT_TEMPLATE = """
 Você é um especialista em automação de sistemas e ecossistemas Apple (macOS, iOS/iPadOS via Atalhos). Sua tarefa é gerar um plano de automação para o objetivo do usuário.
@@ -76,9 +88,32 @@ def setup():
         console.print(f"  [cyan]↳ Modelo padrão no estado:[/cyan] [bold]{config.STATE.model}[/bold]")
 
 @app.command()
-def gen(prompt: Annotated[str, typer.Argument(help="O prompt para o modelo.")]):
+def gen(
+    prompt: Annotated[str, typer.Argument(help="O prompt para o modelo.")],
+    no_cache: Annotated[bool, typer.Option("--no-cache", help="Ignora o cache de respostas.")] = False,
+):
     """Gera uma resposta a partir de um prompt usando as configurações atuais."""
-    core.run_generation(prompt)
+    core.run_generation(prompt, use_cache=not no_cache)
+
+@app.command()
+def bench(
+    prompt: Annotated[str, typer.Argument(help="O prompt usado em cada chamada.")] = "ping",
+    n: Annotated[int, typer.Option("-n", min=1, help="Número de chamadas.")] = 20,
+    backend: Annotated[str, typer.Option("--backend", help="Backend a medir (cli, http, fake).")] = "",
+):
+    """Mede a latência por chamada do backend de geração (use --backend fake para medir sem rede)."""
+    if backend:
+        config.STATE.backend = backend
+    try:
+        timings = core.benchmark_generation(prompt, n)
+    except GenerationError as e:
+        console.print(f"[red]Erro:[/red] {e}")
+        raise typer.Exit(1)
+    ordered = sorted(timings)
+    console.print(f"[cyan]Backend:[/cyan] [bold]{config.STATE.backend}[/bold]  [cyan]chamadas:[/cyan] {n}")
+    console.print(f"  [cyan]↳ média:[/cyan] {sum(timings) / len(timings) * 1000:.2f} ms")
+    console.print(f"  [cyan]↳ mediana:[/cyan] {ordered[len(ordered) // 2] * 1000:.2f} ms")
+    console.print(f"  [cyan]↳ máx:[/cyan] {ordered[-1] * 1000:.2f} ms")
 
 @app.command(name="gen-auto")
 def gen_auto(prompt: Annotated[str, typer.Option("--prompt", help="A descrição da automação a ser gerada.")]):
@@ -156,11 +191,145 @@ def apply(profile_name: str):
     console.print(f"  [cyan]↳ Temperatura no estado:[/cyan] {config.STATE.temperature}")
     console.print(f"  [cyan]↳ System prompt no estado:[/cyan] '{config.STATE.system}'")
 
+@flow_app.command("run")
+def flow_run(
+    path: Annotated[str, typer.Argument(help="Arquivo do flow (YAML ou JSON).")] = "flows/flow_example.yml",
+    var: Annotated[list[str], typer.Option("--var", help="Variável inicial nome=valor (repetível).")] = [],
+    no_cache: Annotated[bool, typer.Option("--no-cache", help="Ignora o cache de respostas e o memo dos passos.")] = False,
+    keep_going: Annotated[bool, typer.Option("--keep-going", help="Continua após um passo com erro.")] = False,
+    parallel: Annotated[int, typer.Option("--parallel", "-j", help="Passos independentes simultâneos (0 = GEMX_FLOW_PARALLEL).")] = 0,
+    as_json: Annotated[bool, typer.Option("--json", help="Imprime o resultado (tempos por passo) em JSON.")] = False,
+):
+    """Executa um flow no próprio processo (passos com `needs:` em paralelo), registrando o tempo de cada passo."""
+    variables = dict(v.split("=", 1) for v in var if "=" in v)
+
+    def on_step(step, result):
+        if as_json:
+            return
+        mark = "[green]✓[/green]" if result.ok else ("[yellow]-[/yellow]" if result.skipped else "[red]✗[/red]")
+        note = " (memo)" if result.cached else ""
+        console.print(f"[FLOW] {mark} {step.name} ({step.run}) [dim]{result.seconds:.2f}s{note}[/dim]")
+        if not result.ok:
+            console.print(f"  [red]↳ {result.error}[/red]")
+        elif step.run == "gen":
+            console.print(result.output, markup=False, highlight=False)
+
+    try:
+        result = flow.run_flow(path, variables, use_cache=not no_cache, keep_going=keep_going,
+                               on_step=on_step, parallel=parallel or None)
+    except (flow.FlowError, OSError) as e:
+        console.print(f"[red]Erro:[/red] {e}")
+        raise typer.Exit(1)
+    if as_json:
+        print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        console.print(f"[FLOW] pipeline concluído em {result.seconds:.2f}s")
+        console.print(f"[FLOW] caminho crítico ({result.critical_seconds:.2f}s): {' → '.join(result.critical_path)}")
+    if not result.ok:
+        raise typer.Exit(1)
+
+@rag_app.command("index")
+def rag_index(
+    kb: Annotated[str, typer.Argument(help="Diretório da base de conhecimento.")] = "./kb",
+    rebuild: Annotated[bool, typer.Option("--rebuild", help="Reindexa tudo do zero.")] = False,
+    dense: Annotated[bool, typer.Option("--dense", help="Também calcula os embeddings (modos dense/hybrid).")] = False,
+    embedder: Annotated[str, typer.Option("--embedder", help="hash (padrão, sem download) ou st (sentence-transformers).")] = "",
+):
+    """Cria/atualiza o índice do kb (só arquivos novos ou alterados)."""
+    try:
+        index = rag.RagIndex(kb)
+        st = index.update(rebuild=rebuild)
+        info = index.stats()
+        console.print(f"[green]✓[/green] {kb}: +{st['added']} ~{st['updated']} -{st['removed']} arquivos, "
+                      f"{st['chunks']} trechos indexados em {st['ms']} ms")
+        console.print(f"  [cyan]↳ Índice:[/cyan] {index.db_path} ({info['files']} arquivos, {info['chunks']} trechos)")
+        if dense:
+            t0 = time.perf_counter()
+            dense_index = index.dense(embedder or None)
+            if rebuild:
+                dense_index.sync(rebuild=True)
+            console.print(f"  [cyan]↳ Embeddings ({dense_index.embedder.model}):[/cyan] {dense_index.matrix_path} "
+                          f"em {(time.perf_counter() - t0) * 1000:.0f} ms")
+    except rag.RagError as e:
+        console.print(f"[red]Erro:[/red] {e}")
+        raise typer.Exit(1)
+
+@rag_app.command("search")
+def rag_search(
+    kb: Annotated[str, typer.Argument(help="Diretório da base de conhecimento.")],
+    query: Annotated[str, typer.Argument(help="Consulta.")],
+    k: Annotated[int, typer.Option("-k", help="Número máximo de trechos.")] = 8,
+    max_bytes: Annotated[int, typer.Option("--max-bytes", help="Orçamento de bytes do contexto.")] = 16000,
+    max_tokens: Annotated[int, typer.Option("--max-tokens", help="Orçamento aproximado em tokens (0 = só bytes).")] = 0,
+    mode: Annotated[str, typer.Option("--mode", help="bm25, dense ou hybrid.")] = "bm25",
+    alpha: Annotated[float, typer.Option("--alpha", help="Peso do BM25 no modo hybrid (0..1).")] = rag.HYBRID_ALPHA,
+    no_update: Annotated[bool, typer.Option("--no-update", help="Não verifica arquivos alterados antes da busca.")] = False,
+    as_json: Annotated[bool, typer.Option("--json", help="Lista os trechos com score em JSON.")] = False,
+):
+    """Busca no kb e imprime os trechos mais relevantes dentro do orçamento."""
+    try:
+        index = rag.RagIndex(kb)
+        if not no_update:
+            index.update()
+        chunks = index.search(query, k, mode=mode, alpha=alpha)
+    except rag.RagError as e:
+        console.print(f"[red]Erro:[/red] {e}")
+        raise typer.Exit(1)
+    if as_json:
+        print(json.dumps([c.__dict__ for c in chunks], ensure_ascii=False, indent=2))
+    else:
+        print(rag.assemble(chunks, rag.budget_bytes(max_bytes, max_tokens)), end="")
+
+@rag_app.command("bench")
+def rag_bench(
+    docs: Annotated[int, typer.Option("--docs", help="Documentos no corpus sintético.")] = 2000,
+    queries: Annotated[int, typer.Option("--queries", help="Consultas (cada uma tem um trecho-alvo conhecido).")] = 200,
+    k: Annotated[int, typer.Option("-k", help="Recall@k.")] = 5,
+    embedder: Annotated[str, typer.Option("--embedder", help="Embedder dos modos dense/hybrid.")] = "",
+    seed: Annotated[int, typer.Option("--seed")] = 42,
+):
+    """Recall@k e latência de bm25/dense/hybrid num corpus sintético com consultas parafraseadas."""
+    import tempfile
+    with tempfile.TemporaryDirectory(prefix="gemx-rag-bench-") as tmp:
+        kb = os.path.join(tmp, "kb")
+        cases = rag.synthetic_corpus(kb, docs, queries, seed)
+        try:
+            index = rag.RagIndex(kb, db_path=os.path.join(tmp, "index.db"))
+            t0 = time.perf_counter()
+            index.update()
+            t_index = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            index.dense(embedder or None)
+            t_dense = time.perf_counter() - t0
+        except rag.RagError as e:
+            console.print(f"[red]Erro:[/red] {e}")
+            raise typer.Exit(1)
+        info = index.stats()
+        console.print(f"[cyan]Corpus:[/cyan] {docs} docs, {info['chunks']} trechos | índice BM25 {t_index:.2f}s, "
+                      f"embeddings {t_dense:.2f}s | {len(cases)} consultas, recall@{k}")
+        for mode in rag.SEARCH_MODES:
+            hits, timings = 0, []
+            for query, target in cases:
+                t0 = time.perf_counter()
+                found = index.search(query, k, mode=mode)
+                timings.append(time.perf_counter() - t0)
+                hits += any(c.path == target for c in found)
+            timings.sort()
+            console.print(f"  [bold]{mode:<6}[/bold] recall@{k}={hits / len(cases):.3f}  "
+                          f"p50={timings[len(timings) // 2] * 1000:.2f} ms  p95={timings[int(len(timings) * 0.95)] * 1000:.2f} ms")
+        dense_index = index.dense(embedder or None)
+        t0 = time.perf_counter()
+        dense_index.search_many([q for q, _ in cases], k)
+        console.print(f"  [bold]lote[/bold]   dense com {len(cases)} consultas num produto de matrizes: "
+                      f"{(time.perf_counter() - t0) * 1000 / len(cases):.3f} ms/consulta")
+        index.close()
+
 # --- Inicialização ---
 @app.callback()
 def main_callback():
     """Carrega a configuração inicial antes de executar qualquer comando."""
     config.load_and_init_state()
+    atexit.register(close_backends)
 
 if __name__ == "__main__":
     app()
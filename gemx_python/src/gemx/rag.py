@@ -0,0 +1,368 @@
+# Índice de recuperação local (RAG) sobre um diretório de conhecimento (kb)
+#
+# Os arquivos de texto do kb são divididos em trechos (parágrafos agrupados) e
+# indexados em um índice invertido BM25 (SQLite FTS5, sem acentos/maiúsculas),
+# persistido em ~/.config/gemx/rag/<hash do kb>.db. A atualização é incremental:
+# só arquivos com mtime/tamanho diferentes são reindexados. A busca devolve os
+# top-k trechos por relevância, cortados em um orçamento de bytes.
+#
+# Modos de busca: bm25 (padrão), dense (embeddings, ver dense.py; requer numpy)
+# e hybrid (combinação das duas pontuações normalizadas, peso `alpha` no BM25).
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+from .cache import CACHE_DIR
+
+if TYPE_CHECKING:
+    from .dense import DenseIndex
+
+RAG_DIR = Path(os.environ.get("GEMX_RAG_DIR") or CACHE_DIR.parent / "rag")
+SKIP_DIRS = {".git", ".cache", "node_modules", "__pycache__"}
+MAX_FILE_BYTES = 4 * 1024 * 1024
+CHUNK_MIN = 400       # caracteres: fecha o trecho no próximo parágrafo
+CHUNK_MAX = 1600      # caracteres: fecha o trecho mesmo no meio do parágrafo
+BYTES_PER_TOKEN = 4   # estimativa para o orçamento em tokens
+# Pesos do bm25 por coluna (texto, caminho)
+BM25_WEIGHTS = (1.0, 0.3)
+SEARCH_MODES = ("bm25", "dense", "hybrid")
+HYBRID_ALPHA = 0.5
+HYBRID_POOL = 50      # candidatos de cada lado na busca híbrida
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS files(
+  path TEXT PRIMARY KEY,
+  mtime_ns INTEGER NOT NULL,
+  size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks(
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  path TEXT NOT NULL,
+  start_line INTEGER NOT NULL,
+  end_line INTEGER NOT NULL,
+  text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+  text, path, content='chunks', content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+  INSERT INTO chunks_fts(rowid, text, path) VALUES (new.id, new.text, new.path);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+  INSERT INTO chunks_fts(chunks_fts, rowid, text, path) VALUES ('delete', old.id, old.text, old.path);
+END;
+"""
+
+SEARCH_SQL = f"""
+SELECT rowid, bm25(chunks_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS score
+FROM chunks_fts
+WHERE chunks_fts MATCH ?
+ORDER BY score
+LIMIT ?
+"""
+
+
+class RagError(RuntimeError):
+    """kb inexistente ou índice inválido."""
+
+
+@dataclass
+class Chunk:
+    path: str
+    start_line: int
+    end_line: int
+    text: str
+    score: float = 0.0
+
+    def render(self) -> str:
+        return f"[{self.path}:{self.start_line}-{self.end_line}]\n{self.text}\n"
+
+
+def normalize_words(text: str) -> List[str]:
+    """Palavras sem acento e em minúsculas (mesma regra do tokenizer do FTS)."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return [w for w in re.findall(r"\w+", folded) if len(w) > 1]
+
+
+def chunk_text(text: str) -> Iterator[Tuple[int, int, str]]:
+    """Divide o texto em (linha inicial, linha final, trecho), respeitando parágrafos."""
+    buf: List[str] = []
+    size = 0
+    start = 1
+    for n, line in enumerate(text.splitlines(), 1):
+        if not buf:
+            if not line.strip():
+                continue
+            start = n
+        buf.append(line)
+        size += len(line) + 1
+        if (not line.strip() and size >= CHUNK_MIN) or size >= CHUNK_MAX:
+            yield start, n, "\n".join(buf).strip()
+            buf, size = [], 0
+    if buf and "".join(buf).strip():
+        yield start, start + len(buf) - 1, "\n".join(buf).strip()
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_FILE_BYTES or b"\x00" in data[:8192]:
+        return None  # binário ou grande demais
+    return data.decode("utf-8", errors="ignore")
+
+
+def index_path_for(kb: str) -> Path:
+    root = os.path.realpath(kb)
+    return RAG_DIR / f"{hashlib.sha1(root.encode('utf-8')).hexdigest()[:16]}.db"
+
+
+class RagIndex:
+    """Índice BM25 persistente de um diretório kb."""
+
+    def __init__(self, kb: str, db_path: Optional[Path] = None):
+        if not os.path.isdir(kb):
+            raise RagError(f"kb não encontrado: {kb}")
+        self.kb = kb
+        self.db_path = Path(db_path or index_path_for(kb))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._con.executescript(SCHEMA_SQL)
+        self._lock = threading.Lock()
+        self._dense: Dict[str, "DenseIndex"] = {}
+        self._changed = True  # trechos mudaram desde a última sincronização dos embeddings
+
+    def close(self):
+        self._con.close()
+
+    def _migrate(self):
+        """Índices antigos (ids de trecho reaproveitáveis) são descartados e refeitos do zero.
+
+        Sem AUTOINCREMENT o SQLite reusa o maior id após um DELETE, e os embeddings
+        (dense_rows: linha -> id do trecho) ficariam apontando para o texto novo.
+        """
+        row = self._con.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chunks'").fetchone()
+        if row is None or "AUTOINCREMENT" in row[0].upper():
+            return
+        self._con.executescript("""
+        DROP TABLE IF EXISTS chunks_fts;
+        DROP TABLE IF EXISTS chunks;
+        DROP TABLE IF EXISTS files;
+        DROP TABLE IF EXISTS dense_rows;
+        DROP TABLE IF EXISTS dense_meta;
+        """)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """Arquivos do kb -> (mtime_ns, tamanho), ignorando diretórios ocultos/de build."""
+        found: Dict[str, Tuple[int, int]] = {}
+        for root, dirs, files in os.walk(self.kb):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                found[p] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def update(self, rebuild: bool = False) -> Dict[str, int]:
+        """Reindexa arquivos novos/alterados e remove os apagados."""
+        t0 = time.perf_counter()
+        with self._lock:
+            con = self._con
+            with con:
+                if rebuild:
+                    con.execute("DELETE FROM chunks")
+                    con.execute("DELETE FROM files")
+                known = {p: (m, s) for p, m, s in con.execute("SELECT path, mtime_ns, size FROM files")}
+                found = self._scan()
+                stats = {"added": 0, "updated": 0, "removed": 0, "chunks": 0}
+                for p in known.keys() - found.keys():
+                    con.execute("DELETE FROM chunks WHERE path = ?", (p,))
+                    con.execute("DELETE FROM files WHERE path = ?", (p,))
+                    stats["removed"] += 1
+                for p, (mtime, size) in found.items():
+                    if known.get(p) == (mtime, size):
+                        continue
+                    stats["updated" if p in known else "added"] += 1
+                    con.execute("DELETE FROM chunks WHERE path = ?", (p,))
+                    text = _read_text(p)
+                    rows = [(p, a, b, t) for a, b, t in chunk_text(text)] if text else []
+                    con.executemany("INSERT INTO chunks(path, start_line, end_line, text) VALUES (?,?,?,?)", rows)
+                    con.execute("INSERT OR REPLACE INTO files(path, mtime_ns, size) VALUES (?,?,?)", (p, mtime, size))
+                    stats["chunks"] += len(rows)
+            if rebuild or stats["added"] or stats["updated"] or stats["removed"]:
+                self._changed = True
+            if rebuild:
+                con.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('optimize')")
+        stats["ms"] = int((time.perf_counter() - t0) * 1000)
+        return stats
+
+    def _bm25(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """(id do trecho, score) por BM25; qualquer palavra da consulta casa, mais palavras pontuam mais."""
+        words = normalize_words(query)
+        if not words:
+            return []
+        match = " OR ".join(f'"{w}"' for w in dict.fromkeys(words))
+        with self._lock:
+            rows = self._con.execute(SEARCH_SQL, (match, limit)).fetchall()
+        # bm25() do FTS5 é negativo (menor = melhor); invertido para leitura
+        return [(r[0], -r[1]) for r in rows]
+
+    def _chunks(self, scored: List[Tuple[int, float]]) -> List[Chunk]:
+        if not scored:
+            return []
+        ids = [c for c, _ in scored]
+        with self._lock:
+            rows = {r[0]: r[1:] for r in self._con.execute(
+                f"SELECT id, path, start_line, end_line, text FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids)}
+        return [Chunk(*rows[c], score=score) for c, score in scored if c in rows]
+
+    def dense(self, embedder: Optional[str] = None) -> "DenseIndex":
+        """Índice denso deste kb (criado/sincronizado sob demanda)."""
+        from .dense import DenseIndex, get_embedder
+        emb = get_embedder(embedder)
+        dense = self._dense.get(emb.name)
+        if dense is None:
+            dense = self._dense[emb.name] = DenseIndex(self, emb)
+            dense.sync()
+        elif self._changed:
+            dense.sync()
+        self._changed = False
+        return dense
+
+    def search(self, query: str, k: int = 8, mode: str = "bm25", alpha: float = HYBRID_ALPHA,
+               embedder: Optional[str] = None) -> List[Chunk]:
+        """Top-k trechos pelo modo escolhido (bm25, dense ou hybrid)."""
+        if mode == "bm25":
+            return self._chunks(self._bm25(query, k))
+        if mode not in SEARCH_MODES:
+            raise RagError(f"modo de busca desconhecido: '{mode}' ({', '.join(SEARCH_MODES)})")
+        dense = self.dense(embedder)
+        if mode == "dense":
+            return self._chunks(dense.search_many([query], k)[0])
+        # híbrido: une os candidatos dos dois lados e combina os scores normalizados pelo máximo
+        pool = max(k, HYBRID_POOL)
+        lexical = dict(self._bm25(query, pool))
+        candidates = set(lexical) | {c for c, _ in dense.search_many([query], pool)[0]}
+        semantic = dense.scores_for(query, list(candidates))
+        top_lex = max(lexical.values(), default=0.0) or 1.0
+        top_sem = max((v for v in semantic.values() if v > 0), default=0.0) or 1.0
+        combined = [(c, alpha * lexical.get(c, 0.0) / top_lex + (1 - alpha) * max(semantic.get(c, 0.0), 0.0) / top_sem)
+                    for c in candidates]
+        combined.sort(key=lambda x: -x[1])
+        return self._chunks(combined[:k])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            files = self._con.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            chunks = self._con.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"files": files, "chunks": chunks, "db_bytes": self.db_path.stat().st_size}
+
+
+def budget_bytes(max_bytes: Optional[int] = None, max_tokens: Optional[int] = None) -> int:
+    limits = [b for b in (max_bytes, (max_tokens or 0) * BYTES_PER_TOKEN or None) if b]
+    return min(limits) if limits else 16000
+
+
+def assemble(chunks: List[Chunk], max_bytes: int) -> str:
+    """Concatena os trechos em ordem de relevância até o orçamento de bytes."""
+    out: List[bytes] = []
+    used = 0
+    for c in chunks:
+        data = c.render().encode("utf-8")
+        if used + len(data) > max_bytes:
+            if not out:  # o mais relevante sempre entra, mesmo truncado
+                out.append(data[:max_bytes])
+            break
+        out.append(data)
+        used += len(data)
+    return b"\n".join(out).decode("utf-8", errors="ignore")
+
+
+_indexes: Dict[str, RagIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(kb: str, refresh: bool = True) -> RagIndex:
+    """Índice do kb reutilizado no processo; atualizado na primeira chamada (ou se refresh)."""
+    key = os.path.realpath(kb)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        fresh = index is None
+        if fresh:
+            index = _indexes[key] = RagIndex(kb)
+    if fresh or refresh:
+        index.update()
+    return index
+
+
+def retrieve(kb: str, query: str, k: int = 8, max_bytes: Optional[int] = None,
+             max_tokens: Optional[int] = None, mode: str = "bm25", alpha: float = HYBRID_ALPHA) -> str:
+    """Atalho usado pelo flow: contexto pronto para o prompt."""
+    index = get_index(kb, refresh=False)
+    return assemble(index.search(query, k, mode=mode, alpha=alpha), budget_bytes(max_bytes, max_tokens))
+
+
+# --- Corpus sintético (gemx rag bench) ---
+
+_SYLLABLES = ["ba", "be", "ca", "ci", "co", "da", "de", "di", "fa", "fe", "ga", "la", "le", "li", "lo", "ma",
+              "me", "mi", "mo", "na", "ne", "no", "nor", "pa", "pe", "pi", "pre", "ra", "re", "ri", "sa", "se",
+              "si", "ta", "te", "ti", "tra", "va", "ve", "vi", "xa", "zo"]
+
+
+def _variant(word: str, rnd) -> str:
+    """Paráfrase 'de superfície': troca de sufixo, acento ou erro de digitação."""
+    kind = rnd.randrange(3)
+    if kind == 0 and len(word) > 5:
+        return word[:-2] + rnd.choice(["as", "os", "ção", "mente", "ina"])
+    if kind == 1:
+        i = rnd.randrange(len(word))
+        return word[:i] + {"a": "á", "e": "ê", "i": "í", "o": "ó"}.get(word[i], word[i]) + word[i + 1:]
+    i = rnd.randrange(max(1, len(word) - 1))
+    return word[:i] + word[i + 1:i + 2] + word[i:i + 1] + word[i + 2:]
+
+
+def synthetic_corpus(kb: str, docs: int, queries: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """Gera `docs` arquivos em kb e devolve (consulta, arquivo-alvo); metade das palavras da
+    consulta vem alterada, então busca exata por termo não basta."""
+    import random
+    rnd = random.Random(seed)
+    vocab = list(dict.fromkeys("".join(rnd.choice(_SYLLABLES) for _ in range(rnd.randint(2, 5)))
+                               for _ in range(30000)))
+    rank = {w: i for i, w in enumerate(vocab)}
+    weights = [1.0 / (i + 1) for i in range(len(vocab))]  # Zipf: poucas palavras muito comuns
+    os.makedirs(kb, exist_ok=True)
+    paragraphs: List[Tuple[str, List[str]]] = []
+    for d in range(docs):
+        path = os.path.join(kb, f"doc{d:05d}.md")
+        paras = [rnd.choices(vocab, weights, k=60) for _ in range(6)]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(" ".join(p) for p in paras) + "\n")
+        paragraphs.extend((path, p) for p in paras)
+    cases = []
+    for _ in range(queries):
+        path, para = rnd.choice(paragraphs)
+        rare = sorted(set(para), key=rank.__getitem__)[-6:]  # palavras mais raras do parágrafo
+        words = [_variant(w, rnd) if rnd.random() < 0.5 else w for w in rnd.sample(rare, min(4, len(rare)))]
+        words += rnd.choices(vocab[:50], k=2)  # ruído com palavras comuns
+        rnd.shuffle(words)
+        cases.append((" ".join(words), path))
+    return cases
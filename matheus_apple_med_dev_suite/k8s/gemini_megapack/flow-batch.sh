@@ -1,6 +1,8 @@
 #!/usr/bin/env bash
 # flow-batch.sh — executa múltiplos flows com retries e backoff exponencial com jitter
 # Requer: bash, jq; Opcional: GNU parallel
+# Com python3 disponível, delega para gemx-flow-batch.py (asyncio, rate limit, resultado
+# por flow); FLOW_BATCH_SHELL=1 força a implementação em bash abaixo.
 #
 # Uso básico:
 #   ./flow-batch.sh [--retries 3] [--base 2] [--max 60] [--jitter 5] [--concurrency 1] [--manifest flows.txt|.yml] [paths...]
@@ -12,6 +14,10 @@
 #
 set -euo pipefail
 
+if command -v python3 >/dev/null 2>&1 && [ "${FLOW_BATCH_SHELL:-0}" != "1" ]; then
+  exec python3 "$(dirname "$0")/gemx-flow-batch.py" "$@"
+fi
+
 RETRIES=3
 BASE=2          # segundos
 MAX=60          # segundos
@@ -89,8 +95,8 @@ run_one(){
   while [ $attempt -le $RETRIES ]; do
     wait_until_window
     start=$(date +%s)
-    ./gemx.sh flow "$flow" >/dev/null 2>&1
-    st=$?
+    st=0
+    ./flow-run.sh "$flow" >/dev/null 2>&1 || st=$?
     end=$(date +%s); dur=$(( end - start ))
     if [ $st -eq 0 ]; then
       log_jsonl "finish" "$flow" $st $attempt $dur "ok"
@@ -135,7 +141,7 @@ in_window(){
       if [[ "$now" > "$s" && "$now" < "$e" ]] || [ "$now" = "$s" ] || [ "$now" = "$e" ]; then
         return 0
       fi
-    endfor=0
+    done
     return 1
   fi
   return 0
@@ -1,78 +1,65 @@
 #!/usr/bin/env bash
 # flow-run.sh — executa pipeline YAML de flows/*.yml
+# Com o gemx (Python) instalado, delega para `gemx flow run` (um único processo); os passos
+# gen não passam pelo gemx.sh, mas gravam o mesmo audit log e respeitam GEMX_FORCE_MODEL.
+# Sem ele, o YAML é parseado uma única vez em arrays do bash.
 set -euo pipefail
 FLOW="${1:-flows/flow_example.yml}"
 [ -f "$FLOW" ] || { echo "[FLOW] arquivo não encontrado: $FLOW" >&2; exit 1; }
 have(){ command -v "$1" >/dev/null 2>&1; }
-get(){ jq -r "$1" "$FLOW"; }
-# yq preferido
-if have yq; then
-  steps=$(yq '.steps' "$FLOW")
-else
-  echo "[FLOW] yq não instalado; tentando jq (requere YAML válido JSON-like)."
-  steps=$(python3 - <<PY 2>/dev/null || echo "[]"
-import yaml, json, sys
-print(json.dumps(yaml.safe_load(open(sys.argv[1]).read()).get('steps', [])))
-PY
-"$FLOW")
+
+if have gemx && [ "${GEMX_FLOW_SHELL:-0}" != "1" ]; then
+  exec gemx flow run "$FLOW"
 fi
 
+# Um único python3: lê o flow e emite declarações de array já escapadas
+decls=$(python3 - "$FLOW" <<'PY'
+import json, shlex, sys
+path = sys.argv[1]
+text = open(path, encoding="utf-8").read()
+try:
+    import yaml
+    data = yaml.safe_load(text)
+except ImportError:
+    data = json.loads(text)  # sem PyYAML só aceita flows em JSON
+steps = (data or {}).get("steps") or []
+fields = {
+    "S_NAME": lambda d, i: d.get("name") or f"step{i + 1}",
+    "S_RUN": lambda d, i: d.get("run", ""),
+    "S_KB": lambda d, i: (d.get("args") or {}).get("kb", "./kb"),
+    "S_QUERY": lambda d, i: (d.get("args") or {}).get("query", ""),
+    "S_MAXB": lambda d, i: (d.get("args") or {}).get("max_bytes", 16000),
+    "S_PROMPT": lambda d, i: d.get("prompt", ""),
+    "S_TITLE": lambda d, i: d.get("title", "Gemx Note"),
+}
+for var, get in fields.items():
+    print(f"{var}=(" + " ".join(shlex.quote(str(get(d, i))) for i, d in enumerate(steps)) + ")")
+PY
+) || { echo "[FLOW] falha ao ler $FLOW (instale PyYAML ou use JSON)." >&2; exit 1; }
+eval "$decls"
+
 # Variáveis de contexto
 declare -A CTX
 last_out=""
 
-len=$(python3 - <<PY
-import json,sys; print(len(json.load(sys.stdin)))
-PY <<<"$steps")
-
-for i in $(seq 0 $((len-1))); do
-  name=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('name','step'))
-PY
-)
-  run=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('run',''))
-PY
-)
+for i in "${!S_RUN[@]}"; do
+  name="${S_NAME[$i]}"; run="${S_RUN[$i]}"
   echo "[FLOW] >>> $name ($run)"
   case "$run" in
     rag)
-      kb=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('args',{}).get('kb','./kb'))
-PY
-)
-      q=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('args',{}).get('query',''))
-PY
-)
-      mb=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('args',{}).get('max_bytes','16000'))
-PY
-)
-      out="$(./plugins.d/rag.sh "$kb" "$q" "$mb" 2>/dev/null || true)"
+      out="$(./plugins.d/rag.sh "${S_KB[$i]}" "${S_QUERY[$i]}" "${S_MAXB[$i]}" 2>/dev/null || true)"
       CTX["ctx"]="$out"
       ;;
     gen)
-      prompt=$(python3 - <<'PY' <<<"$steps"
-import json,sys,os
-i=int(os.environ.get('IDX',0))
-d=json.load(sys.stdin)[i]
-print(d.get('prompt',''))
-PY
-)
+      prompt="${S_PROMPT[$i]}"
       # substitui ${ctx}
       prompt="${prompt//'${ctx}'/${CTX[ctx]:-}}"
-      ./gemx.sh gen --prompt "$prompt" || true
-      last_out="(stdout capturado externamente)"
+      last_out="$(./gemx.sh gen --prompt "$prompt" || true)"
+      printf '%s\n' "$last_out"
       ;;
     obsidian)
-      title=$(python3 - <<PY <<<"$steps"
-import json,sys; d=json.load(sys.stdin)[$i]; print(d.get('title','Gemx Note'))
-PY
-)
-      ./plugins.d/obsidian_export.sh "$title" "$last_out" || true
+      ./plugins.d/obsidian_export.sh "${S_TITLE[$i]}" "$last_out" || true
       ;;
   esac
-  export IDX=$((i+1))
 done
 echo "[FLOW] pipeline concluído."
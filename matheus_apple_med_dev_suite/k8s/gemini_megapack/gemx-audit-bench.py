@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+gemx-audit-bench.py — benchmark da ingestão paralela dos logs de auditoria.
+
+Gera um conjunto sintético de audit-*.jsonl (um arquivo por dia, --size-mb no total)
+e reindexa do zero com cada valor de --jobs, imprimindo vazão total e por núcleo.
+
+Uso:
+  python3 gemx-audit-bench.py [--size-mb 2048] [--days 90] [--jobs 1,2,4,8] [--dir DIR] [--keep]
+"""
+import os, json, argparse, datetime, random, shutil, tempfile, time
+
+from gemx_analytics import AuditIndex, INDEX_NAME, resolve_jobs
+
+CMDS = ["gen", "chat", "auto", "vision", "flow"]
+MODELS = ["gemini-2.5-pro", "gemini-2.5-flash"]
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=2048)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--jobs", type=str, default=None,
+                    help="Lista separada por vírgula (padrão: 1,2,4,... até o nº de núcleos).")
+    ap.add_argument("--dir", type=str, default=None, help="Reaproveita/gera os logs aqui.")
+    ap.add_argument("--keep", action="store_true", help="Não apaga o diretório temporário.")
+    ap.add_argument("--seed", type=int, default=42)
+    return ap.parse_args()
+
+def generate(logdir, size_mb, days, seed):
+    """Escreve pares start/finish (com run id) até atingir ~size_mb."""
+    rnd = random.Random(seed)
+    per_day = size_mb * 1024 * 1024 // days
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    run = 0
+    for d in range(days):
+        day = base + datetime.timedelta(days=d)
+        path = os.path.join(logdir, f"audit-{day:%Y%m%d}.jsonl")
+        written = 0
+        t = day
+        with open(path, "w", encoding="utf-8") as fh:
+            while written < per_day:
+                run += 1
+                cmd = rnd.choice(CMDS)
+                rec = {"bin": "gemini", "argv": [cmd, "--model", rnd.choice(MODELS), "prompt %d" % run],
+                       "model": rnd.choice(MODELS), "run": f"{run}-bench"}
+                t += datetime.timedelta(seconds=rnd.randint(1, 5))
+                start = dict(rec, ts=t.strftime("%Y-%m-%dT%H:%M:%SZ"), event="start")
+                end = t + datetime.timedelta(seconds=int(rnd.expovariate(1 / 8.0)))
+                finish = dict(rec, ts=end.strftime("%Y-%m-%dT%H:%M:%SZ"), event="finish")
+                lines = json.dumps(start) + "\n" + json.dumps(finish) + "\n"
+                fh.write(lines)
+                written += len(lines)
+
+def main():
+    args = parse_args()
+    ncpu = os.cpu_count() or 1
+    if args.jobs:
+        jobs_list = [resolve_jobs(int(j)) for j in args.jobs.split(",") if j.strip()]
+    else:
+        jobs_list, j = [], 1
+        while j < ncpu:
+            jobs_list.append(j)
+            j *= 2
+        jobs_list.append(ncpu)
+
+    logdir = args.dir or tempfile.mkdtemp(prefix="gemx-audit-bench-")
+    os.makedirs(logdir, exist_ok=True)
+    try:
+        if not any(n.startswith("audit-") for n in os.listdir(logdir)):
+            print(f"[..] Gerando ~{args.size_mb} MB em {logdir}")
+            generate(logdir, args.size_mb, args.days, args.seed)
+        total = sum(os.path.getsize(os.path.join(logdir, n)) for n in os.listdir(logdir) if n.startswith("audit-"))
+        print(f"[OK] {total / 1e6:.0f} MB em {logdir} (núcleos: {ncpu})")
+        print(f"  {'jobs':>4}  {'tempo(s)':>9}  {'MB/s':>8}  {'MB/s/núcleo':>12}  {'speedup':>8}")
+        base = None
+        for jobs in jobs_list:
+            idx = AuditIndex(logdir)
+            t0 = time.perf_counter()
+            parsed = idx.update(rebuild=True, jobs=jobs)
+            dt = time.perf_counter() - t0
+            base = base or dt
+            rate = parsed / 1e6 / dt
+            print(f"  {jobs:4d}  {dt:9.2f}  {rate:8.1f}  {rate / jobs:12.1f}  {base / dt:7.2f}x")
+    finally:
+        if not args.dir and not args.keep:
+            shutil.rmtree(logdir, ignore_errors=True)
+        elif os.path.exists(os.path.join(logdir, INDEX_NAME)):
+            print(f"[..] Índice mantido em {os.path.join(logdir, INDEX_NAME)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+gemx-flow-batch.py — executa vários flows em paralelo (asyncio) com retries, backoff e rate limit.
+
+Substitui o laço do flow-batch.sh (que delega para cá quando há python3):
+- N flows simultâneos (--concurrency) sem depender do GNU parallel;
+- uma falha não derruba o batch: cada flow tem o próprio resultado (--fail-fast para parar);
+- backoff exponencial com teto e jitter que não ocupa vaga enquanto espera;
+- token bucket (--rate tentativas/min, --burst) para respeitar a cota do modelo;
+- --allow-hours/--allow-days: espera até o início da próxima janela (faixas como 22:00-02:00 valem).
+
+O log usa o mesmo schema do flow-batch.sh, em ~/.config/gemx/logs/flowbatch-YYYYMMDD.jsonl:
+  {"ts", "event": finish|error|fail, "flow", "status", "attempt", "duration", "msg"}
+
+Uso:
+  python3 gemx-flow-batch.py [--concurrency 4] [--retries 3] [--base 2] [--max 60] [--jitter 5]
+                             [--rate 30] [--burst 5] [--manifest flows.txt|.yml] [flows...]
+"""
+import os, sys, json, glob, shlex, random, asyncio, argparse, datetime, time
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Batch de flows com retries, backoff e rate limit.")
+    ap.add_argument("--retries", type=int, default=3, help="Tentativas por flow.")
+    ap.add_argument("--base", type=float, default=2, help="Backoff inicial (s), dobra a cada erro.")
+    ap.add_argument("--max", type=float, default=60, help="Teto do backoff (s).")
+    ap.add_argument("--jitter", type=float, default=5, help="Jitter uniforme extra [0..JITTER] (s).")
+    ap.add_argument("--concurrency", type=int, default=1, help="Flows simultâneos.")
+    ap.add_argument("--rate", type=float, default=float(os.environ.get("GEMX_FLOW_RATE", "0")),
+                    help="Tentativas por minuto (token bucket; 0 = sem limite).")
+    ap.add_argument("--burst", type=int, default=int(os.environ.get("GEMX_FLOW_BURST", "1")),
+                    help="Tentativas que podem começar de uma vez com o bucket cheio.")
+    ap.add_argument("--manifest", type=str, default="", help="txt (1 caminho por linha) ou yaml (chave 'flows').")
+    ap.add_argument("--allow-hours", type=str, default="", help='Ex.: "08:00-12:00,14:00-18:00".')
+    ap.add_argument("--allow-days", type=str, default="", help='Ex.: "Mon,Tue,Wed,Thu,Fri".')
+    ap.add_argument("--runner", type=str, default=os.environ.get("GEMX_FLOW_RUNNER", "./flow-run.sh"),
+                    help="Comando que executa um flow (o caminho é o último argumento).")
+    ap.add_argument("--fail-fast", action="store_true", help="Não inicia novos flows após a primeira falha definitiva.")
+    ap.add_argument("--logdir", type=str,
+                    default=os.path.join(os.environ.get("GEMX_HOME") or os.path.expanduser("~/.config/gemx"), "logs"))
+    ap.add_argument("flows", nargs="*")
+    return ap.parse_args()
+
+def collect_flows(args):
+    if args.flows:
+        return list(args.flows)
+    if args.manifest:
+        if args.manifest.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                sys.exit("[FLOW-BATCH] Manifesto YAML requer PyYAML (pip install pyyaml); use um manifesto TXT.")
+            with open(args.manifest, encoding="utf-8") as fh:
+                return [str(f) for f in (yaml.safe_load(fh) or {}).get("flows", [])]
+        with open(args.manifest, encoding="utf-8") as fh:
+            return [l.strip() for l in fh if l.strip() and not l.lstrip().startswith("#")]
+    return sorted(glob.glob("flows/*.yml")) + sorted(glob.glob("flows/*.yaml"))
+
+# --- janelas de execução ---
+
+def parse_hours(spec):
+    """"08:00-12:00,22:00-02:00" -> [(480, 720), (1320, 120)] em minutos do dia."""
+    ranges = []
+    for r in filter(None, (x.strip() for x in spec.split(","))):
+        s, e = r.split("-", 1)
+        to_min = lambda hm: int(hm.split(":")[0]) * 60 + int(hm.split(":")[1])
+        ranges.append((to_min(s), to_min(e)))
+    return ranges
+
+def in_window(dt, hours, days):
+    if days and DAYS[dt.weekday()] not in days:
+        return False
+    if not hours:
+        return True
+    m = dt.hour * 60 + dt.minute
+    # faixa com início > fim atravessa a meia-noite
+    return any(s <= m <= e if s <= e else (m >= s or m <= e) for s, e in hours)
+
+def seconds_until_window(now, hours, days):
+    """0 dentro da janela; senão, segundos até o próximo instante permitido."""
+    if in_window(now, hours, days):
+        return 0.0
+    # inícios de faixa e a meia-noite (faixas que atravessam o dia)
+    starts = sorted({0} | {s for s, _ in hours})
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = [midnight + datetime.timedelta(days=d, minutes=s) for d in range(8) for s in starts]
+    nxt = min((c for c in candidates if c > now and in_window(c, hours, days)), default=None)
+    return (nxt - now).total_seconds() if nxt else 60.0
+
+async def wait_window(hours, days, flow):
+    while True:
+        delay = seconds_until_window(datetime.datetime.now(), hours, days)
+        if delay <= 0:
+            return
+        print(f"[FLOW-BATCH] {flow}: fora da janela (dias/horas); aguardando {delay / 60:.0f} min...")
+        await asyncio.sleep(min(delay, 3600))
+
+# --- rate limit ---
+
+class TokenBucket:
+    """`rate` fichas por minuto, até `burst` acumuladas; rate <= 0 desliga o limite."""
+    def __init__(self, rate, burst):
+        self.rate = rate / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# --- execução ---
+
+class BatchLog:
+    """Append no flowbatch-YYYYMMDD.jsonl (mesmo schema do flow-batch.sh)."""
+    def __init__(self, logdir):
+        os.makedirs(logdir, exist_ok=True)
+        self.path = os.path.join(logdir, f"flowbatch-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d}.jsonl")
+        self.fh = open(self.path, "a", encoding="utf-8")
+
+    def write(self, event, flow, status, attempt, duration, msg):
+        rec = {"ts": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+               "event": event, "flow": flow, "status": status, "attempt": attempt,
+               "duration": int(round(duration)), "msg": msg}
+        self.fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+def backoff(args, attempt):
+    delay = min(args.base * (2 ** (attempt - 1)), args.max)
+    return delay + (random.uniform(0, args.jitter) if args.jitter > 0 else 0)
+
+async def run_cmd(cmd):
+    """Executa o flow; retorna (status, última linha do stderr)."""
+    proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.DEVNULL,
+                                                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, err = await proc.communicate()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    lines = err.decode("utf-8", "replace").strip().splitlines()
+    return proc.returncode, (lines[-1][:300] if lines else "")
+
+async def run_one(flow, args, runner, hours, days, slots, bucket, log, stop):
+    """Tentativas de um flow. Retorna True/False, ou None se não chegou a rodar (--fail-fast)."""
+    retries = max(1, args.retries)
+    status = 0
+    for attempt in range(1, retries + 1):
+        await wait_window(hours, days, flow)
+        async with slots:
+            if stop.is_set() and attempt == 1:
+                return None
+            await bucket.acquire()
+            t0 = time.monotonic()
+            try:
+                status, err = await run_cmd(runner + [flow])
+            except OSError as e:
+                status, err = 127, str(e)
+            dur = time.monotonic() - t0
+        if status == 0:
+            log.write("finish", flow, 0, attempt, dur, "ok")
+            return True
+        more = attempt < retries
+        log.write("error", flow, status, attempt, dur, ("retrying" if more else "last attempt") + (f": {err}" if err else ""))
+        if more:
+            # espera fora do semáforo: a vaga fica livre para outro flow
+            await asyncio.sleep(backoff(args, attempt))
+    log.write("fail", flow, status, retries, 0, "exceeded retries")
+    if args.fail_fast:
+        stop.set()
+    return False
+
+async def run_batch(flows, args):
+    runner = shlex.split(args.runner)
+    hours = parse_hours(args.allow_hours)
+    days = {d.strip()[:3].title() for d in args.allow_days.split(",") if d.strip()}
+    slots = asyncio.Semaphore(max(1, args.concurrency))
+    bucket = TokenBucket(args.rate, args.burst)
+    stop = asyncio.Event()
+    log = BatchLog(args.logdir)
+    try:
+        results = await asyncio.gather(*(run_one(f, args, runner, hours, days, slots, bucket, log, stop) for f in flows))
+    finally:
+        log.close()
+    return results, log.path
+
+def main():
+    args = parse_args()
+    flows = collect_flows(args)
+    if not flows:
+        print("[FLOW-BATCH] Nenhum flow encontrado.")
+        sys.exit(1)
+    print(f"[FLOW-BATCH] Execuções: {len(flows)} | conc={args.concurrency} retries={args.retries} "
+          f"base={args.base:g} max={args.max:g} jitter={args.jitter:g} rate={args.rate:g}/min burst={args.burst}")
+    t0 = time.monotonic()
+    results, path = asyncio.run(run_batch(flows, args))
+    ok = sum(1 for r in results if r is True)
+    fail = sum(1 for r in results if r is False)
+    skipped = sum(1 for r in results if r is None)
+    for flow, r in zip(flows, results):
+        if r is not True:
+            print(f"[FLOW-BATCH] {'FALHOU' if r is False else 'não executado'}: {flow}")
+    print(f"[FLOW-BATCH] Concluído em {time.monotonic() - t0:.1f}s: ok={ok} falhas={fail} não executados={skipped}. Log: {path}")
+    sys.exit(1 if fail else 0)
+
+if __name__ == "__main__":
+    main()
@@ -8,15 +8,22 @@ gemx-flowbatch-agg.py — agrega múltiplos flowbatch-*.jsonl em um sumário CSV
     - HTML: index.html + PNGs em report_assets/
 
 Gráficos via matplotlib (um gráfico por figura, sem cores explícitas).
+
+--jobs N agrega cada arquivo num pool de processos e soma os Counters parciais na
+ordem dos arquivos (resultado idêntico ao serial).
 """
 import os, sys, json, argparse, glob, datetime
 from collections import Counter, defaultdict
 
+from gemx_analytics import parallel_map
+
 def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--logdir", type=str, default=os.path.expanduser("~/.config/gemx/logs"))
     ap.add_argument("--glob", type=str, default="flowbatch-*.jsonl")
     ap.add_argument("--out-dir", type=str, default="./flowbatch_report")
+    ap.add_argument("--jobs", type=int, default=int(os.environ.get("GEMX_STATS_JOBS", "1")),
+                    help="Processos para parsear os logs (0 = todos os núcleos).")
     return ap.parse_args()
 
 def iter_files(logdir, pattern):
@@ -36,6 +43,42 @@ def iter_rows(paths):
                 # expected keys: ts,event,flow,status,attempt,duration,msg
                 yield obj
 
+def aggregate_file(path):
+    """Agregados parciais de um arquivo (executa nos workers com --jobs)."""
+    events = Counter()
+    flows_runs = Counter()       # by flow, finishes
+    flows_fail = Counter()       # by flow, fails
+    dur_sum = Counter()
+    dur_n = Counter()
+    daily = Counter()
+
+    for obj in iter_rows([path]):
+        ev = obj.get("event")
+        events[ev]+=1
+        fl = obj.get("flow","(unknown)")
+        if ev == "finish":
+            flows_runs[fl]+=1
+            d = int(obj.get("duration",0) or 0)
+            dur_sum[fl]+=d
+            dur_n[fl]+=1
+            ts = obj.get("ts")
+            try:
+                dt = datetime.datetime.fromisoformat(ts.replace("Z","+00:00"))
+                daily[dt.date()]+=1
+            except Exception:
+                pass
+        elif ev in ("error","fail"):
+            flows_fail[fl]+=1
+    return events, flows_runs, flows_fail, dur_sum, dur_n, daily
+
+def merge_partials(partials):
+    """Soma os Counters parciais na ordem recebida."""
+    totals = tuple(Counter() for _ in range(6))
+    for part in partials:
+        for total, c in zip(totals, part):
+            total.update(c)
+    return totals
+
 def ensure_dir(p):
     os.makedirs(p, exist_ok=True)
 
@@ -72,30 +115,8 @@ def main():
     assets = os.path.join(args.out_dir, "report_assets")
     ensure_dir(assets)
 
-    events = Counter()
-    flows_runs = Counter()       # by flow, finishes
-    flows_fail = Counter()       # by flow, fails
-    dur_sum = Counter()
-    dur_n = Counter()
-    daily = Counter()
-
-    for obj in iter_rows(iter_files(args.logdir, args.glob)):
-        ev = obj.get("event")
-        events[ev]+=1
-        fl = obj.get("flow","(unknown)")
-        if ev == "finish":
-            flows_runs[fl]+=1
-            d = int(obj.get("duration",0) or 0)
-            dur_sum[fl]+=d
-            dur_n[fl]+=1
-            ts = obj.get("ts")
-            try:
-                dt = datetime.datetime.fromisoformat(ts.replace("Z","+00:00"))
-                daily[dt.date()]+=1
-            except Exception:
-                pass
-        elif ev in ("error","fail"):
-            flows_fail[fl]+=1
+    events, flows_runs, flows_fail, dur_sum, dur_n, daily = merge_partials(
+        parallel_map(aggregate_file, list(iter_files(args.logdir, args.glob)), args.jobs))
 
     # CSVs
     save_csv(os.path.join(args.out_dir, "events.csv"),
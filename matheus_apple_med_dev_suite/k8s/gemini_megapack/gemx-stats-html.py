@@ -4,13 +4,15 @@ gemx-stats-html.py — "Grafana-lite" estático para os logs JSONL do Gemini Meg
 
 - Lê ~/.config/gemx/logs/audit-*.jsonl
 - Filtros: --since YYYY-MM-DD, --until YYYY-MM-DD
+- --jobs N: parseia os arquivos em N processos (0 = todos os núcleos)
 - Saída: diretório (--out-dir, default ./gemx_report) com index.html e PNGs em report_assets/
 - Requisitos: Python 3, matplotlib; pandas não é necessário.
 
 Restrições: usar matplotlib puro, um gráfico por figura, sem especificar cores.
 """
-import os, sys, json, argparse, datetime, glob
-from collections import defaultdict, Counter
+import os, sys, argparse, datetime
+
+from gemx_analytics import AuditIndex
 
 def parse_args():
     ap = argparse.ArgumentParser()
@@ -22,37 +24,13 @@ def parse_args():
                     help="Lista de intervalos start:end separados por ponto e vírgula. Ex.: 2025-08-01:2025-08-31;2025-09-01:2025-09-18")
     ap.add_argument("--batch-monthly", action="store_true",
                     help="Gera 1 relatório por mês encontrado nos logs (YYYY-MM).")
+    ap.add_argument("--jobs", type=int, default=int(os.environ.get("GEMX_STATS_JOBS", "1")),
+                    help="Processos para parsear os logs (0 = todos os núcleos).")
     return ap.parse_args()
 
 def parse_date(s):
     return datetime.datetime.strptime(s, "%Y-%m-%d").date()
 
-def iter_logs(logdir, since=None, until=None):
-    files = sorted(glob.glob(os.path.join(logdir, "audit-*.jsonl")))
-    for f in files:
-        with open(f, "r", encoding="utf-8") as fh:
-            for line in fh:
-                line=line.strip()
-                if not line: 
-                    continue
-                try:
-                    obj = json.loads(line)
-                except Exception:
-                    continue
-                ts = obj.get("ts")
-                if not ts:
-                    continue
-                try:
-                    dt = datetime.datetime.fromisoformat(ts.replace("Z","+00:00"))
-                except Exception:
-                    continue
-                d = dt.date()
-                if since and d < since:
-                    continue
-                if until and d > until:
-                    continue
-                yield dt, obj
-
 def ensure_dir(p):
     os.makedirs(p, exist_ok=True)
 
@@ -77,49 +55,21 @@ def save_line(figpath, xs, ys, title, xlabel, ylabel):
     plt.savefig(figpath)
     plt.close()
 
-def build_once(since, until, logdir, out_dir):
+def build_once(since, until, logdir, out_dir, index):
     since = parse_date(since) if since else None
     until = parse_date(until) if until else None
     ensure_dir(out_dir)
     assets = os.path.join(out_dir, "report_assets")
     ensure_dir(assets)
 
-    events = Counter()
-    cmd_finish = Counter()
-    model_finish = Counter()
-    starts = defaultdict(list)
-    dur_sum = Counter()
-    dur_n = Counter()
-    daily_finish = Counter()
-
-    for dt, obj in iter_logs(logdir, since, until):
-        ev = obj.get("event")
-        events[ev]+=1
-        argv = obj.get("argv") or []
-        cmd = argv[0] if argv else "(none)"
-        if ev == "start":
-            sig = (obj.get("bin",""), json.dumps(argv, sort_keys=True))
-            starts[sig].append(dt)
-        elif ev == "finish":
-            sig = (obj.get("bin",""), json.dumps(argv, sort_keys=True))
-            if starts[sig]:
-                t0 = starts[sig].pop(0)
-                dur = (dt - t0).total_seconds()
-                dur_sum[cmd]+=dur
-                dur_n[cmd]+=1
-            cmd_finish[cmd]+=1
-            model_finish[obj.get("model","unknown")]+=1
-            daily_finish[dt.date()]+=1
-
-    events_items = sorted(events.items(), key=lambda x: x[0])
-    cmds_items = cmd_finish.most_common(15)
-    models_items = model_finish.most_common()
-    dur_items = []
-    for cmd in dur_n:
-        avg = dur_sum[cmd]/max(1,dur_n[cmd])
-        dur_items.append((cmd, dur_n[cmd], int(round(avg))))
-    dur_items.sort(key=lambda x: x[2], reverse=True)
-    days = sorted(daily_finish.items(), key=lambda x:x[0])
+    # Agregados vêm do índice incremental (só bytes novos são parseados)
+    rep = index.report(since, until)
+    events_items = sorted(rep.events.items(), key=lambda x: str(x[0]))
+    cmds_items = rep.cmd_finish.most_common(15)
+    models_items = rep.model_finish.most_common()
+    dur_items = rep.duration_stats("cmd")
+    model_dur_items = rep.duration_stats("model")
+    days = sorted(rep.daily_finish.items(), key=lambda x:x[0])
     day_labels = [d.strftime("%Y-%m-%d") for d,_ in days]
     day_values = [c for _,c in days]
 
@@ -142,7 +92,7 @@ def build_once(since, until, logdir, out_dir):
             charts["models"]="report_assets/models.png"
         if dur_items:
             save_bar(os.path.join(assets, "durations.png"),
-                    [k for k,_,_ in dur_items], [v for _,_,v in dur_items],
+                    [k for k, *_ in dur_items], [avg for _, _, avg, *_ in dur_items],
                     "Duração média por comando (s)", "comando", "segundos")
             charts["durations"]="report_assets/durations.png"
         if day_labels:
@@ -185,7 +135,8 @@ def build_once(since, until, logdir, out_dir):
     table("Eventos", ["evento","contagem"], events_items)
     table("Top comandos (finish)", ["comando","contagem"], cmds_items)
     table("Modelos utilizados", ["modelo","contagem"], models_items)
-    table("Duração média por comando (s)", ["comando","n","avg (s)"], dur_items)
+    table("Duração por comando (s)", ["comando","n","avg","p50","p95","p99"], dur_items)
+    table("Duração por modelo (s)", ["modelo","n","avg","p50","p95","p99"], model_dur_items)
     table("Série diária (finish)", ["dia","finishes"], [(d.strftime("%Y-%m-%d"), c) for d,c in days])
 
     html.append("<div class='card'><b>Gerado por:</b> gemx-stats-html.py</div>")
@@ -195,5 +146,30 @@ def build_once(since, until, logdir, out_dir):
         fh.write("\n".join(html))
     print("[OK] Relatório gerado em:", out_html)
 
+def main():
+    args = parse_args()
+    index = AuditIndex(args.logdir)
+    index.update(jobs=args.jobs)
+    if args.batch or args.batch_monthly:
+        ranges = []
+        if args.batch:
+            for part in args.batch.split(";"):
+                part = part.strip()
+                if not part:
+                    continue
+                start, _, end = part.partition(":")
+                ranges.append((f"range_{start}_{end}", start, end))
+        if args.batch_monthly:
+            months = sorted({d.strftime("%Y-%m") for d in index.days()})
+            for m in months:
+                first = parse_date(m + "-01")
+                nxt = (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+                last = nxt - datetime.timedelta(days=1)
+                ranges.append((f"month_{m}", first.isoformat(), last.isoformat()))
+        for sub, start, end in ranges:
+            build_once(start or None, end or None, args.logdir, os.path.join(args.out_dir, sub), index)
+    else:
+        build_once(args.since, args.until, args.logdir, args.out_dir, index)
+
 if __name__ == "__main__":
     main()
@@ -45,6 +45,17 @@ done
 
 [ -d "$LOGDIR" ] || { echo "[ERR] Sem diretório de logs: $LOGDIR"; exit 1; }
 
+# Caminho rápido: índice incremental compartilhado (gemx_analytics.py) quando há python3.
+# O pipeline jq abaixo fica como fallback para ambientes sem Python.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+if command -v python3 >/dev/null 2>&1 && [ -f "$SCRIPT_DIR/gemx_analytics.py" ]; then
+  py_args=( --logdir "$LOGDIR" --top "$TOP" )
+  [ -n "$SINCE" ] && py_args+=( --since "$SINCE" )
+  [ -n "$UNTIL" ] && py_args+=( --until "$UNTIL" )
+  [ $OUT_JSON -eq 1 ] && py_args+=( --json )
+  exec python3 "$SCRIPT_DIR/gemx_analytics.py" "${py_args[@]}"
+fi
+
 # Coleta arquivos
 files=( $(ls -1 "$LOGDIR"/audit-*.jsonl 2>/dev/null | sort) )
 [ ${#files[@]} -gt 0 ] || { echo "[WARN] Sem arquivos audit-*.jsonl em $LOGDIR"; exit 0; }
@@ -44,7 +44,7 @@ audit_log(){
   # Ensure logs dir
   local lf_dir="$GEMX_LOGS"; mkdir -p "$lf_dir"
   local lf="$lf_dir/audit-$(date -u +%Y%m%d).jsonl"
-  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv}' >> "$lf"
+  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" --arg run "${GEMX_RUN_ID:-}" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv} + (if $run != "" then {run:$run} else {} end)' >> "$lf"
 }
 confirm_run(){
   [ "$(get_cfg '.plugins.confirm_before_run')" = "true" ] || return 0
@@ -68,6 +68,8 @@ run_cmd(){
     audit_log "cancel" "$1" "${@:2}"
     return 130
   fi
+  # run id liga start/finish da mesma execução (pareamento exato nos relatórios)
+  local GEMX_RUN_ID; GEMX_RUN_ID="$(date -u +%s)-$$-$RANDOM"
   audit_log "start" "$1" "${@:2}"
   "$@"
   local st=$?
@@ -772,7 +774,7 @@ audit_log(){
   # Ensure logs dir
   local lf_dir="$GEMX_LOGS"; mkdir -p "$lf_dir"
   local lf="$lf_dir/audit-$(date -u +%Y%m%d).jsonl"
-  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv}' >> "$lf"
+  jq -cn --arg ts "$ts" --arg event "$event" --arg wd "$wd" --arg bin "$bin" --arg model "$model" --argjson argv "$argv_json" --arg run "${GEMX_RUN_ID:-}" '{ts:$ts,event:$event,wd:$wd,bin:$bin,model:$model,argv:$argv} + (if $run != "" then {run:$run} else {} end)' >> "$lf"
 }
 confirm_run(){
   [ "$(get_cfg '.plugins.confirm_before_run')" = "true" ] || return 0
@@ -796,6 +798,8 @@ run_cmd(){
     audit_log "cancel" "$1" "${@:2}"
     return 130
   fi
+  # run id liga start/finish da mesma execução (pareamento exato nos relatórios)
+  local GEMX_RUN_ID; GEMX_RUN_ID="$(date -u +%s)-$$-$RANDOM"
   audit_log "start" "$1" "${@:2}"
   "$@"
   local st=$?
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+gemx_analytics.py — índice incremental dos logs de auditoria (audit-*.jsonl),
+compartilhado por gemx-stats-html.py, gemx-stats-md.py e gemx-stats.sh.
+
+- Para cada audit-*.jsonl o índice guarda o offset (bytes) já lido e contadores
+  pré-agregados por dia (UTC): execuções seguintes só parseiam os bytes novos.
+- Consultas por período (--since/--until) somam apenas as partições diárias do
+  intervalo, sem reabrir os arquivos de log.
+- O índice fica em <logdir>/.audit-index.json; se um arquivo for truncado,
+  substituído ou surgir fora de ordem, o índice é reconstruído do zero.
+- Pareamento start/finish: pelo campo "run" (emitido pelo gemx.sh) quando existe,
+  senão por fila FIFO (deque) por hash de (bin, argv). Starts órfãos expiram após
+  ORPHAN_TTL e cada fila é limitada a MAX_OPEN_PER_SIG, então a memória é limitada.
+- --jobs N parseia os arquivos num pool de processos; o reduce (soma e pareamento)
+  segue a ordem dos arquivos, então o resultado não depende de N.
+- Durações guardadas como histograma log (≈5% de erro relativo), combinável entre
+  dias: dá mediana/p95/p99 por comando e por modelo.
+
+Uso:
+  python3 gemx_analytics.py [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--top N] [--json] [--logdir DIR] [--rebuild] [--jobs N]
+"""
+import os, sys, json, argparse, datetime, glob, tempfile, hashlib, math
+from collections import Counter, deque
+
+INDEX_VERSION = 2
+INDEX_NAME = ".audit-index.json"
+ORPHAN_TTL = 48 * 3600          # s; starts sem finish além disso são descartados
+MAX_OPEN_PER_SIG = 256
+BUCKET_BASE = 0.001             # 1 ms
+BUCKET_GROWTH = 1.05
+
+def parse_date(s):
+    return datetime.datetime.strptime(s, "%Y-%m-%d").date()
+
+def default_logdir():
+    return os.path.join(os.environ.get("GEMX_HOME") or os.path.expanduser("~/.config/gemx"), "logs")
+
+def _empty_day():
+    return {"events": {}, "cmds": {}, "models": {}, "dur": {}, "dur_models": {}}
+
+def _inc(d, k, n=1):
+    d[k] = d.get(k, 0) + n
+
+def _signature(obj, argv):
+    run = obj.get("run")
+    if run:
+        return "r:" + run
+    raw = obj.get("bin", "") + "\x1f" + json.dumps(argv, sort_keys=True)
+    return "s:" + hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+def _bucket(seconds):
+    return max(0, math.ceil(math.log(max(seconds, BUCKET_BASE) / BUCKET_BASE, BUCKET_GROWTH)))
+
+def _bucket_value(b):
+    return BUCKET_BASE * BUCKET_GROWTH ** int(b)
+
+def _add_duration(table, key, seconds):
+    entry = table.setdefault(key, [0.0, 0, {}])
+    entry[0] += seconds
+    entry[1] += 1
+    _inc(entry[2], str(_bucket(seconds)))
+
+def _quantile(hist, total, q):
+    """Valor (limite superior do bucket) do quantil q a partir do histograma."""
+    target = q * total
+    acc = 0
+    for b in sorted(hist, key=int):
+        acc += hist[b]
+        if acc >= target:
+            return _bucket_value(b)
+    return 0.0
+
+
+def resolve_jobs(jobs):
+    """--jobs 0 (ou negativo) usa todos os núcleos."""
+    return jobs if jobs and jobs > 0 else (os.cpu_count() or 1)
+
+def parallel_map(fn, items, jobs=1):
+    """map() ordenado: serial com jobs=1, num pool de processos caso contrário.
+
+    Os resultados chegam na ordem de `items`, o que mantém o reduce determinístico.
+    """
+    items = list(items)
+    jobs = min(resolve_jobs(jobs), len(items))
+    if jobs <= 1:
+        return map(fn, items)
+    from concurrent.futures import ProcessPoolExecutor
+    def _results():
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            yield from ex.map(fn, items)
+    return _results()
+
+def _parse_audit_file(task):
+    """Map: parseia as linhas completas de um audit-*.jsonl a partir de `offset`.
+
+    Retorna (nome, inode, bytes consumidos, agregados por dia sem durações,
+    eventos de pareamento em ordem, maior timestamp). Os eventos de pareamento são
+    (sig, epoch, None) para start e (sig, epoch, (dia, cmd, modelo)) para finish.
+    """
+    path, offset = task
+    name = os.path.basename(path)
+    st = os.stat(path)
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        chunk = fh.read()
+    end = chunk.rfind(b"\n") + 1   # só consome linhas completas
+    days, pairs, last_ts = {}, [], 0.0
+    if end <= 0:
+        return name, st.st_ino, 0, days, pairs, last_ts
+    for raw in chunk[:end].splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except Exception:
+            continue
+        ts = obj.get("ts")
+        if not ts:
+            continue
+        try:
+            dt = datetime.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        except Exception:
+            continue
+        iso = dt.date().isoformat()
+        day = days.get(iso)
+        if day is None:
+            day = days[iso] = _empty_day()
+        ev = obj.get("event")
+        _inc(day["events"], ev)
+        argv = obj.get("argv") or []
+        cmd = argv[0] if argv else "(none)"
+        epoch = dt.timestamp()
+        if epoch > last_ts:
+            last_ts = epoch
+        if ev == "start":
+            pairs.append((_signature(obj, argv), epoch, None))
+        elif ev == "finish":
+            model = obj.get("model", "unknown")
+            pairs.append((_signature(obj, argv), epoch, (iso, cmd, model)))
+            _inc(day["cmds"], cmd)
+            _inc(day["models"], model)
+    return name, st.st_ino, end, days, pairs, last_ts
+
+
+class Report:
+    """Agregados de um período, no formato usado pelos relatórios."""
+    def __init__(self):
+        self.events = Counter()
+        self.cmd_finish = Counter()
+        self.model_finish = Counter()
+        self.daily_finish = Counter()   # date -> finishes
+        self.dur_sum = Counter()
+        self.dur_n = Counter()
+        self.dur_hist = {}              # comando -> Counter(bucket)
+        self.model_dur = {}             # modelo -> [soma, n, Counter(bucket)]
+
+    def add_day(self, day, agg):
+        self.events.update(agg["events"])
+        self.cmd_finish.update(agg["cmds"])
+        self.model_finish.update(agg["models"])
+        finishes = agg["events"].get("finish", 0)
+        if finishes:
+            self.daily_finish[day] += finishes
+        for cmd, (s, n, hist) in agg["dur"].items():
+            self.dur_sum[cmd] += s
+            self.dur_n[cmd] += n
+            self.dur_hist.setdefault(cmd, Counter()).update(hist)
+        for model, (s, n, hist) in agg["dur_models"].items():
+            entry = self.model_dur.setdefault(model, [0.0, 0, Counter()])
+            entry[0] += s
+            entry[1] += n
+            entry[2].update(hist)
+
+    def durations(self):
+        """[(comando, n, média_s)] ordenado pela média, como nos relatórios."""
+        items = [(cmd, self.dur_n[cmd], int(round(self.dur_sum[cmd] / max(1, self.dur_n[cmd])))) for cmd in self.dur_n]
+        items.sort(key=lambda x: x[2], reverse=True)
+        return items
+
+    def duration_stats(self, by="cmd"):
+        """[(chave, n, média, p50, p95, p99)] em segundos, por comando ou por modelo."""
+        if by == "model":
+            source = {k: (s, n, h) for k, (s, n, h) in self.model_dur.items()}
+        else:
+            source = {k: (self.dur_sum[k], self.dur_n[k], self.dur_hist.get(k, {})) for k in self.dur_n}
+        items = []
+        for key, (s, n, hist) in source.items():
+            if not n:
+                continue
+            items.append((key, n, round(s / n, 1),
+                          round(_quantile(hist, n, 0.50), 1),
+                          round(_quantile(hist, n, 0.95), 1),
+                          round(_quantile(hist, n, 0.99), 1)))
+        items.sort(key=lambda x: x[2], reverse=True)
+        return items
+
+    def to_json(self, top=None):
+        return {
+            "events": dict(sorted(self.events.items(), key=lambda x: str(x[0]))),
+            "top_commands": self.cmd_finish.most_common(top),
+            "models": self.model_finish.most_common(top),
+            "durations": [{"cmd": c, "n": n, "avg_s": a, "p50_s": p50, "p95_s": p95, "p99_s": p99}
+                          for c, n, a, p50, p95, p99 in self.duration_stats("cmd")],
+            "durations_by_model": [{"model": m, "n": n, "avg_s": a, "p50_s": p50, "p95_s": p95, "p99_s": p99}
+                                   for m, n, a, p50, p95, p99 in self.duration_stats("model")],
+            "daily": [(d.isoformat(), c) for d, c in sorted(self.daily_finish.items())],
+        }
+
+
+class AuditIndex:
+    def __init__(self, logdir):
+        self.logdir = logdir
+        self.path = os.path.join(logdir, INDEX_NAME)
+        self.data = self._load()
+        self.parsed_bytes = 0
+
+    def _fresh(self):
+        return {"version": INDEX_VERSION, "files": {}, "open_starts": {}, "orphans": 0, "last_ts": 0.0}
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if data.get("version") == INDEX_VERSION:
+                data["open_starts"] = {k: deque(v) for k, v in data["open_starts"].items()}
+                return data
+        except (OSError, ValueError):
+            pass
+        return self._fresh()
+
+    def save(self):
+        data = dict(self.data, open_starts={k: list(v) for k, v in self.data["open_starts"].items()})
+        fd, tmp = tempfile.mkstemp(dir=self.logdir, prefix=".audit-index.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _prune_orphans(self):
+        """Descarta starts sem finish há mais de ORPHAN_TTL (relativo ao último evento)."""
+        horizon = self.data["last_ts"] - ORPHAN_TTL
+        open_starts = self.data["open_starts"]
+        for sig in list(open_starts):
+            queue = open_starts[sig]
+            while queue and queue[0] < horizon:
+                queue.popleft()
+                self.data["orphans"] += 1
+            if not queue:
+                del open_starts[sig]
+
+    def _needs_rebuild(self, paths):
+        files = self.data["files"]
+        names = [os.path.basename(p) for p in paths]
+        indexed = sorted(files)
+        last = indexed[-1] if indexed else ""
+        for p, name in zip(paths, names):
+            meta = files.get(name)
+            if meta is None:
+                # arquivo novo mais antigo que o último indexado: pareamento start/finish mudaria
+                if name < last:
+                    return True
+                continue
+            st = os.stat(p)
+            if st.st_ino != meta["ino"] or st.st_size < meta["offset"]:
+                return True
+        return False
+
+    def update(self, rebuild=False, jobs=1):
+        """Indexa os bytes novos de cada audit-*.jsonl. Retorna o total de bytes parseados.
+
+        Com jobs > 1 o parse dos arquivos roda num pool de processos (map) e o
+        pareamento start/finish é aplicado aqui, na ordem dos arquivos (reduce),
+        então o índice resultante é idêntico ao da execução serial.
+        """
+        paths = sorted(glob.glob(os.path.join(self.logdir, "audit-*.jsonl")))
+        if rebuild or self._needs_rebuild(paths):
+            self.data = self._fresh()
+        present = {os.path.basename(p) for p in paths}
+        for name in list(self.data["files"]):
+            if name not in present:
+                del self.data["files"][name]
+        tasks = []
+        for p in paths:
+            meta = self.data["files"].get(os.path.basename(p))
+            offset = meta["offset"] if meta else 0
+            if os.stat(p).st_size != offset:
+                tasks.append((p, offset))
+        for result in parallel_map(_parse_audit_file, tasks, jobs):
+            self._apply(result)
+        self._prune_orphans()
+        if os.path.isdir(self.logdir):
+            self.save()
+        return self.parsed_bytes
+
+    def _apply(self, result):
+        """Reduce: soma os agregados diários de um arquivo e pareia start/finish."""
+        name, ino, consumed, days_part, pairs, last_ts = result
+        meta = self.data["files"].setdefault(name, {"ino": ino, "offset": 0, "days": {}})
+        if not consumed:
+            return
+        self.parsed_bytes += consumed
+        meta["offset"] += consumed
+        if last_ts > self.data["last_ts"]:
+            self.data["last_ts"] = last_ts
+        days = meta["days"]
+        for iso, part in days_part.items():
+            day = days.get(iso)
+            if day is None:
+                days[iso] = part
+                continue
+            for k in ("events", "cmds", "models"):
+                for key, n in part[k].items():
+                    _inc(day[k], key, n)
+        open_starts = self.data["open_starts"]
+        for sig, epoch, finish in pairs:
+            if finish is None:
+                queue = open_starts.get(sig)
+                if queue is None:
+                    queue = open_starts[sig] = deque()
+                if len(queue) >= MAX_OPEN_PER_SIG:
+                    queue.popleft()
+                    self.data["orphans"] += 1
+                queue.append(epoch)
+                continue
+            queue = open_starts.get(sig)
+            if not queue:
+                continue
+            dur = max(0.0, epoch - queue.popleft())
+            if not queue:
+                del open_starts[sig]
+            iso, cmd, model = finish
+            day = days.get(iso)
+            if day is None:
+                day = days[iso] = _empty_day()
+            _add_duration(day["dur"], cmd, dur)
+            _add_duration(day["dur_models"], model, dur)
+
+    def days(self):
+        """Datas (UTC) presentes no índice."""
+        out = set()
+        for meta in self.data["files"].values():
+            out.update(parse_date(d) for d in meta["days"])
+        return sorted(out)
+
+    def report(self, since=None, until=None):
+        rep = Report()
+        for meta in self.data["files"].values():
+            for d, agg in meta["days"].items():
+                day = parse_date(d)
+                if since and day < since:
+                    continue
+                if until and day > until:
+                    continue
+                rep.add_day(day, agg)
+        return rep
+
+
+def load_report(logdir, since=None, until=None, rebuild=False, jobs=1):
+    """Atualiza o índice de `logdir` e retorna o Report do período."""
+    idx = AuditIndex(logdir)
+    idx.update(rebuild=rebuild, jobs=jobs)
+    return idx.report(since, until)
+
+
+def print_text(rep, logdir, top):
+    print(f"=== Estatísticas de auditoria ({logdir}) ===")
+    print()
+    print("[Eventos]")
+    for e, n in sorted(rep.events.items(), key=lambda x: str(x[0])):
+        print(f"  {str(e):<10} {n:8d}")
+    print()
+    print("[Top comandos (finish)]")
+    for k, n in rep.cmd_finish.most_common(top):
+        print(f"  {k:<30} {n:8d}")
+    print()
+    print("[Modelos]")
+    for k, n in rep.model_finish.most_common(top):
+        print(f"  {k:<30} {n:8d}")
+    print()
+    for label, by in (("comando", "cmd"), ("modelo", "model")):
+        print(f"[Duração por {label} (s)]")
+        print(f"  {label:<20}  {'n':>8}  {'avg':>8}  {'p50':>8}  {'p95':>8}  {'p99':>8}")
+        for key, n, avg, p50, p95, p99 in rep.duration_stats(by):
+            print(f"  {str(key):<20}  {n:8d}  {avg:8}  {p50:8}  {p95:8}  {p99:8}")
+        print()
+    print("[Série diária (finish)]")
+    for d, c in sorted(rep.daily_finish.items()):
+        print(f"  {d.isoformat()}  {c:6d}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--since", type=str, default=None)
+    ap.add_argument("--until", type=str, default=None)
+    ap.add_argument("--logdir", type=str, default=default_logdir())
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--rebuild", action="store_true", help="Descarta o índice e reindexa tudo.")
+    ap.add_argument("--jobs", type=int, default=int(os.environ.get("GEMX_STATS_JOBS", "1")),
+                    help="Processos para parsear os logs (0 = todos os núcleos).")
+    args = ap.parse_args()
+    if not os.path.isdir(args.logdir):
+        print(f"[ERR] Sem diretório de logs: {args.logdir}")
+        sys.exit(1)
+    since = parse_date(args.since) if args.since else None
+    until = parse_date(args.until) if args.until else None
+    rep = load_report(args.logdir, since, until, rebuild=args.rebuild, jobs=args.jobs)
+    if args.json:
+        json.dump(rep.to_json(args.top), sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print_text(rep, args.logdir, args.top)
+
+if __name__ == "__main__":
+    main()
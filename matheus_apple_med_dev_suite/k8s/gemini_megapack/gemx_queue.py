@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+gemx_queue.py — fila de jobs durável (SQLite em WAL) usada por queue.sh e queue-runner.sh.
+
+- Cada job é um comando (`bash -lc`) com prioridade; enfileirar só grava a linha no banco.
+  Assinar é um passo explícito (`add --sign` ou `sign ID...`): a atestação SHA-256 vai para
+  o mesmo ledger do sign-job.sh (.attest/attest-YYYYMMDD.jsonl), com "file":"queue:<id>".
+  Até ser assinado o job fica como unsigned, fora do alcance do runner; o sign o passa a queued.
+- O runner pega jobs com lease (visibility timeout): enquanto o job roda, o lease é
+  renovado; se o runner morrer, o lease expira e o job volta para a fila.
+- Antes de executar, o hash do comando é conferido contra o ledger (como o verify-job.sh,
+  mas o ledger é lido uma vez e só relido quando muda). Atestação divergente: job rejeitado.
+- Falhas são refeitas até max_attempts com backoff exponencial; depois ficam como failed.
+- `run --workers N` executa N jobs em paralelo; ao final imprime vazão e latências
+  (espera na fila e execução, p50/p95). `stats` mostra o mesmo a partir do banco.
+
+Uso:
+  python3 gemx_queue.py add [--sign] [--priority N] [--max-attempts N] -- comando...
+  python3 gemx_queue.py sign ID [ID...]  # atesta jobs já enfileirados
+  python3 gemx_queue.py run [--workers N] [--visibility SEC] [--follow]
+  python3 gemx_queue.py list [--state unsigned|queued|running|done|failed|rejected]
+  python3 gemx_queue.py stats [--window-min 60] [--json]
+  python3 gemx_queue.py migrate        # importa .queue/*.job assinados (formato antigo)
+  python3 gemx_queue.py purge [--older-than-days 7]
+"""
+import os, sys, json, glob, time, socket, getpass, hashlib, sqlite3, argparse, datetime, tempfile, threading, subprocess
+
+QUEUE_DIR = ".queue"
+ATTEST_DIR = ".attest"
+DB_PATH = os.environ.get("GEMX_QUEUE_DB", os.path.join(QUEUE_DIR, "queue.db"))
+VISIBILITY = 300          # s de lease sem renovação antes de o job voltar para a fila
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 5          # s; dobra a cada tentativa
+BACKOFF_MAX = 300
+POLL = 1.0
+STATES = ("unsigned", "queued", "running", "done", "failed", "rejected")
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS jobs(
+  id           INTEGER PRIMARY KEY,
+  cmd          TEXT NOT NULL,
+  sha256       TEXT NOT NULL,
+  priority     INTEGER NOT NULL DEFAULT 0,
+  state        TEXT NOT NULL DEFAULT 'unsigned',
+  attempts     INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 3,
+  enqueued_at  REAL NOT NULL,
+  available_at REAL NOT NULL,
+  lease_owner  TEXT,
+  lease_until  REAL,
+  started_at   REAL,
+  finished_at  REAL,
+  exit_code    INTEGER,
+  error        TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(state, priority DESC, available_at, id);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs(state, lease_until);
+"""
+
+def job_sha256(cmd):
+    """Mesmo hash que o sign-job.sh calcula sobre o arquivo .job (comando + \\n)."""
+    return hashlib.sha256((cmd + "\n").encode("utf-8")).hexdigest()
+
+def connect(path=DB_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    con = sqlite3.connect(path, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA busy_timeout=30000")
+    con.executescript(SCHEMA_SQL)
+    return con
+
+# --- atestação (ledger do sign-job.sh) ---
+
+def attest(cmd, sha, ref):
+    """Acrescenta a atestação no ledger do dia, no formato do sign-job.sh."""
+    os.makedirs(ATTEST_DIR, exist_ok=True)
+    rec = {"ts": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+           "who": f"{getpass.getuser()}@{socket.gethostname()}", "job": cmd, "sha256": sha, "file": ref}
+    path = os.path.join(ATTEST_DIR, f"attest-{datetime.datetime.now(datetime.timezone.utc):%Y%m%d}.jsonl")
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+class Ledger:
+    """Pares (file, sha256) atestados; relê os .jsonl só quando algum muda."""
+    def __init__(self, attest_dir=ATTEST_DIR):
+        self.attest_dir = attest_dir
+        self.stamp = None
+        self.entries = set()
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        files = sorted(glob.glob(os.path.join(self.attest_dir, "*.jsonl")))
+        stamp = tuple((p, os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in files)
+        if stamp == self.stamp:
+            return
+        entries = set()
+        for p in files:
+            with open(p, "r", encoding="utf-8", errors="replace") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries.add((rec.get("file"), rec.get("sha256")))
+        self.entries, self.stamp = entries, stamp
+
+    def verify(self, ref, sha):
+        with self.lock:
+            self._refresh()
+            return (ref, sha) in self.entries
+
+# --- operações da fila ---
+
+def enqueue(con, cmd, priority=0, max_attempts=MAX_ATTEMPTS):
+    """Grava o job como unsigned: o runner só o vê depois de mark_signed."""
+    now = time.time()
+    sha = job_sha256(cmd)
+    cur = con.execute(
+        "INSERT INTO jobs(cmd, sha256, priority, state, max_attempts, enqueued_at, available_at) "
+        "VALUES(?,?,?,'unsigned',?,?,?)",
+        (cmd, sha, priority, max_attempts, now, now))
+    return cur.lastrowid, sha
+
+def mark_signed(con, job_id):
+    """unsigned -> queued, depois de a atestação estar no ledger; a espera conta a partir daqui."""
+    now = time.time()
+    con.execute("UPDATE jobs SET state='queued', enqueued_at=?, available_at=? WHERE id=? AND state='unsigned'",
+                (now, now, job_id))
+
+def lease(con, owner, visibility=VISIBILITY):
+    """Pega o próximo job disponível (maior prioridade, mais antigo) e o marca como running."""
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        # leases vencidos (runner morreu): volta para a fila ou esgota as tentativas
+        con.execute("UPDATE jobs SET state='failed', finished_at=?, error='lease expirado' "
+                    "WHERE state='running' AND lease_until<? AND attempts>=max_attempts", (now, now))
+        con.execute("UPDATE jobs SET state='queued', lease_owner=NULL, available_at=? "
+                    "WHERE state='running' AND lease_until<?", (now, now))
+        row = con.execute("SELECT id, cmd, sha256, attempts, max_attempts, enqueued_at FROM jobs "
+                          "WHERE state='queued' AND available_at<=? ORDER BY priority DESC, available_at, id LIMIT 1",
+                          (now,)).fetchone()
+        if row:
+            con.execute("UPDATE jobs SET state='running', lease_owner=?, lease_until=?, attempts=attempts+1, started_at=? "
+                        "WHERE id=?", (owner, now + visibility, now, row[0]))
+        con.execute("COMMIT")
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    if not row:
+        return None
+    return {"id": row[0], "cmd": row[1], "sha256": row[2], "attempt": row[3] + 1,
+            "max_attempts": row[4], "enqueued_at": row[5], "started_at": now}
+
+def renew(con, job_id, owner, visibility=VISIBILITY):
+    """Renova o lease; False se outro runner assumiu o job."""
+    cur = con.execute("UPDATE jobs SET lease_until=? WHERE id=? AND state='running' AND lease_owner=?",
+                      (time.time() + visibility, job_id, owner))
+    return cur.rowcount == 1
+
+def complete(con, job, owner, code, error=""):
+    """Registra o resultado; falhas voltam para a fila com backoff até max_attempts."""
+    now = time.time()
+    if code == 0:
+        state, available = "done", None
+    elif job["attempt"] < job["max_attempts"]:
+        state, available = "queued", now + min(BACKOFF_BASE * 2 ** (job["attempt"] - 1), BACKOFF_MAX)
+    else:
+        state, available = "failed", None
+    cur = con.execute(
+        "UPDATE jobs SET state=?, available_at=COALESCE(?, available_at), finished_at=?, exit_code=?, error=?, "
+        "lease_owner=NULL, lease_until=NULL WHERE id=? AND lease_owner=?",
+        (state, available, now, code, error[-2000:] or None, job["id"], owner))
+    return state if cur.rowcount == 1 else "lost"
+
+def reject(con, job, owner, reason):
+    con.execute("UPDATE jobs SET state='rejected', finished_at=?, error=?, lease_owner=NULL, lease_until=NULL "
+                "WHERE id=? AND lease_owner=?", (time.time(), reason, job["id"], owner))
+
+def next_available(con):
+    """Segundos até o próximo job enfileirado ficar disponível (None se a fila está vazia)."""
+    row = con.execute("SELECT MIN(available_at) FROM jobs WHERE state='queued'").fetchone()
+    return None if row[0] is None else max(0.0, row[0] - time.time())
+
+# --- runner ---
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+class RunnerMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.waits, self.runs = [], []
+
+    def record(self, state, wait=None, run=None):
+        with self.lock:
+            self.counts[state] = self.counts.get(state, 0) + 1
+            if wait is not None:
+                self.waits.append(wait)
+                self.runs.append(run)
+
+def execute(con, job, owner, visibility):
+    """Roda `bash -lc cmd` renovando o lease; retorna (código, saída) ou None se o lease foi perdido."""
+    with tempfile.TemporaryFile() as out:
+        proc = subprocess.Popen(["bash", "-lc", job["cmd"]], stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT)
+        while True:
+            try:
+                proc.wait(timeout=visibility / 3)
+                break
+            except subprocess.TimeoutExpired:
+                if not renew(con, job["id"], owner, visibility):
+                    proc.kill()
+                    proc.wait()
+                    return None
+        out.seek(0)
+        return proc.returncode, out.read().decode("utf-8", "replace")
+
+def worker(wid, args, ledger, metrics, stop, print_lock):
+    con = connect(args.db)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{wid}"
+    try:
+        while not stop.is_set():
+            job = lease(con, owner, args.visibility)
+            if job is None:
+                delay = next_available(con)
+                if delay is None and not args.follow:
+                    return
+                stop.wait(min(delay if delay is not None else args.poll, args.poll))
+                continue
+            tag = f"[QUEUE #{job['id']}]"
+            if job_sha256(job["cmd"]) != job["sha256"] or not ledger.verify(f"queue:{job['id']}", job["sha256"]):
+                reject(con, job, owner, "atestação sha256 ausente ou divergente")
+                metrics.record("rejected")
+                with print_lock:
+                    print(f"{tag} assinatura inválida, descartado.")
+                continue
+            result = execute(con, job, owner, args.visibility)
+            if result is None:
+                metrics.record("lost")
+                with print_lock:
+                    print(f"{tag} lease perdido; o job foi assumido por outro runner.")
+                continue
+            code, output = result
+            state = complete(con, job, owner, code, "" if code == 0 else output)
+            finished = time.time()
+            metrics.record("retry" if state == "queued" else state,
+                           job["started_at"] - job["enqueued_at"], finished - job["started_at"])
+            with print_lock:
+                print(f"{tag} {job['cmd']}  → {state} (código {code}, tentativa {job['attempt']}/{job['max_attempts']}, "
+                      f"{finished - job['started_at']:.1f}s)")
+                if output.strip():
+                    print(output.rstrip())
+    finally:
+        con.close()
+
+def cmd_run(args):
+    ledger, metrics, stop, print_lock = Ledger(), RunnerMetrics(), threading.Event(), threading.Lock()
+    threads = [threading.Thread(target=worker, args=(i, args, ledger, metrics, stop, print_lock), daemon=True)
+               for i in range(max(1, args.workers))]
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    try:
+        for th in threads:
+            while th.is_alive():
+                th.join(0.5)
+    except KeyboardInterrupt:
+        # jobs em andamento ficam com o lease e voltam para a fila quando ele vencer
+        print("[QUEUE] interrompido; aguardando os jobs em andamento...")
+        stop.set()
+        for th in threads:
+            th.join()
+    elapsed = time.perf_counter() - t0
+    total = sum(metrics.counts.values())
+    summary = " ".join(f"{k}={v}" for k, v in sorted(metrics.counts.items())) or "nenhum job"
+    print(f"[QUEUE] done. {summary} em {elapsed:.1f}s ({total / elapsed if elapsed else 0:.2f} jobs/s, workers={args.workers})")
+    if metrics.waits:
+        print(f"[QUEUE] espera p50={percentile(metrics.waits, .5):.2f}s p95={percentile(metrics.waits, .95):.2f}s | "
+              f"execução p50={percentile(metrics.runs, .5):.2f}s p95={percentile(metrics.runs, .95):.2f}s")
+    return 1 if metrics.counts.get("failed") else 0
+
+# --- comandos auxiliares ---
+
+def cmd_add(args):
+    # só o "--" separador inicial sai; um "--" dentro do comando é argumento dele
+    parts = args.command[1:] if args.command[:1] == ["--"] else args.command
+    cmd = " ".join(parts)
+    if not cmd.strip():
+        print("[QUEUE] comando vazio.", file=sys.stderr)
+        return 1
+    con = connect(args.db)
+    job_id, sha = enqueue(con, cmd, args.priority, args.max_attempts)
+    print(f"[QUEUE] added: #{job_id} (prioridade {args.priority}) sha256={sha}")
+    if args.sign:
+        attest(cmd, sha, f"queue:{job_id}")
+        mark_signed(con, job_id)
+        print(f"[SIGN] queue:{job_id} sha256={sha}")
+    else:
+        print(f"[QUEUE] não assinado: o runner só pega #{job_id} depois de 'gemx_queue.py sign {job_id}'.")
+    return 0
+
+def cmd_sign(args):
+    """Atesta jobs unsigned e os libera para o runner (passo explícito, como o sign-job.sh)."""
+    con = connect(args.db)
+    rc = 0
+    for job_id in args.ids:
+        row = con.execute("SELECT cmd, sha256, state FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            print(f"[SIGN] #{job_id} não existe.", file=sys.stderr)
+            rc = 1
+            continue
+        cmd, sha, state = row
+        if state not in ("unsigned", "queued"):  # queued: reassina linhas de antes do estado unsigned
+            print(f"[SIGN] #{job_id} não está na fila (state={state}).", file=sys.stderr)
+            rc = 1
+            continue
+        if job_sha256(cmd) != sha:
+            print(f"[SIGN] #{job_id} comando não confere com o sha256 gravado.", file=sys.stderr)
+            rc = 1
+            continue
+        attest(cmd, sha, f"queue:{job_id}")
+        mark_signed(con, job_id)
+        print(f"[SIGN] queue:{job_id} sha256={sha}  {cmd}")
+    return rc
+
+def cmd_list(args):
+    con = connect(args.db)
+    sql = "SELECT id, state, priority, attempts, max_attempts, cmd FROM jobs"
+    params = ()
+    if args.state:
+        sql, params = sql + " WHERE state=?", (args.state,)
+    for row in con.execute(sql + " ORDER BY id DESC LIMIT ?", params + (args.limit,)):
+        print(f"#{row[0]:<6} {row[1]:<9} p={row[2]:<3} {row[3]}/{row[4]}  {row[5]}")
+    return 0
+
+def queue_stats(con, window_min=60):
+    now = time.time()
+    counts = dict(con.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+    rows = con.execute("SELECT started_at - enqueued_at, finished_at - started_at FROM jobs "
+                       "WHERE state='done' AND finished_at>=?", (now - window_min * 60,)).fetchall()
+    waits, runs = [r[0] for r in rows], [r[1] for r in rows]
+    return {
+        "states": {s: counts.get(s, 0) for s in STATES},
+        "window_min": window_min,
+        "done_in_window": len(rows),
+        "throughput_per_min": round(len(rows) / window_min, 3) if window_min else 0.0,
+        "wait_p50": round(percentile(waits, .5), 3), "wait_p95": round(percentile(waits, .95), 3),
+        "run_p50": round(percentile(runs, .5), 3), "run_p95": round(percentile(runs, .95), 3),
+    }
+
+def cmd_stats(args):
+    st = queue_stats(connect(args.db), args.window_min)
+    if args.json:
+        print(json.dumps(st, ensure_ascii=False, indent=2))
+        return 0
+    print("[QUEUE] " + " ".join(f"{k}={v}" for k, v in st["states"].items()))
+    print(f"[QUEUE] últimos {st['window_min']} min: {st['done_in_window']} concluídos "
+          f"({st['throughput_per_min']:.2f}/min) | espera p50={st['wait_p50']:.2f}s p95={st['wait_p95']:.2f}s | "
+          f"execução p50={st['run_p50']:.2f}s p95={st['run_p95']:.2f}s")
+    return 0
+
+def cmd_migrate(args):
+    """Importa .queue/*.job do formato antigo; só os que têm atestação válida no ledger."""
+    con = connect(args.db)
+    ledger = Ledger()
+    added = skipped = 0
+    for path in sorted(glob.glob(os.path.join(QUEUE_DIR, "*.job"))):
+        with open(path, "rb") as fh:
+            data = fh.read()
+        sha = hashlib.sha256(data).hexdigest()
+        if not ledger.verify(path, sha):
+            print(f"[QUEUE] sem atestação válida, mantido: {path}")
+            skipped += 1
+            continue
+        cmd = data.decode("utf-8").rstrip("\n")
+        job_id, job_sha = enqueue(con, cmd, args.priority, args.max_attempts)
+        # a atestação do .job acabou de ser conferida: transfere-a para a referência na fila
+        attest(cmd, job_sha, f"queue:{job_id}")
+        mark_signed(con, job_id)
+        os.remove(path)
+        added += 1
+    print(f"[QUEUE] migrados: {added}, mantidos: {skipped}")
+    return 0
+
+def cmd_purge(args):
+    con = connect(args.db)
+    cur = con.execute("DELETE FROM jobs WHERE state IN ('done','failed','rejected') AND finished_at<?",
+                      (time.time() - args.older_than_days * 86400,))
+    print(f"[QUEUE] removidos: {cur.rowcount}")
+    return 0
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Fila de jobs durável (SQLite/WAL).")
+    ap.add_argument("--db", default=DB_PATH)
+    sub = ap.add_subparsers(dest="action", required=True)
+    p = sub.add_parser("add", help="Enfileira um comando (sem --sign, assine depois com 'sign').")
+    p.add_argument("--sign", action="store_true", help="Atesta o comando no ledger ao enfileirar.")
+    p.add_argument("--priority", type=int, default=0, help="Maior roda primeiro.")
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    p.add_argument("command", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_add)
+    p = sub.add_parser("sign", help="Atesta jobs unsigned no ledger e os libera para o runner.")
+    p.add_argument("ids", type=int, nargs="+")
+    p.set_defaults(func=cmd_sign)
+    p = sub.add_parser("run", help="Processa a fila.")
+    p.add_argument("--workers", type=int, default=int(os.environ.get("GEMX_QUEUE_WORKERS", "1")))
+    p.add_argument("--visibility", type=float, default=VISIBILITY, help="Lease (s); renovado enquanto o job roda.")
+    p.add_argument("--poll", type=float, default=POLL)
+    p.add_argument("--follow", action="store_true", help="Continua aguardando novos jobs.")
+    p.set_defaults(func=cmd_run)
+    p = sub.add_parser("list")
+    p.add_argument("--state", choices=STATES)
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_list)
+    p = sub.add_parser("stats")
+    p.add_argument("--window-min", type=float, default=60)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_stats)
+    p = sub.add_parser("migrate")
+    p.add_argument("--priority", type=int, default=0)
+    p.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    p.set_defaults(func=cmd_migrate)
+    p = sub.add_parser("purge")
+    p.add_argument("--older-than-days", type=float, default=7)
+    p.set_defaults(func=cmd_purge)
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    sys.exit(args.func(args))
+
+if __name__ == "__main__":
+    main()
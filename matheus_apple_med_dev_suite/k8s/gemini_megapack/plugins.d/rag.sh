@@ -3,11 +3,16 @@
 # Uso:
 #   ./plugins.d/rag.sh <kb_dir> <query> [max_bytes]
 # Saída: contexto concatenado limitado por bytes (default 20000)
+# Com o gemx (Python) instalado, usa o índice BM25 (`gemx rag search`): trechos em ordem
+# de relevância, índice atualizado só para arquivos alterados. RAG_GREP=1 força o rg.
 set -euo pipefail
 KB="${1:-./kb}"
 Q="${2:-}"
 MAX="${3:-20000}"
 [ -n "$Q" ] || { echo "[RAG] query vazia" >&2; exit 1; }
+if command -v gemx >/dev/null 2>&1 && [ "${RAG_GREP:-0}" != "1" ]; then
+  exec gemx rag search "$KB" "$Q" --max-bytes "$MAX"
+fi
 if ! command -v rg >/dev/null 2>&1; then echo "[RAG] ripgrep (rg) não instalado"; exit 2; fi
 tmp="$(mktemp)"; trap 'rm -f "$tmp"' EXIT
 rg -n --no-heading --line-number --color=never -S --glob '!*{.git,.cache,node_modules}/*' "$Q" "$KB" > "$tmp" || true
@@ -1,12 +1,10 @@
 #!/usr/bin/env bash
-# queue-runner.sh — processa itens ./.queue FIFO
+# queue-runner.sh — processa a fila (.queue/queue.db) com leases, retries e prioridades
+# Uso: ./queue-runner.sh [--workers N] [--visibility SEC] [--follow]
+# Jobs no formato antigo (.queue/*.job assinados) são importados antes de rodar.
 set -euo pipefail
-dir=".queue"
-[ -d "$dir" ] || { echo "[QUEUE] sem diretório .queue"; exit 0; }
-for f in $(ls -1 "$dir"/*.job 2>/dev/null | sort); do
-  ./verify-job.sh "$f" || { echo "[QUEUE] assinatura inválida, pulando $f"; rm -f "$f"; continue; }
-  echo "[QUEUE] run: $f -> $(cat "$f")"
-  bash -lc "$(cat "$f")" || echo "[QUEUE] erro em $f"
-  rm -f "$f"
-done
-echo "[QUEUE] done."
+Q="$(dirname "$0")/gemx_queue.py"
+if ls .queue/*.job >/dev/null 2>&1; then
+  python3 "$Q" migrate
+fi
+exec python3 "$Q" run "$@"
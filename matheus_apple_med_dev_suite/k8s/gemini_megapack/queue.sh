@@ -1,7 +1,6 @@
 #!/usr/bin/env bash
-# queue.sh — adiciona item na fila ./.queue
+# queue.sh — adiciona item na fila (SQLite em .queue/queue.db; assinatura em .attest/ com --sign)
+# Uso: ./queue.sh [--sign] [--priority N] [--max-attempts N] comando...
+# Sem --sign o job fica unsigned (o runner não o pega) até `python3 gemx_queue.py sign <id>`.
 set -euo pipefail
-mkdir -p .queue
-file=".queue/$(date +%s%N).job"
-printf "%s\n" "$*" > "$file"
-echo "[QUEUE] added: $file"
+exec python3 "$(dirname "$0")/gemx_queue.py" add "$@"
@@ -4,4 +4,126 @@ set -e
 echo "[TEST] jq version: $(jq --version)"
 [ -f ./gemx.sh ] && echo "[TEST] gemx.sh OK"
 [ -f ./others.json ] && jq -e '.' ./others.json >/dev/null && echo "[TEST] others.json OK"
+
+# as três cópias do cache de respostas são idênticas abaixo do cabeçalho (do primeiro import em diante)
+ROOT="$(git rev-parse --show-toplevel 2>/dev/null || true)"
+CORE="$ROOT/gemx_python/src/gemx/cache.py"
+if [ -n "$ROOT" ] && [ -f "$CORE" ]; then
+  body() { sed -n '/^import /,$p' "$1"; }
+  for copy in "$ROOT/Gemini_v2/gemx_web/cache.py" ./web/cache.py; do
+    if ! diff -u <(body "$CORE") <(body "$copy") >/dev/null; then
+      echo "[TEST] cache.py fora de sincronia com gemx_python: $copy"
+      diff -u <(body "$CORE") <(body "$copy") | head -40
+      exit 1
+    fi
+  done
+  echo "[TEST] cache.py (3 cópias) OK"
+else
+  echo "[TEST] cache.py: gemx_python não está neste checkout, pulado"
+fi
+
+HERE="$PWD"
+TMP="$(mktemp -d)"
+trap 'rm -rf "$TMP"' EXIT
+
+# fila: add sem --sign fica unsigned (o runner não pega), sign libera, run executa;
+# um job que sempre falha é refeito até max_attempts e termina como failed
+mkdir -p "$TMP/queue"
+q() { (cd "$TMP/queue" && python3 "$HERE/gemx_queue.py" --db "$TMP/queue/queue.db" "$@"); }
+qstate() { q stats --json | jq -r ".states.$1"; }
+q add -- 'echo fila-ok' >/dev/null
+q run >/dev/null
+[ "$(qstate unsigned)" = 1 ] && [ "$(qstate done)" = 0 ] || { echo "[TEST] queue: job sem assinatura não ficou unsigned"; exit 1; }
+q sign 1 >/dev/null
+q add --sign --max-attempts 2 -- 'exit 3' >/dev/null
+q run >/dev/null 2>&1 || true   # sai com 1 porque há job failed; os estados abaixo dizem o resto
+[ "$(qstate done)" = 1 ] && [ "$(qstate failed)" = 1 ] && [ "$(qstate unsigned)" = 0 ] \
+  || { echo "[TEST] queue: estados inesperados"; q list; exit 1; }
+q list --state failed | grep -q " 2/2 " || { echo "[TEST] queue: job failed sem as 2 tentativas"; q list; exit 1; }
+echo "[TEST] gemx_queue.py (add/sign/run, retry até failed) OK"
+
+# auditlog: cursores de tail/read/range continuam exatamente de onde pararam, atravessando
+# arquivos; a linha ainda sendo escrita só aparece depois de terminada
+mkdir -p "$TMP/audit"
+PYTHONPATH="$HERE/web" python3 - "$TMP/audit" <<'PY' || { echo "[TEST] auditlog: cursores inconsistentes"; exit 1; }
+import json, pathlib, sys
+from auditlog import AuditLog, Filters, parse_ts
+
+d = pathlib.Path(sys.argv[1])
+lines = {}
+for day, n in (("20240101", 30), ("20240102", 25)):
+    lines[day] = [json.dumps({"ts": f"{day[:4]}-{day[4:6]}-{day[6:]}T00:{i:02d}:00Z",
+                              "event": "gen" if i % 3 else "chat", "i": i}, separators=(",", ":"))
+                  for i in range(n)]
+    (d / f"audit-{day}.jsonl").write_text("".join(ln + "\n" for ln in lines[day]))
+every = lines["20240101"] + lines["20240102"]
+last = d / "audit-20240102.jsonl"
+with open(last, "a") as f:
+    f.write('{"ts":"2024-01-02T01:00:00Z","event":"gen","i":99')  # linha em andamento
+log, nof = AuditLog(d), Filters()
+
+# read_from de 7 em 7 a partir do início cobre tudo, sem repetir nem pular
+got, cur, eof = [], None, False
+while not eof:
+    page, cur, eof = log.read_from(cur, nof, limit=7)
+    got += page
+assert got == every, "read_from paginado"
+
+# cada cursor de tail_entries/read_entries retoma logo depois da sua linha
+entries, end = log.tail_entries(40, nof)
+assert [ln for ln, _ in entries] == every[-40:], "tail"
+for k, (_, c) in enumerate(entries):
+    assert log.read_from(c, nof, limit=1000)[0] == every[len(every) - 40 + k + 1:], f"cursor do tail #{k}"
+assert log.tail(5, Filters(event="chat"))[0] == [ln for ln in every if '"chat"' in ln][-5:], "tail filtrado"
+
+# o cursor final aponta para a linha incompleta; terminada, ela vem no próximo read
+assert log.read_from(end, nof)[0] == []
+with open(last, "a") as f:
+    f.write("}\n")
+assert log.read_from(end, nof)[0] == ['{"ts":"2024-01-02T01:00:00Z","event":"gen","i":99}'], "linha completada"
+
+# range paginado entre dias
+t0, t1 = parse_ts("2024-01-01T00:20:00Z"), parse_ts("2024-01-02T00:10:00Z")
+want = [ln for ln in every if t0 <= parse_ts(json.loads(ln)["ts"]) <= t1]
+got, cur, eof = [], None, False
+while not eof:
+    page, cur, eof = log.range(t0, t1, nof, limit=4, cursor=cur)
+    got += page
+assert got == want, "range paginado"
+PY
+echo "[TEST] auditlog (tail/read/range, cursores) OK"
+
+# gemx flow run (CLI em Python) com o backend fake: sem rede, HOME temporário
+if [ -n "$ROOT" ] && PYTHONPATH="$ROOT/gemx_python/src" python3 -c 'import gemx.main' 2>/dev/null; then
+  mkdir -p "$TMP/flow" "$TMP/home"
+  gemx() { HOME="$TMP/home" GEMX_BACKEND=fake PYTHONPATH="$ROOT/gemx_python/src" python3 -m gemx.main "$@" 2>/dev/null; }
+  steps() { jq -c '[.steps[] | [.name, (if .skipped then "skip" elif .ok then "ok" else "err" end)]]'; }
+  cat > "$TMP/flow/seq.yml" <<'YML'
+steps:
+  - {name: busca, run: rag, args: {query: ""}}
+  - {name: resposta, run: gen, prompt: "independente"}
+YML
+  cat > "$TMP/flow/needs.yml" <<'YML'
+steps:
+  - {name: a, run: gen, prompt: "primeiro", save_as: a}
+  - {name: b, run: gen, prompt: "segundo ${a}", needs: [a]}
+  - {name: busca, run: rag, args: {query: ""}}
+  - {name: dep, run: gen, prompt: "usa ${busca}", needs: [busca]}
+  - {name: livre, run: gen, prompt: "independente", needs: []}
+YML
+  # sequencial: sem --keep-going o flow para no erro; com ele os passos seguintes rodam
+  [ "$(gemx flow run "$TMP/flow/seq.yml" --json | steps)" = '[["busca","err"]]' ] \
+    || { echo "[TEST] flow: sequencial sem --keep-going"; exit 1; }
+  [ "$(gemx flow run "$TMP/flow/seq.yml" --json --keep-going | steps)" = '[["busca","err"],["resposta","ok"]]' ] \
+    || { echo "[TEST] flow: sequencial com --keep-going"; exit 1; }
+  # needs: só os dependentes do passo com erro são pulados; ${a} chega ao passo b
+  [ "$(gemx flow run "$TMP/flow/needs.yml" --json --keep-going | steps)" \
+    = '[["a","ok"],["b","ok"],["busca","err"],["dep","skip"],["livre","ok"]]' ] \
+    || { echo "[TEST] flow: needs com --keep-going"; exit 1; }
+  gemx flow run "$TMP/flow/needs.yml" --keep-going | grep -q "segundo .*primeiro" \
+    || { echo "[TEST] flow: saída de a não chegou a b"; exit 1; }
+  echo "[TEST] gemx flow run (fake; sequencial e needs) OK"
+else
+  echo "[TEST] gemx flow run: gemx_python indisponível neste checkout, pulado"
+fi
 echo "[TEST] DONE"
@@ -1,14 +1,16 @@
 # web/app.py
-import os, subprocess, json, pathlib, time
-from typing import Optional, List
+import os, subprocess, json, pathlib, time, asyncio, signal, codecs
+from typing import Optional, List, Tuple
 from fastapi import FastAPI, Depends, HTTPException, status, Request
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.responses import RedirectResponse
 from authlib.integrations.starlette_client import OAuth
-from fastapi.responses import JSONResponse, PlainTextResponse, HTMLResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from prometheus_client import CollectorRegistry, Counter, generate_latest, CONTENT_TYPE_LATEST
+from .cache import ResponseCache
+from .auditlog import AuditLog, CursorError, Filters, LogWatcher, parse_ts
 
 APP_ROOT = pathlib.Path(__file__).resolve().parents[1]
 HOME = pathlib.Path(os.environ.get("HOME", str(APP_ROOT / "home")))
@@ -74,6 +76,40 @@ if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET:
 REG = CollectorRegistry()
 REQS = Counter("gemx_web_requests_total","web requests",["path"], registry=REG)
 CMDS = Counter("gemx_commands_total","gemx CLI invocations",["cmd"], registry=REG)
+CACHE_LOOKUPS = Counter("gemx_cache_lookups_total","response cache lookups",["result"], registry=REG)
+CACHE_EVICTIONS = Counter("gemx_cache_evictions_total","response cache LRU evictions", registry=REG)
+
+# Cache de respostas (mesmo formato/diretório do CLI: $GEMX_HOME/cache); em handlers async,
+# chave, leitura e escrita rodam via asyncio.to_thread para não bloquear o loop
+RESP_CACHE = ResponseCache()
+
+def _gen_cache_key(payload) -> Optional[str]:
+    """Chave de cache para `gemx.sh gen`: modelo forçado/config, temperatura e system do config.json."""
+    try:
+        cfg = json.loads((GEMX_HOME / "config.json").read_text(encoding="utf-8"))
+    except Exception:
+        cfg = {}
+    temp = cfg.get("temperature", 0.2)
+    temperature = float(temp) if isinstance(temp, (int, float)) else 0.2
+    if not RESP_CACHE.cacheable(temperature, bypass=payload.no_cache):
+        CACHE_LOOKUPS.labels("bypass").inc()
+        return None
+    model = os.environ.get("GEMX_FORCE_MODEL") or cfg.get("model") or "gemini-2.5-pro"
+    return ResponseCache.key(model, temperature, cfg.get("system") or "", payload.prompt)
+
+def _cache_get(key: Optional[str]) -> Optional[str]:
+    if not key:
+        return None
+    hit = RESP_CACHE.get(key)
+    CACHE_LOOKUPS.labels("hit" if hit is not None else "miss").inc()
+    return hit
+
+def _cache_put(key: Optional[str], output: str):
+    if not key or not output:
+        return
+    before = RESP_CACHE.stats["evictions"]
+    RESP_CACHE.put(key, output, {"cmd": "gen"})
+    CACHE_EVICTIONS.inc(RESP_CACHE.stats["evictions"] - before)
 
 @app.middleware("http")
 async def metrics_mw(request: Request, call_next):
@@ -83,6 +119,7 @@ async def metrics_mw(request: Request, call_next):
 class GenIn(BaseModel):
     prompt: str
     timeout: Optional[int] = 90
+    no_cache: bool = False
 
 def run_cmd(args: list[str], timeout: int = 120) -> tuple[int,str,str]:
     try:
@@ -107,31 +144,104 @@ def history_list(limit: int = 50):
         items.append({"name": p.name, "size": p.stat().st_size, "mtime": int(p.stat().st_mtime)})
     return {"items": items}
 
+AUDIT = AuditLog(LOG_DIR)
+AUDIT_WATCH = LogWatcher(LOG_DIR)
+AUDIT_PAGE_MAX = 5000
+AUDIT_PING = 15.0
+
+def _audit_filters(event: str, model: str, cmd: str) -> Filters:
+    return Filters(event=event, model=model, cmd=cmd)
+
+def _audit_time(value: str, name: str) -> Optional[float]:
+    """ISO-8601 (2025-01-31T12:00:00Z) ou epoch em segundos."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = parse_ts(value)
+    if ts is None:
+        raise HTTPException(400, f"{name} inválido: use ISO-8601 ou epoch")
+    return ts
+
 @app.get("/api/audit/tail", dependencies=[Depends(basic_auth)])
-def audit_tail(lines: int = 200):
-    # tail last audit-*.jsonl by date (UTC)
-    files = sorted(LOG_DIR.glob("audit-*.jsonl"))
-    if not files:
-        return {"lines": []}
-    path = files[-1]
+def audit_tail(lines: int = 200, event: str = "", model: str = "", cmd: str = ""):
+    """Últimas linhas (atravessa dias anteriores se preciso) + cursor para continuar com /read ou /follow."""
+    lns, cursor = AUDIT.tail(min(max(lines, 1), AUDIT_PAGE_MAX), _audit_filters(event, model, cmd))
+    name = cursor.rpartition(":")[0] if cursor else None
+    return {"file": name, "lines": lns, "cursor": cursor}
+
+@app.get("/api/audit/read", dependencies=[Depends(basic_auth)])
+def audit_read(cursor: str = "", limit: int = 1000, event: str = "", model: str = "", cmd: str = ""):
+    """Só o que foi escrito depois do cursor (sem cursor: desde o primeiro arquivo)."""
+    try:
+        lns, nxt, eof = AUDIT.read_from(cursor or None, _audit_filters(event, model, cmd),
+                                        limit=min(max(limit, 1), AUDIT_PAGE_MAX))
+    except CursorError as e:
+        raise HTTPException(400, str(e))
+    return {"lines": lns, "cursor": nxt, "eof": eof}
+
+@app.get("/api/audit/range", dependencies=[Depends(basic_auth)])
+def audit_range(since: str = "", until: str = "", cursor: str = "", limit: int = 1000,
+                event: str = "", model: str = "", cmd: str = ""):
+    """Linhas entre since e until (ISO-8601/epoch); páginas seguintes com o cursor retornado."""
+    t0, t1 = _audit_time(since, "since"), _audit_time(until, "until")
+    try:
+        lns, nxt, eof = AUDIT.range(t0, t1, _audit_filters(event, model, cmd),
+                                    limit=min(max(limit, 1), AUDIT_PAGE_MAX), cursor=cursor or None)
+    except CursorError as e:
+        raise HTTPException(400, str(e))
+    return {"lines": lns, "cursor": nxt, "eof": eof}
+
+@app.get("/api/audit/follow", dependencies=[Depends(basic_auth)])
+async def audit_follow(request: Request, cursor: str = "", lines: int = 0,
+                       event: str = "", model: str = "", cmd: str = ""):
+    """SSE com as linhas novas (event: line, id: cursor). Reconexões retomam pelo Last-Event-ID;
+    sem cursor começa no fim (ou com as últimas `lines`). Ping a cada 15s mantém proxies abertos."""
+    filters = _audit_filters(event, model, cmd)
+    start = request.headers.get("last-event-id") or cursor
+    backlog: List[Tuple[str, str]] = []
     try:
-        with open(path, "rb") as f:
-            f.seek(0,2); size=f.tell()
-            block = 8192; data=b""; lns=[]
-            while size > 0 and len(lns) <= lines:
-                step = block if size - block > 0 else size
-                f.seek(size-step)
-                data = f.read(step) + data
-                size -= step
-                lns = data.splitlines()
-            lns = [ln.decode("utf-8","ignore") for ln in lns[-lines:]]
-        return {"file": path.name, "lines": lns}
-    except Exception as e:
-        raise HTTPException(500, str(e))
+        if start:
+            AUDIT.parse_cursor(start)
+        elif lines > 0:
+            backlog, start = AUDIT.tail_entries(min(lines, AUDIT_PAGE_MAX), filters)
+        else:
+            start = AUDIT.end_cursor()
+    except CursorError as e:
+        raise HTTPException(400, str(e))
+
+    def _line(ln: str, cur: str) -> bytes:
+        return f"id: {cur}\nevent: line\ndata: {ln}\n\n".encode("utf-8")
+
+    async def events():
+        # cada linha leva o cursor logo após ela: retomar pelo Last-Event-ID não perde nem repete linhas
+        pos = start
+        for ln, cur in backlog:
+            yield _line(ln, cur)
+        while not await request.is_disconnected():
+            # leitura em thread: arquivos grandes não travam o event loop
+            entries, nxt, eof = await asyncio.to_thread(AUDIT.read_entries, pos, filters, 1000)
+            for ln, cur in entries:
+                yield _line(ln, cur)
+            if nxt and nxt != (entries[-1][1] if entries else pos):
+                # linhas filtradas depois da última enviada: só avança o Last-Event-ID do cliente
+                yield f"id: {nxt}\ndata:\n\n".encode("utf-8")
+            pos = nxt or pos
+            if eof and not await AUDIT_WATCH.wait(AUDIT_PING):
+                yield b": ping\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/api/gen", dependencies=[Depends(basic_auth)])
 def api_gen(payload: GenIn):
     CMDS.labels("gen").inc()
+    key = _gen_cache_key(payload)
+    cached = _cache_get(key)
+    if cached is not None:
+        return {"rc": 0, "stdout": cached, "cached": True}
     # Ensure gemini binary available
     gemx = str(APP_ROOT / "gemx.sh")
     rc, out, err = run_cmd([gemx, "gen", "--prompt", payload.prompt], timeout=min(max(payload.timeout, 5), 300))
@@ -139,8 +249,79 @@ def api_gen(payload: GenIn):
         raise HTTPException(409, "binário necessário não encontrado (gemini/gmini). Monte-o em /usr/local/bin/gemini ou configure GEMINI_BIN.")
     if rc != 0:
         return JSONResponse(status_code=500, content={"rc": rc, "stdout": out, "stderr": err})
+    _cache_put(key, out)
     return {"rc": rc, "stdout": out}
 
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+@app.post("/api/gen/stream", dependencies=[Depends(basic_auth)])
+async def api_gen_stream(payload: GenIn):
+    """Como /api/gen, mas repassa o stdout do gemx.sh como Server-Sent Events (chunk/done/error).
+    Leitura do pipe só avança quando o cliente consome (backpressure); desconexão encerra o processo."""
+    CMDS.labels("gen").inc()
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    key = await asyncio.to_thread(_gen_cache_key, payload)
+    cached = await asyncio.to_thread(_cache_get, key)
+    if cached is not None:
+        async def cached_events():
+            yield _sse("chunk", {"text": cached})
+            yield _sse("done", {"rc": 0, "cached": True})
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+    gemx = str(APP_ROOT / "gemx.sh")
+    timeout = min(max(payload.timeout, 5), 300)
+
+    async def events():
+        # processo criado dentro do gerador: desconexão antes do primeiro byte ainda passa pelo finally
+        proc = err_task = None
+        # decodificador incremental: caractere multibyte pode vir dividido entre leituras
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        collected = []
+        try:
+            try:
+                proc = await asyncio.create_subprocess_exec(gemx, "gen", "--prompt", payload.prompt, cwd=str(APP_ROOT),
+                                                            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                            start_new_session=True)
+            except FileNotFoundError:
+                yield _sse("error", {"rc": 127, "stderr": "binário necessário não encontrado (gemini/gmini). Monte-o em /usr/local/bin/gemini ou configure GEMINI_BIN."})
+                return
+            deadline = time.monotonic() + timeout
+            err_task = asyncio.ensure_future(proc.stderr.read())
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield _sse("error", {"rc": 124, "stderr": "timeout"})
+                    return
+                try:
+                    chunk = await asyncio.wait_for(proc.stdout.read(1024), timeout=remaining)
+                except asyncio.TimeoutError:
+                    continue
+                if not chunk:
+                    break
+                collected.append(chunk)
+                text = decoder.decode(chunk)
+                if text:
+                    yield _sse("chunk", {"text": text})
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield _sse("chunk", {"text": text})
+            err = (await err_task).decode("utf-8", "replace")
+            rc = await proc.wait()
+            if rc == 0:
+                await asyncio.to_thread(_cache_put, key, b"".join(collected).decode("utf-8", "replace"))
+            yield _sse("done", {"rc": rc}) if rc == 0 else _sse("error", {"rc": rc, "stderr": err})
+        finally:
+            if err_task is not None:
+                err_task.cancel()
+            if proc is not None and proc.returncode is None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
 class FlowIn(BaseModel):
     path: str
     timeout: Optional[int] = 300
@@ -0,0 +1,322 @@
+# Leitura dos logs de auditoria (audit-YYYYMMDD.jsonl) para a API /api/audit/*
+#
+# - Cursor "audit-YYYYMMDD.jsonl:offset": o cliente pede só os bytes novos desde a
+#   última leitura; ao fim de um arquivo a leitura segue para o próximo dia. As
+#   variantes *_entries dão o cursor logo após cada linha (id de evento no follow).
+# - tail lê de trás para frente em blocos, atravessando arquivos, sem re-dividir o
+#   buffer acumulado (a linha parcial do bloco é carregada para o bloco anterior).
+# - Índice esparso ts -> offset por arquivo (um ponto a cada SPARSE_STEP bytes),
+#   estendido de forma incremental enquanto o arquivo cresce: buscas por período
+#   fazem bisect no índice e leem só a janela necessária.
+# - Filtros por event/model/cmd (cmd = argv[0], como no gemx_analytics.py), com
+#   pré-filtro em bytes antes do json.loads.
+# - LogWatcher: um único observador do diretório (watchfiles, que vem com
+#   uvicorn[standard]; senão polling) acorda os clientes em modo follow.
+import asyncio
+import bisect
+import datetime
+import json
+import os
+import pathlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+BLOCK = 64 * 1024
+SPARSE_STEP = 256 * 1024
+MAX_READ = 4 * 1024 * 1024      # bytes por chamada de read_from
+POLL = 1.0
+FILE_PREFIX, FILE_SUFFIX = "audit-", ".jsonl"
+
+
+class CursorError(ValueError):
+    """Cursor malformado."""
+
+
+def parse_ts(ts: str) -> Optional[float]:
+    try:
+        return datetime.datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _line_ts(line: bytes) -> Optional[float]:
+    # ts é o primeiro campo no jq -c do gemx.sh; evita json.loads na maioria dos casos
+    head = line[:40]
+    if head.startswith(b'{"ts":"'):
+        end = head.find(b'"', 7)
+        if end > 0:
+            return parse_ts(head[7:end].decode("ascii", "ignore"))
+    try:
+        return parse_ts(json.loads(line).get("ts", ""))
+    except (ValueError, AttributeError):
+        return None
+
+
+class Filters:
+    """event/model/cmd exatos; vazio = sem filtro."""
+
+    def __init__(self, event: str = "", model: str = "", cmd: str = ""):
+        self.want = {k: v for k, v in (("event", event), ("model", model), ("cmd", cmd)) if v}
+        self._needles = [json.dumps(v).encode("utf-8") for v in self.want.values()]
+
+    def __bool__(self):
+        return bool(self.want)
+
+    def match(self, line: bytes) -> bool:
+        if not self.want:
+            return True
+        if not all(n in line for n in self._needles):
+            return False
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            return False
+        argv = obj.get("argv") or []
+        fields = {"event": obj.get("event"), "model": obj.get("model"), "cmd": argv[0] if argv else "(none)"}
+        return all(fields[k] == v for k, v in self.want.items())
+
+
+class AuditLog:
+    def __init__(self, log_dir: pathlib.Path):
+        self.log_dir = pathlib.Path(log_dir)
+        self._sparse: Dict[str, Tuple[int, List[float], List[int], int]] = {}  # nome -> (ino, ts, offsets, indexado até)
+        self._lock = threading.Lock()
+
+    # --- arquivos e cursores ---
+
+    def files(self) -> List[str]:
+        return sorted(p.name for p in self.log_dir.glob(f"{FILE_PREFIX}*{FILE_SUFFIX}"))
+
+    def _path(self, name: str) -> pathlib.Path:
+        return self.log_dir / name
+
+    @staticmethod
+    def cursor(name: str, offset: int) -> str:
+        return f"{name}:{offset}"
+
+    def parse_cursor(self, cursor: str) -> Tuple[str, int]:
+        name, _, off = cursor.rpartition(":")
+        if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX) and "/" not in name and off.isdigit()):
+            raise CursorError(f"cursor inválido: {cursor!r}")
+        return name, int(off)
+
+    def end_cursor(self) -> Optional[str]:
+        files = self.files()
+        if not files:
+            return None
+        return self.cursor(files[-1], self._path(files[-1]).stat().st_size)
+
+    # --- tail ---
+
+    def tail(self, lines: int, filters: Filters) -> Tuple[List[str], Optional[str]]:
+        """Últimas `lines` linhas que passam nos filtros, atravessando arquivos anteriores."""
+        entries, end = self.tail_entries(lines, filters)
+        return [ln for ln, _ in entries], end
+
+    def tail_entries(self, lines: int, filters: Filters) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+        """Como tail, mas cada linha vem com o cursor logo após ela.
+
+        Como em read_entries, só linhas terminadas em \\n: a que o gemx.sh ainda está
+        escrevendo fica de fora, e o cursor final aponta para o início dela.
+        """
+        files = self.files()
+        if not files:
+            return [], None
+        end: Optional[str] = None
+        out: List[Tuple[bytes, str]] = []
+        for name in reversed(files):
+            with open(self._path(name), "rb") as f:
+                pos = f.seek(0, 2)
+                if end is None:
+                    end = self.cursor(name, pos)
+                carry = b""
+                partial = True  # ainda no trecho final do arquivo sem \n
+                while pos > 0 and len(out) < lines:
+                    step = min(BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    block = f.read(step) + carry
+                    if partial:
+                        cut = block.rfind(b"\n") + 1
+                        carry = b""
+                        if not cut:
+                            continue  # bloco inteiro é linha incompleta
+                        block, partial = block[:cut], False
+                        if name == files[-1]:
+                            end = self.cursor(name, pos + cut)
+                    parts = block.split(b"\n")
+                    carry = parts[0] if pos > 0 else b""  # início do bloco pode ser linha parcial
+                    after = pos + len(block)  # fim da última parte do bloco
+                    for i in range(len(parts) - 1, 0 if pos > 0 else -1, -1):
+                        ln = parts[i]
+                        nxt = after + 1
+                        after -= len(ln) + 1
+                        if ln and filters.match(ln):
+                            out.append((ln, self.cursor(name, nxt)))
+                            if len(out) >= lines:
+                                break
+                if partial and name == files[-1]:
+                    end = self.cursor(name, 0)  # arquivo sem nenhuma linha completa
+            if len(out) >= lines:
+                break
+        return [(ln.decode("utf-8", "ignore"), cur) for ln, cur in reversed(out)], end
+
+    # --- leitura incremental ---
+
+    def read_from(self, cursor: Optional[str], filters: Filters, limit: int = 1000,
+                  since: Optional[float] = None, until: Optional[float] = None) -> Tuple[List[str], str, bool]:
+        """Linhas completas a partir do cursor (segue para os arquivos seguintes).
+
+        Retorna (linhas, próximo cursor, eof). eof=True quando não há mais bytes agora;
+        com `until`, também quando uma linha passa do limite (o cursor fica nela).
+        Linhas com ts < `since` são puladas sem contar no limite.
+        """
+        entries, nxt, eof = self.read_entries(cursor, filters, limit, since, until)
+        return [ln for ln, _ in entries], nxt, eof
+
+    def read_entries(self, cursor: Optional[str], filters: Filters, limit: int = 1000,
+                     since: Optional[float] = None,
+                     until: Optional[float] = None) -> Tuple[List[Tuple[str, str]], str, bool]:
+        """Como read_from, mas cada linha vem com o cursor logo após ela."""
+        files = self.files()
+        if not files:
+            return [], cursor or "", True
+        if cursor:
+            name, offset = self.parse_cursor(cursor)
+        else:
+            name, offset = files[0], 0
+        idx = bisect.bisect_left(files, name)
+        if idx < len(files) and files[idx] != name:
+            offset = 0  # arquivo do cursor sumiu (rotação): continua no seguinte
+        out: List[Tuple[str, str]] = []
+        budget = MAX_READ
+        while idx < len(files):
+            name = files[idx]
+            path = self._path(name)
+            size = path.stat().st_size
+            if offset > size:
+                offset = 0  # truncado
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(min(size - offset, budget))
+            cut = len(data) < size - offset
+            complete = data.rfind(b"\n") + 1  # só linhas terminadas
+            pos = offset
+            for ln in data[:complete].split(b"\n")[:-1]:
+                nxt = pos + len(ln) + 1
+                ts = _line_ts(ln) if ln and (since is not None or until is not None) else None
+                if ts is not None and until is not None and ts > until:
+                    return out, self.cursor(name, pos), True
+                if ln and (ts is None or since is None or ts >= since) and filters.match(ln):
+                    out.append((ln.decode("utf-8", "ignore"), self.cursor(name, nxt)))
+                pos = nxt
+                if len(out) >= limit:
+                    return out, self.cursor(name, pos), False
+            budget -= complete
+            if cut or budget <= 0:
+                return out, self.cursor(name, pos), False
+            if idx == len(files) - 1:
+                # o que sobrou (se sobrou) é a linha que o gemx.sh ainda está escrevendo
+                return out, self.cursor(name, pos), True
+            # arquivo de um dia anterior: uma linha final incompleta não vai mais terminar
+            idx, offset = idx + 1, 0
+        return out, self.end_cursor() or "", True
+
+    # --- busca por tempo ---
+
+    def _sparse_index(self, name: str) -> Tuple[List[float], List[int]]:
+        """(timestamps, offsets) amostrados; estende só o trecho novo do arquivo."""
+        path = self._path(name)
+        st = path.stat()
+        with self._lock:
+            ino, ts_list, off_list, done = self._sparse.get(name, (st.st_ino, [], [], 0))
+            if ino != st.st_ino or done > st.st_size:
+                ts_list, off_list, done = [], [], 0
+            if done < st.st_size:
+                with open(path, "rb") as f:
+                    f.seek(done)
+                    pos = done
+                    next_mark = (off_list[-1] + SPARSE_STEP) if off_list else 0
+                    for ln in f:
+                        if not ln.endswith(b"\n"):
+                            break
+                        if pos >= next_mark:
+                            ts = _line_ts(ln)
+                            if ts is not None and (not ts_list or ts >= ts_list[-1]):
+                                ts_list.append(ts)
+                                off_list.append(pos)
+                                next_mark = pos + SPARSE_STEP
+                        pos += len(ln)
+                    done = pos
+            self._sparse[name] = (st.st_ino, ts_list, off_list, done)
+            return ts_list, off_list
+
+    def seek(self, since: float) -> Optional[str]:
+        """Cursor próximo (antes) da primeira linha com ts >= since."""
+        files = self.files()
+        if not files:
+            return None
+        day = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).strftime("%Y%m%d")
+        # arquivos são por dia UTC: começa no dia de `since` (ou no primeiro depois dele)
+        idx = bisect.bisect_left(files, f"{FILE_PREFIX}{day}{FILE_SUFFIX}")
+        if idx >= len(files):
+            return self.end_cursor()
+        name = files[idx]
+        ts_list, off_list = self._sparse_index(name)
+        i = bisect.bisect_left(ts_list, since) - 1
+        return self.cursor(name, off_list[i] if i >= 0 else 0)
+
+    def range(self, since: Optional[float], until: Optional[float], filters: Filters,
+              limit: int = 1000, cursor: Optional[str] = None) -> Tuple[List[str], str, bool]:
+        """Linhas com since <= ts <= until; `cursor` continua uma página anterior."""
+        # o índice esparso aponta um pouco antes de `since`; read_from pula o excedente
+        start = cursor or (self.seek(since) if since is not None else None)
+        return self.read_from(start, filters, limit=limit, since=since, until=until)
+
+
+class LogWatcher:
+    """Notifica mudanças no diretório de logs para todos os clientes em follow."""
+
+    def __init__(self, log_dir: pathlib.Path):
+        self.log_dir = pathlib.Path(log_dir)
+        self._event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _notify(self):
+        ev, self._event = self._event, asyncio.Event()
+        if ev:
+            ev.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Espera a próxima mudança (True) ou o timeout (False)."""
+        if self._task is None or self._task.done():
+            self._event = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        ev = self._event
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run(self):
+        try:
+            from watchfiles import awatch
+        except ImportError:
+            awatch = None
+        if awatch is not None:
+            async for _ in awatch(self.log_dir, recursive=False):
+                self._notify()
+            return
+        last = None
+        while True:
+            snap = sorted((e.name, e.stat().st_size) for e in os.scandir(self.log_dir)
+                          if e.name.startswith(FILE_PREFIX) and e.name.endswith(FILE_SUFFIX))
+            if last is not None and snap != last:
+                self._notify()
+            last = snap
+            await asyncio.sleep(POLL)
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
@@ -1 +1 @@
-__all__ = ['fhir','openfda','rxnorm','ctgov','obsidian','dicts','card','plots','mdfhir']
\ No newline at end of file
+__all__ = ['fhir','openfda','rxnorm','ctgov','obsidian','dicts','card','plots','mdfhir','client']
\ No newline at end of file
@@ -1,5 +1,5 @@
 import typer
-from . import fhir, openfda, rxnorm, ctgov, obsidian, dicts, card, plots, mdfhir
+from . import fhir, openfda, rxnorm, ctgov, obsidian, dicts, card, plots, mdfhir, client
 
 app = typer.Typer(add_completion=False, help="medcli — FHIR/OpenFDA/RxNorm/CTGov & Obsidian bridge")
 
@@ -12,6 +12,13 @@ app.add_typer(dicts.app, name="dicts")
 app.add_typer(card.app, name="card")
 app.add_typer(plots.app, name="plots")
 app.add_typer(mdfhir.app, name="mdfhir")
+app.add_typer(client.app, name="cache")
+
+@app.callback()
+def main(no_cache: bool = typer.Option(False, "--no-cache", envvar="MEDCLI_NO_CACHE",
+                                       help="Bypass the on-disk HTTP response cache")):
+    if no_cache:
+        client.configure(use_cache=False)
 
 if __name__ == "__main__":
     app()
@@ -1,30 +1,29 @@
-import json, typer, datetime as dt
+import asyncio, json, os, re, time, typer, datetime as dt
+from typing import Dict, List, Optional, Tuple
 from rich import print
+from .client import OPENFDA, RXNAV, AsyncClient, get_client
 
 app = typer.Typer(help="Markdown cards (copy/paste to notes/EMR)")
 
 def _md_escape(s: str) -> str:
     return s.replace("|","\\|")
 
-@app.command("drug")
-def drug_card(name: str = typer.Argument(..., help="Drug name to search"),
-              rxcui: int = typer.Option(None, help="Optional known RxCUI"),
-              source: str = typer.Option("openfda", help="openfda|rxnorm"),
-              out: str = typer.Option("-", help="- for stdout or file path")):
-    """Produce a Markdown card with basic info (brand/generic, form/route) and interaction handle."""
-    import httpx, urllib.parse as up
-    generic = name
-    brand = ""
-    props = {}
-    if rxcui:
-        j = httpx.get(f"https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/properties.json", timeout=20).json()
-        props = j.get("properties", {})
-        generic = props.get("name", generic)
-    else:
-        j = httpx.get(f"https://rxnav.nlm.nih.gov/REST/approximateTerm.json?term={up.quote(name)}", timeout=20).json()
-        cand = (j.get("approximateGroup", {}).get("candidate",[]) or [{}])[0]
-        rxcui = int(cand.get("rxcui", 0) or 0)
+def _candidate_rxcui(j: dict) -> int:
+    cand = (j.get("approximateGroup", {}).get("candidate",[]) or [{}])[0]
+    return int(cand.get("rxcui", 0) or 0)
+
+def _label_query(rxcui: int) -> dict:
+    return {"search": f'openfda.rxcui:"{rxcui}"', "limit": 1}
 
+def _label_fields(r) -> Dict[str, str]:
+    """Brand/route from an OpenFDA label response (404 = no label for this RxCUI)."""
+    if r.status_code == 404:
+        return {}
+    r.raise_for_status()
+    fda = ((r.json().get("results") or [{}])[0]).get("openfda", {})
+    return {"brand": ", ".join(fda.get("brand_name", [])[:3]), "route": ", ".join(fda.get("route", []))}
+
+def render_card(name: str, rxcui: int, generic: str, label: Dict[str, str]) -> str:
     title = f"{generic} (RxCUI: {rxcui})" if rxcui else generic
     now = dt.datetime.now().strftime("%Y-%m-%d %H:%M")
     md = [f"---",
@@ -41,10 +40,163 @@ def drug_card(name: str = typer.Argument(..., help="Drug name to search"),
           f"## Summary",
           f"- Generic: `{generic}`",
           ]
-    out_text = "\n".join(md)
+    if label.get("brand"):
+        md.append(f"- Brand: {label['brand']}")
+    if label.get("route"):
+        md.append(f"- Route: {label['route']}")
+    return "\n".join(md)
+
+@app.command("drug")
+def drug_card(name: str = typer.Argument(..., help="Drug name to search"),
+              rxcui: int = typer.Option(None, help="Optional known RxCUI"),
+              source: str = typer.Option("openfda", help="openfda|rxnorm"),
+              out: str = typer.Option("-", help="- for stdout or file path")):
+    """Produce a Markdown card with basic info (brand/generic, form/route) and interaction handle."""
+    generic = name
+    c = get_client()
+    if rxcui:
+        j = c.get_json(f"{RXNAV}/rxcui/{rxcui}/properties.json")
+        generic = j.get("properties", {}).get("name", generic)
+    else:
+        rxcui = _candidate_rxcui(c.get_json(f"{RXNAV}/approximateTerm.json", params={"term": name}))
+    label = {}
+    if source == "openfda" and rxcui:
+        label = _label_fields(c.get(f"{OPENFDA}/drug/label.json", params=_label_query(rxcui)))
+
+    out_text = render_card(name, rxcui, generic, label)
     if out == "-":
         print(out_text)
     else:
         with open(out, "w", encoding="utf-8") as f:
             f.write(out_text)
         print(f"[OK] wrote {out}")
+
+# --- batch ---
+
+def read_drug_list(path: str) -> List[Tuple[str, Optional[int]]]:
+    """One drug per line: a name, an RxCUI (digits or `rxcui:123`), or `name,rxcui`; # comments."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            name, _, rx = line.partition(",")
+            name, rx = name.strip(), rx.strip()
+            m = re.fullmatch(r"(?:rxcui:)?(\d+)", name, flags=re.I)
+            if m and not rx:
+                items.append((name, int(m.group(1))))
+            else:
+                items.append((name, int(rx) if rx.isdigit() else None))
+    return items
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^\w.-]+", "-", s.strip()).strip("-") or "drug"
+
+async def _lookup(ac: AsyncClient, name: str, rxcui: Optional[int], source: str) -> Tuple[int, str, Dict[str, str]]:
+    """Same lookups as `card drug`, over the async client."""
+    generic = name
+    if rxcui:
+        j = await ac.get_json(f"{RXNAV}/rxcui/{rxcui}/properties.json")
+        generic = j.get("properties", {}).get("name", generic)
+    else:
+        rxcui = _candidate_rxcui(await ac.get_json(f"{RXNAV}/approximateTerm.json", params={"term": name}))
+    label = {}
+    if source == "openfda" and rxcui:
+        label = _label_fields(await ac.get(f"{OPENFDA}/drug/label.json", params=_label_query(rxcui)))
+    return rxcui, generic, label
+
+async def _batch(items: List[Tuple[str, Optional[int]]], out_dir: str, source: str,
+                 concurrency: int, rates: Dict[str, float]) -> Tuple[List[dict], Dict[str, int]]:
+    slots = asyncio.Semaphore(max(1, concurrency))
+    results: List[dict] = [{} for _ in items]
+    labels: List[Dict[str, str]] = [{} for _ in items]
+
+    async def one(i: int, name: str, rxcui: Optional[int]):
+        async with slots:
+            t0 = time.perf_counter()
+            row = {"name": name, "rxcui": rxcui or 0, "generic": "", "file": "", "error": ""}
+            try:
+                row["rxcui"], row["generic"], labels[i] = await _lookup(ac, name, rxcui, source)
+            except Exception as e:  # one bad drug doesn't sink the batch
+                row["error"] = f"{type(e).__name__}: {e}"[:200]
+            row["seconds"] = time.perf_counter() - t0
+            results[i] = row
+
+    async with AsyncClient(rates=rates, max_connections=max(1, concurrency)) as ac:
+        await asyncio.gather(*(one(i, n, r) for i, (n, r) in enumerate(items)))
+        counters = dict(ac.counters)
+    _write_cards(results, labels, out_dir)
+    return results, counters
+
+def _write_cards(results: List[dict], labels: List[Dict[str, str]], out_dir: str) -> None:
+    """Write the cards in list order, once per resolved RxCUI and never twice to the same file.
+
+    Names that only differ in case or punctuation ("Amoxicillin/Clavulanate" vs "amoxicillin
+    clavulanate") share a slug, and filesystems may be case-insensitive, so a taken slug gets the
+    RxCUI (or a counter) appended. Rows resolving to an RxCUI already written link to that card.
+    """
+    by_rxcui: Dict[int, str] = {}
+    taken: set = set()
+    for row, label in zip(results, labels):
+        if row["error"]:
+            continue
+        if row["rxcui"] in by_rxcui:
+            row["file"] = by_rxcui[row["rxcui"]]
+            continue
+        base = f"Drug-{_slug(row['name'])}"
+        fname, n = base, 1
+        while fname.casefold() in taken:
+            n += 1
+            fname = f"{base}-{row['rxcui']}" if row["rxcui"] and n == 2 else f"{base}-{n}"
+        try:
+            with open(os.path.join(out_dir, fname + ".md"), "w", encoding="utf-8") as f:
+                f.write(render_card(row["name"], row["rxcui"], row["generic"], label))
+        except OSError as e:
+            row["error"] = f"{type(e).__name__}: {e}"[:200]
+            continue
+        taken.add(fname.casefold())
+        row["file"] = fname + ".md"
+        if row["rxcui"]:
+            by_rxcui[row["rxcui"]] = row["file"]
+
+def render_index(results: List[dict]) -> str:
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M")
+    ok = sum(1 for r in results if not r["error"])
+    md = ["---", "title: Drug cards", f"created: {now}", f"cards: {ok}", "---", "",
+          "# Drug cards", "", "| drug | RxCUI | generic | card |", "|---|---|---|---|"]
+    for r in results:
+        card = f"[[{r['file'][:-3]}]]" if r["file"] else f"error: {_md_escape(r['error'])}"
+        md.append(f"| {_md_escape(r['name'])} | {r['rxcui'] or ''} | {_md_escape(r['generic'])} | {card} |")
+    return "\n".join(md) + "\n"
+
+@app.command("batch")
+def drug_batch(drug_list: str = typer.Argument(..., help="Text file: one drug name or RxCUI per line"),
+               out_dir: str = typer.Option("cards", help="Directory for the cards and index.md"),
+               source: str = typer.Option("openfda", help="openfda|rxnorm"),
+               concurrency: int = typer.Option(8, min=1, help="drugs resolved at the same time"),
+               rxnav_rate: float = typer.Option(20.0, help="RxNav requests/s (published limit: 20)"),
+               openfda_rate: float = typer.Option(4.0, help="OpenFDA requests/s (240/min without API key)")):
+    """Generate cards for many drugs in one run: concurrent, rate-limited, deduplicated lookups."""
+    items = read_drug_list(drug_list)
+    seen, unique = set(), []
+    for name, rxcui in items:
+        k = rxcui or _slug(name).casefold()
+        if k not in seen:
+            seen.add(k); unique.append((name, rxcui))
+    os.makedirs(out_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    results, counters = asyncio.run(_batch(unique, out_dir, source, concurrency,
+                                           {RXNAV: rxnav_rate, OPENFDA: openfda_rate}))
+    index = os.path.join(out_dir, "index.md")
+    with open(index, "w", encoding="utf-8") as f:
+        f.write(render_index(results))
+    failed = [r for r in results if r["error"]]
+    for r in failed:
+        print(f"[ERR] {r['name']}: {r['error']}")
+    elapsed = time.perf_counter() - t0
+    print(f"[OK] {len(results) - len(failed)}/{len(results)} cards ({len(items) - len(unique)} duplicate lines skipped) "
+          f"-> {out_dir} in {elapsed:.1f}s; http: {counters['miss'] + counters['revalidated'] + counters['bypass']} requests, "
+          f"{counters['hit']} cache hits, {counters['coalesced']} coalesced. Index: {index}")
+    if failed:
+        raise typer.Exit(1)
@@ -0,0 +1,364 @@
+"""Shared HTTP layer for medcli: one pooled client plus an on-disk response cache.
+
+- Keep-alive connection pool shared by every command in the process (HTTP/2 when `h2` is installed).
+- Responses to GET requests are stored in SQLite with a TTL chosen per service endpoint (TTL_RULES);
+  any other URL gets DEFAULT_TTL, i.e. it is not cached.
+  Fresh entries are served without touching the network; stale entries with an ETag or
+  Last-Modified are revalidated with If-None-Match / If-Modified-Since and a 304 just
+  extends their lifetime.
+- Base URLs can be overridden (MEDCLI_RXNAV_BASE, MEDCLI_OPENFDA_BASE, MEDCLI_CTGOV_BASE)
+  to point the commands at a local stub server; the TTLs follow the override.
+
+Environment: MEDCLI_CACHE_DB (cache path), MEDCLI_NO_CACHE=1 (bypass), MEDCLI_HTTP2=0 (force HTTP/1.1).
+"""
+import asyncio, atexit, importlib.util, json, os, re, sqlite3, threading, time
+from typing import Dict, List, Optional, Pattern, Tuple
+
+import httpx, typer
+from rich import print
+
+RXNAV = os.environ.get("MEDCLI_RXNAV_BASE", "https://rxnav.nlm.nih.gov/REST").rstrip("/")
+OPENFDA = os.environ.get("MEDCLI_OPENFDA_BASE", "https://api.fda.gov").rstrip("/")
+CTGOV = os.environ.get("MEDCLI_CTGOV_BASE", "https://clinicaltrials.gov/api/v2").rstrip("/")
+
+HOUR, DAY = 3600, 86400
+
+
+def _service(base: str) -> str:
+    """Base URL as httpx spells it in requests (lower-case host, no default port)."""
+    return str(httpx.URL(base)).rstrip("/")
+
+
+# (service base, pattern matched at the start of the path below that base, ttl). The first rule
+# whose base prefixes the request URL and whose pattern matches wins, so MEDCLI_*_BASE overrides
+# keep their TTLs. Everything else (FHIR, unknown hosts, unlisted endpoints) gets DEFAULT_TTL.
+# RxCUI properties barely change between monthly RxNorm releases; trial listings move fast.
+TTL_RULES: List[Tuple[str, Pattern, int]] = [
+    (_service(RXNAV), re.compile(r"/rxcui/\d+/properties"), 30 * DAY),
+    (_service(RXNAV), re.compile(r"/approximateTerm"), 7 * DAY),
+    (_service(RXNAV), re.compile(r"/interaction/"), 7 * DAY),
+    (_service(RXNAV), re.compile(r"/"), DAY),
+    (_service(OPENFDA), re.compile(r"/drug/label\.json"), 7 * DAY),
+    (_service(OPENFDA), re.compile(r"/drug/(event|enforcement)\.json"), DAY),
+    (_service(CTGOV), re.compile(r"/studies"), 6 * HOUR),
+]
+DEFAULT_TTL = 0  # not cached
+
+TIMEOUT = 30.0
+LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses(
+  key TEXT PRIMARY KEY,
+  url TEXT NOT NULL,
+  status INTEGER NOT NULL,
+  headers TEXT NOT NULL,
+  body BLOB NOT NULL,
+  etag TEXT,
+  last_modified TEXT,
+  stored_at REAL NOT NULL,
+  expires_at REAL NOT NULL
+);
+"""
+# headers worth replaying from the cache (the rest describe the original transfer)
+KEEP_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+
+def default_cache_path() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.environ.get("MEDCLI_CACHE_DB") or os.path.join(base, "medcli", "http.sqlite")
+
+
+def ttl_for(url: str) -> int:
+    for base, pattern, ttl in TTL_RULES:
+        if url.startswith(base + "/") and pattern.match(url, len(base)):
+            return ttl
+    return DEFAULT_TTL
+
+
+def http2_available() -> bool:
+    return os.environ.get("MEDCLI_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+
+class ResponseCache:
+    """SQLite (WAL) store of GET responses keyed by method, URL and Accept header."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or default_cache_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, url: str, accept: str = "") -> str:
+        return f"{method} {url} {accept}"
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._con.execute("SELECT status, headers, body, etag, last_modified, expires_at, url "
+                                    "FROM responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        status, headers, body, etag, last_modified, expires_at, url = row
+        return {"status": status, "headers": json.loads(headers), "body": body, "etag": etag,
+                "last_modified": last_modified, "expires_at": expires_at, "url": url}
+
+    def put(self, key: str, response: httpx.Response, ttl: int):
+        headers = {k: v for k, v in response.headers.items() if k.lower() in KEEP_HEADERS}
+        now = time.time()
+        with self._lock:
+            self._con.execute("INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?,?,?)",
+                              (key, str(response.request.url), response.status_code, json.dumps(headers),
+                               response.content, response.headers.get("etag"),
+                               response.headers.get("last-modified"), now, now + ttl))
+
+    def touch(self, key: str, ttl: int):
+        with self._lock:
+            self._con.execute("UPDATE responses SET expires_at = ? WHERE key = ?", (time.time() + ttl, key))
+
+    def stats(self) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            n, size, fresh = self._con.execute(
+                "SELECT count(*), coalesce(sum(length(body)), 0), coalesce(sum(expires_at > ?), 0) FROM responses",
+                (now,)).fetchone()
+        return {"entries": n, "fresh": fresh, "stale": n - fresh, "bytes": size, "path": self.path}
+
+    def clear(self, expired_only: bool = False) -> int:
+        with self._lock:
+            if expired_only:
+                cur = self._con.execute("DELETE FROM responses WHERE expires_at <= ? AND etag IS NULL "
+                                        "AND last_modified IS NULL", (time.time(),))
+            else:
+                cur = self._con.execute("DELETE FROM responses")
+            self._con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return cur.rowcount
+
+    def close(self):
+        self._con.close()
+
+
+def _cached_response(entry: dict, request: httpx.Request) -> httpx.Response:
+    r = httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"], request=request)
+    r.extensions["medcli_cache"] = "hit"
+    return r
+
+
+class _CachedGet:
+    """Cache policy shared by the sync and async clients: lookup/conditional headers before
+    sending, store/refresh after."""
+    cache: Optional[ResponseCache]
+    counters: Dict[str, int]
+
+    def _before(self, request: httpx.Request, ttl: Optional[int]):
+        """(ttl, key, entry, response) — `response` is set when the cache answers on its own."""
+        ttl = ttl_for(str(request.url)) if ttl is None else ttl
+        if self.cache is None or ttl <= 0:
+            self.counters["bypass"] += 1
+            return ttl, None, None, None
+        key = ResponseCache.key("GET", str(request.url), request.headers.get("accept", ""))
+        entry = self.cache.get(key)
+        if entry and entry["expires_at"] > time.time():
+            self.counters["hit"] += 1
+            return ttl, key, entry, _cached_response(entry, request)
+        if entry:
+            if entry["etag"]:
+                request.headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                request.headers["If-Modified-Since"] = entry["last_modified"]
+        return ttl, key, entry, None
+
+    def _after(self, request: httpx.Request, ttl: int, key: Optional[str], entry: Optional[dict],
+               response: httpx.Response) -> httpx.Response:
+        if key is None:
+            return response
+        if response.status_code == 304 and entry:
+            self.counters["revalidated"] += 1
+            self.cache.touch(key, ttl)
+            return _cached_response(entry, request)
+        self.counters["miss"] += 1
+        if response.status_code == 200 and "no-store" not in response.headers.get("cache-control", ""):
+            self.cache.put(key, response, ttl)
+        return response
+
+
+class Client(_CachedGet):
+    """Pooled httpx.Client with the response cache in front of GET requests."""
+
+    def __init__(self, cache: Optional[ResponseCache] = None, use_cache: bool = True, timeout: float = TIMEOUT):
+        self.cache = cache if cache is not None else (ResponseCache() if use_cache else None)
+        self.http = httpx.Client(timeout=timeout, limits=LIMITS, http2=http2_available(), follow_redirects=True)
+        self.counters = {"hit": 0, "revalidated": 0, "miss": 0, "bypass": 0}
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+            ttl: Optional[int] = None) -> httpx.Response:
+        """GET through the cache. `ttl` overrides TTL_RULES (0 = don't cache)."""
+        request = self.http.build_request("GET", url, params=params, headers=headers)
+        ttl, key, entry, cached = self._before(request, ttl)
+        if cached is not None:
+            return cached
+        return self._after(request, ttl, key, entry, self.http.send(request))
+
+    def get_json(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                 ttl: Optional[int] = None):
+        r = self.get(url, params=params, headers=headers, ttl=ttl)
+        r.raise_for_status()
+        return r.json()
+
+    def close(self):
+        self.http.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second, up to `burst` at once; rate <= 0 disables it."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Published limits: RxNav 20 requests/s per IP; OpenFDA 240 requests/min (without an API key).
+RATE_LIMITS: Dict[str, float] = {RXNAV: 20.0, OPENFDA: 4.0}
+
+
+class AsyncClient(_CachedGet):
+    """Async counterpart of Client for batch commands.
+
+    Shares the on-disk cache, rate-limits network requests per service (cache hits are free)
+    and coalesces identical GETs that are in flight at the same time into one request.
+    """
+
+    def __init__(self, cache: Optional[ResponseCache] = None, use_cache: Optional[bool] = None,
+                 timeout: float = TIMEOUT, rates: Optional[Dict[str, float]] = None,
+                 max_connections: int = LIMITS.max_connections):
+        use_cache = _settings["use_cache"] if use_cache is None else use_cache
+        self.cache = cache if cache is not None else (ResponseCache() if use_cache else None)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                              keepalive_expiry=LIMITS.keepalive_expiry)
+        self.http = httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2_available(), follow_redirects=True)
+        self.counters = {"hit": 0, "revalidated": 0, "miss": 0, "bypass": 0, "coalesced": 0}
+        self.limiters = {base: RateLimiter(rate, burst=max(1, int(rate)))
+                         for base, rate in {**RATE_LIMITS, **(rates or {})}.items()}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _limiter(self, url: str) -> Optional[RateLimiter]:
+        for base, limiter in self.limiters.items():
+            if url.startswith(base):
+                return limiter
+        return None
+
+    async def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                  ttl: Optional[int] = None) -> httpx.Response:
+        request = self.http.build_request("GET", url, params=params, headers=headers)
+        flight = f"{request.url} {request.headers.get('accept', '')}"
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = future
+        try:
+            response = await self._fetch(request, ttl)
+            future.set_result(response)
+            return response
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            del self._inflight[flight]
+
+    async def _fetch(self, request: httpx.Request, ttl: Optional[int]) -> httpx.Response:
+        ttl, key, entry, cached = self._before(request, ttl)
+        if cached is not None:
+            return cached
+        limiter = self._limiter(str(request.url))
+        if limiter:
+            await limiter.acquire()
+        response = await self.http.send(request)
+        return self._after(request, ttl, key, entry, response)
+
+    async def get_json(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                       ttl: Optional[int] = None):
+        r = await self.get(url, params=params, headers=headers, ttl=ttl)
+        r.raise_for_status()
+        return r.json()
+
+    async def aclose(self):
+        await self.http.aclose()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+_shared: Optional[Client] = None
+_settings = {"use_cache": os.environ.get("MEDCLI_NO_CACHE", "") not in ("1", "true", "yes")}
+
+
+def configure(use_cache: Optional[bool] = None):
+    """Adjust the shared client before first use (e.g. from the --no-cache CLI flag)."""
+    global _shared
+    if use_cache is not None:
+        _settings["use_cache"] = use_cache
+    if _shared is not None:
+        _shared.close()
+        _shared = None
+
+
+def get_client() -> Client:
+    """Process-wide client: every command reuses the same connection pool and cache."""
+    global _shared
+    if _shared is None:
+        _shared = Client(use_cache=_settings["use_cache"])
+        atexit.register(_shared.close)
+    return _shared
+
+
+app = typer.Typer(help="HTTP response cache (RxNav/OpenFDA/ClinicalTrials.gov)")
+
+@app.command("stats")
+def cache_stats():
+    """Entries, fresh/stale split and size of the response cache."""
+    cache = ResponseCache()
+    try:
+        print(cache.stats())
+    finally:
+        cache.close()
+
+@app.command("clear")
+def cache_clear(expired: bool = typer.Option(False, "--expired", help="only drop stale entries that can't be revalidated")):
+    """Delete cached responses."""
+    cache = ResponseCache()
+    try:
+        print(f"[OK] removed {cache.clear(expired_only=expired)} cached responses")
+    finally:
+        cache.close()
@@ -1,64 +1,244 @@
-import os, sqlite3, csv, typer, json, pathlib
+import os, re, sqlite3, csv, typer, json, pathlib, io, time, itertools
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from rich import print
+from rich.progress import Progress, BarColumn, TextColumn, TimeRemainingColumn
 
 app = typer.Typer(help="Dictionary updater: LOINC/RxNorm/SNOMED scaffolding into SQLite")
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loinc(code TEXT PRIMARY KEY, long_name TEXT, component TEXT, property TEXT, time_aspct TEXT, system TEXT, scale_typ TEXT, method_typ TEXT);
+CREATE TABLE IF NOT EXISTS rxnorm(rxcui INTEGER PRIMARY KEY, name TEXT, tty TEXT);
+CREATE TABLE IF NOT EXISTS snomed(concept_id TEXT PRIMARY KEY, fsn TEXT);
+"""
+
+# Secondary indexes are dropped before a bulk load and rebuilt once at the end
+INDEXES: Dict[str, Tuple[str, ...]] = {
+    "loinc": ("CREATE INDEX IF NOT EXISTS idx_loinc_component ON loinc(component)",),
+    "rxnorm": ("CREATE INDEX IF NOT EXISTS idx_rxnorm_tty ON rxnorm(tty)",),
+    "snomed": (),
+}
+
+# Full-text indexes (external content, rebuilt after each import):
+# table -> (fts table, indexed columns, content rowid, id column, name column, detail column)
+FTS: Dict[str, Tuple[str, str, str, str, str, str]] = {
+    "loinc": ("loinc_fts", "long_name, component", "rowid", "code", "long_name", "component"),
+    "rxnorm": ("rxnorm_fts", "name", "rxcui", "rxcui", "name", "tty"),
+    "snomed": ("snomed_fts", "fsn", "rowid", "concept_id", "fsn", "NULL"),
+}
+# trigram = substring match like the old LIKE '%term%' (SQLite >= 3.34); otherwise word/prefix tokens
+TOKENIZERS = ("trigram", "unicode61 remove_diacritics 2")
+
+BATCH_ROWS = 10_000
+
 def _db(path: str):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     return sqlite3.connect(path)
 
+def ensure_fts(con: sqlite3.Connection, table: str) -> bool:
+    """Create the FTS5 index for `table` if missing; True when it was just created."""
+    fts, cols, rowid = FTS[table][:3]
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name=?", (fts,)).fetchone():
+        return False
+    for tok in TOKENIZERS:
+        try:
+            con.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', "
+                        f"content_rowid='{rowid}', tokenize='{tok}')")
+            return True
+        except sqlite3.OperationalError:
+            continue
+    return False
+
+def rebuild_fts(con: sqlite3.Connection, table: str):
+    fts = FTS[table][0]
+    con.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+
 @app.command("init")
 def init(db: str = typer.Option("./med-dicts.sqlite", help="sqlite path")):
     con = _db(db); cur = con.cursor()
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS loinc(code TEXT PRIMARY KEY, long_name TEXT, component TEXT, property TEXT, time_aspct TEXT, system TEXT, scale_typ TEXT, method_typ TEXT);
-    CREATE TABLE IF NOT EXISTS rxnorm(rxcui INTEGER PRIMARY KEY, name TEXT, tty TEXT);
-    CREATE TABLE IF NOT EXISTS snomed(concept_id TEXT PRIMARY KEY, fsn TEXT);
-    """)
+    cur.executescript(SCHEMA)
+    for stmts in INDEXES.values():
+        for stmt in stmts:
+            cur.execute(stmt)
+    for table in FTS:
+        if ensure_fts(con, table):
+            rebuild_fts(con, table)  # indexes rows imported before FTS existed
     con.commit(); con.close()
     print(f"[OK] initialized {db}")
 
+def _open_csv(csv_path: str, errors: str = "strict") -> Tuple[io.BufferedReader, csv.DictReader]:
+    """Open a CSV for streaming; the raw handle's tell() drives the progress bar."""
+    raw = open(csv_path, "rb")
+    text = io.TextIOWrapper(raw, encoding="utf-8", errors=errors, newline="")
+    return raw, csv.DictReader(text)
+
+def bulk_load(db: str, table: str, csv_path: str, rows_of: Callable[[csv.DictReader], Iterator[tuple]],
+              batch: int = BATCH_ROWS, errors: str = "strict", progress: bool = True) -> Dict[str, float]:
+    """Stream `csv_path` into `table` in bounded batches inside a single transaction.
+
+    WAL + synchronous=OFF during the load, secondary indexes dropped first and
+    rebuilt after (FTS included); memory stays at one batch regardless of file size.
+    """
+    con = _db(db)
+    con.executescript(SCHEMA)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=OFF")
+    con.execute("PRAGMA cache_size=-65536")
+    con.execute("PRAGMA temp_store=MEMORY")
+    ncols = len(con.execute(f"SELECT * FROM {table} LIMIT 0").description)
+    insert = f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' * ncols)})"
+    size = os.path.getsize(csv_path)
+    t0 = time.perf_counter()
+    n = 0
+    raw, reader = _open_csv(csv_path, errors)
+    try:
+        con.execute("BEGIN")
+        for row in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (table,)).fetchall():
+            con.execute(f"DROP INDEX {row[0]}")
+        con.execute(f"DELETE FROM {table}")
+        rows = rows_of(reader)
+        with Progress(TextColumn(f"[cyan]{table}"), BarColumn(), TextColumn("{task.fields[rows]:,} rows · {task.fields[rate]:,.0f}/s"),
+                      TimeRemainingColumn(), disable=not progress, transient=True) as bar:
+            task = bar.add_task(table, total=size, rows=0, rate=0.0)
+            while True:
+                chunk = list(itertools.islice(rows, batch))
+                if not chunk:
+                    break
+                con.executemany(insert, chunk)
+                n += len(chunk)
+                bar.update(task, completed=raw.tell(), rows=n, rate=n / max(time.perf_counter() - t0, 1e-9))
+        t_load = time.perf_counter() - t0
+        for stmt in INDEXES.get(table, ()):
+            con.execute(stmt)
+        ensure_fts(con, table)
+        rebuild_fts(con, table)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    finally:
+        raw.close()
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.close()
+    elapsed = time.perf_counter() - t0
+    return {"rows": n, "seconds": elapsed, "load_seconds": t_load, "index_seconds": elapsed - t_load,
+            "rows_per_s": n / elapsed if elapsed else 0.0}
+
+def _report(label: str, db: str, stats: Dict[str, float]):
+    print(f"[OK] {stats['rows']:,} {label} rows -> {db} in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_s']:,.0f} rows/s; indexes {stats['index_seconds']:.1f}s)")
+
+def _loinc_rows(r: csv.DictReader) -> Iterator[tuple]:
+    for row in r:
+        yield (row.get("LOINC_NUM"), row.get("LONG_COMMON_NAME"), row.get("COMPONENT"), row.get("PROPERTY"),
+               row.get("TIME_ASPCT"), row.get("SYSTEM"), row.get("SCALE_TYP"), row.get("METHOD_TYP"))
+
+def _rxnorm_rows(r: csv.DictReader) -> Iterator[tuple]:
+    for row in r:
+        if row.get("RXCUI"):
+            yield (int(row.get("RXCUI")), row.get("STR"), row.get("TTY"))
+
+def _snomed_rows(r: csv.DictReader) -> Iterator[tuple]:
+    for row in r:
+        if row.get("id"):
+            yield (row.get("id"), row.get("fsn"))
+
 @app.command("import-loinc")
-def import_loinc(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite")):
+def import_loinc(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite"),
+                 batch: int = typer.Option(BATCH_ROWS, help="rows per executemany batch")):
     """Importe LOINC from CSV (download from loinc.org) — honors their license terms."""
-    con = _db(db); cur = con.cursor()
-    cur.execute("DELETE FROM loinc")
-    with open(csv_path, "r", encoding="utf-8", errors="ignore") as f:
-        r = csv.DictReader(f)
-        rows = [(row.get("LOINC_NUM"), row.get("LONG_COMMON_NAME"), row.get("COMPONENT"), row.get("PROPERTY"),
-                 row.get("TIME_ASPCT"), row.get("SYSTEM"), row.get("SCALE_TYP"), row.get("METHOD_TYP")) for row in r]
-    cur.executemany("INSERT OR REPLACE INTO loinc VALUES (?,?,?,?,?,?,?,?)", rows)
-    con.commit(); con.close(); print(f"[OK] {len(rows)} LOINC rows -> {db}")
+    _report("LOINC", db, bulk_load(db, "loinc", csv_path, _loinc_rows, batch, errors="ignore"))
 
 @app.command("import-rxnorm")
-def import_rxnorm(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite")):
+def import_rxnorm(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite"),
+                  batch: int = typer.Option(BATCH_ROWS, help="rows per executemany batch")):
     """Import minimal RxNorm (CSV exported externally)."""
-    con = _db(db); cur = con.cursor()
-    cur.execute("DELETE FROM rxnorm")
-    with open(csv_path, "r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        rows = [(int(row.get("RXCUI")), row.get("STR"), row.get("TTY")) for row in r if row.get("RXCUI")]
-    cur.executemany("INSERT OR REPLACE INTO rxnorm VALUES (?,?,?)", rows)
-    con.commit(); con.close(); print(f"[OK] {len(rows)} RxNorm rows -> {db}")
+    _report("RxNorm", db, bulk_load(db, "rxnorm", csv_path, _rxnorm_rows, batch))
 
 @app.command("import-snomed")
-def import_snomed(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite")):
+def import_snomed(csv_path: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite"),
+                  batch: int = typer.Option(BATCH_ROWS, help="rows per executemany batch")):
     """Import SNOMED concepts from a CSV you prepared (respect licensing in your jurisdiction)."""
-    con = _db(db); cur = con.cursor()
-    cur.execute("DELETE FROM snomed")
-    with open(csv_path, "r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        rows = [(row.get("id"), row.get("fsn")) for row in r if row.get("id")]
-    cur.executemany("INSERT OR REPLACE INTO snomed VALUES (?,?)", rows)
-    con.commit(); con.close(); print(f"[OK] {len(rows)} SNOMED rows -> {db}")
+    _report("SNOMED", db, bulk_load(db, "snomed", csv_path, _snomed_rows, batch))
+
+@app.command("bench-import")
+def bench_import(rows: int = typer.Option(1_000_000, help="rows per generated CSV"),
+                 workdir: str = typer.Option("", help="keep generated files here (default: temp dir)"),
+                 batch: int = typer.Option(BATCH_ROWS)):
+    """Generate synthetic LOINC/RxNorm/SNOMED CSVs and time the streaming importers."""
+    import random, resource, shutil, tempfile
+    tmp = workdir or tempfile.mkdtemp(prefix="medcli-bench-")
+    os.makedirs(tmp, exist_ok=True)
+    rnd = random.Random(7)
+    words = ["glucose", "sodium", "amoxicillin", "metformin", "tablet", "oral", "serum", "urine", "fracture", "sepsis"]
+    specs = [
+        ("loinc", _loinc_rows, ["LOINC_NUM", "LONG_COMMON_NAME", "COMPONENT", "PROPERTY", "TIME_ASPCT", "SYSTEM", "SCALE_TYP", "METHOD_TYP"],
+         lambda i: [f"{i}-{i % 10}", " ".join(rnd.sample(words, 4)), rnd.choice(words), "MCnc", "Pt", "Ser/Plas", "Qn", ""]),
+        ("rxnorm", _rxnorm_rows, ["RXCUI", "STR", "TTY"],
+         lambda i: [i, " ".join(rnd.sample(words, 3)), rnd.choice(["IN", "SCD", "SBD", "BN"])]),
+        ("snomed", _snomed_rows, ["id", "fsn"],
+         lambda i: [str(100000 + i), " ".join(rnd.sample(words, 3)) + " (disorder)"]),
+    ]
+    db = os.path.join(tmp, "bench.sqlite")
+    try:
+        for table, rows_of, header, make in specs:
+            path = os.path.join(tmp, f"{table}.csv")
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                w = csv.writer(f); w.writerow(header)
+                for i in range(1, rows + 1):
+                    w.writerow(make(i))
+            stats = bulk_load(db, table, path, rows_of, batch, progress=False)
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024)
+            print(f"{table:7} {stats['rows']:>10,} rows  {os.path.getsize(path) / 1e6:7.1f} MB  "
+                  f"{stats['seconds']:6.1f}s  {stats['rows_per_s']:>10,.0f} rows/s  peak RSS {rss_mb:.0f} MB")
+    finally:
+        if not workdir:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def _match_expr(con: sqlite3.Connection, table: str, term: str) -> Optional[str]:
+    """FTS5 MATCH expression for `term`, or None when the index can't answer it."""
+    fts = FTS[table][0]
+    row = con.execute("SELECT sql FROM sqlite_master WHERE name=?", (fts,)).fetchone()
+    if not row:
+        return None
+    if "trigram" in row[0]:
+        # trigram needs >= 3 chars; the quoted phrase is a substring match
+        return '"' + term.replace('"', '""') + '"' if len(term) >= 3 else None
+    words = re.findall(r"\w+", term)
+    return " ".join(f'"{w}"' for w in words) + "*" if words else None
+
+def search(con: sqlite3.Connection, term: str, tables: Iterable[str], limit: int = 20) -> List[dict]:
+    """Ranked (bm25) search over the chosen dictionaries, merged and limited."""
+    parts, params = [], []
+    for table in tables:
+        fts, _, rowid, id_col, name_col, detail_col = FTS[table]
+        expr = _match_expr(con, table, term)
+        cols = f"'{table}' AS dict, t.{id_col} AS id, t.{name_col} AS name, {'NULL' if detail_col == 'NULL' else 't.' + detail_col} AS detail"
+        if expr is not None:
+            parts.append(f"SELECT * FROM (SELECT {cols}, bm25({fts}) AS score FROM {fts} "
+                         f"JOIN {table} t ON t.{rowid} = {fts}.rowid WHERE {fts} MATCH ? ORDER BY score LIMIT ?)")
+            params += [expr, limit]
+        else:
+            # no usable index (old DB or term too short): bounded LIKE scan
+            parts.append(f"SELECT * FROM (SELECT {cols}, 0.0 AS score FROM {table} t "
+                         f"WHERE t.{name_col} LIKE ? ORDER BY length(t.{name_col}) LIMIT ?)")
+            params += [f"%{term}%", limit]
+    if not parts:
+        return []
+    cur = con.execute(" UNION ALL ".join(parts) + " ORDER BY score LIMIT ?", params + [limit])
+    return [dict(zip([c[0] for c in cur.description], row)) for row in cur.fetchall()]
 
 @app.command("lookup")
-def lookup(term: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite")):
-    """Search across dictionaries (LIKE)."""
-    con = _db(db); cur = con.cursor()
-    cur.row_factory = sqlite3.Row
-    out = {"loinc": [], "rxnorm": [], "snomed": []}
-    for tbl, cols, txt in [("loinc","code,long_name","long_name"),("rxnorm","rxcui,name,tty","name"),("snomed","concept_id,fsn","fsn")]:
-        cur.execute(f"SELECT {cols} FROM {tbl} WHERE {txt} LIKE ?", (f"%{term}%",))
-        out[tbl] = [dict(row) for row in cur.fetchall()]
-    con.close(); print(out)
+def lookup(term: str = typer.Argument(...), db: str = typer.Option("./med-dicts.sqlite"),
+           limit: int = typer.Option(20, min=1, help="max results (all dictionaries together)"),
+           dictionary: List[str] = typer.Option(None, "--dict", "-d", help="loinc|rxnorm|snomed (repeatable; default all)")):
+    """Search across dictionaries (FTS5, ranked by bm25)."""
+    tables = dictionary or list(FTS)
+    unknown = [t for t in tables if t not in FTS]
+    if unknown:
+        raise typer.BadParameter(f"unknown dictionary: {', '.join(unknown)}")
+    con = _db(db)
+    try:
+        results = search(con, term.strip(), tables, limit)
+    finally:
+        con.close()
+    print({"term": term, "count": len(results), "results": results})
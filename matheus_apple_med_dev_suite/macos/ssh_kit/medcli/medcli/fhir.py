@@ -1,13 +1,117 @@
-import os, json, typing as t
+import os, json, asyncio, typing as t
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urljoin
 import httpx, typer
 from rich import print
 from pydantic import BaseModel
 
 app = typer.Typer(help="FHIR client (R4) via HTTP")
 
+FHIR_JSON = {"Accept": "application/fhir+json"}
+MAX_PAGES = 1000
+
 def _client(timeout=20.0):
     return httpx.Client(timeout=timeout)
 
+def next_link(bundle: dict) -> t.Optional[str]:
+    for link in bundle.get("link", []):
+        if link.get("relation") == "next" and link.get("url"):
+            return link["url"]
+    return None
+
+Params = t.Union[dict, t.Sequence[t.Tuple[str, str]], None]
+
+def iter_pages(client: httpx.Client, base: str, resource: str, params: Params = None,
+               elements: t.Optional[t.Sequence[str]] = None, summary: t.Optional[str] = None,
+               prefetch: bool = True, max_pages: int = MAX_PAGES) -> t.Iterator[dict]:
+    """Yield search Bundles page by page, following Bundle.link[next] lazily.
+
+    `elements` / `summary` map to _elements / _summary to shrink each page. With `prefetch`
+    the next page is requested in a background thread while the caller consumes the current one.
+    """
+    # list of pairs: repeated parameters (date=ge...&date=le...) are legal in FHIR searches
+    params = list(params.items()) if isinstance(params, dict) else list(params or [])
+    if elements:
+        params.append(("_elements", ",".join(elements)))
+    if summary:
+        params.append(("_summary", summary))
+    url = f"{base.rstrip('/')}/{resource.lstrip('/')}"
+
+    def fetch(u: str, p: Params) -> dict:
+        r = client.get(u, params=p, headers=FHIR_JSON)
+        r.raise_for_status()
+        return r.json()
+
+    seen = set()
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        pending = pool.submit(fetch, url, params)
+        pages = 0
+        while pending is not None:
+            bundle = pending.result()
+            pages += 1
+            nxt = next_link(bundle)
+            nxt = urljoin(url, nxt) if nxt else None  # some servers return relative links
+            if nxt in seen or pages >= max_pages:
+                nxt = None  # server looping, or page cap reached
+            if nxt:
+                seen.add(nxt)
+            # the next link already carries the query (and the server's paging state)
+            pending = pool.submit(fetch, nxt, None) if nxt and prefetch else None
+            yield bundle
+            if nxt and not prefetch:
+                pending = pool.submit(fetch, nxt, None)
+    finally:
+        # consumer stopped early: don't wait for a prefetch nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_resources(client: httpx.Client, base: str, resource: str, params: Params = None,
+                   elements: t.Optional[t.Sequence[str]] = None, summary: t.Optional[str] = None,
+                   prefetch: bool = True, max_pages: int = MAX_PAGES) -> t.Iterator[dict]:
+    """Stream Bundle.entry[].resource across all pages (search outcome warnings are skipped)."""
+    for bundle in iter_pages(client, base, resource, params, elements, summary, prefetch, max_pages):
+        for e in bundle.get("entry", []):
+            if e.get("search", {}).get("mode") != "outcome" and "resource" in e:
+                yield e["resource"]
+
+async def aiter_resources(client, base: str, resource: str, params: Params = None,
+                          elements: t.Optional[t.Sequence[str]] = None, summary: t.Optional[str] = None,
+                          max_pages: int = MAX_PAGES) -> t.AsyncIterator[dict]:
+    """Async iter_resources: `client` is an httpx.AsyncClient (or medcli.client.AsyncClient);
+    the next page is requested as a task while the current one is consumed."""
+    params = list(params.items()) if isinstance(params, dict) else list(params or [])
+    if elements:
+        params.append(("_elements", ",".join(elements)))
+    if summary:
+        params.append(("_summary", summary))
+    url = f"{base.rstrip('/')}/{resource.lstrip('/')}"
+
+    async def fetch(u: str, p: Params) -> dict:
+        r = await client.get(u, params=p, headers=FHIR_JSON)
+        r.raise_for_status()
+        return r.json()
+
+    seen = set()
+    pending = asyncio.ensure_future(fetch(url, params))
+    pages = 0
+    try:
+        while pending is not None:
+            bundle = await pending
+            pages += 1
+            nxt = next_link(bundle)
+            nxt = urljoin(url, nxt) if nxt else None
+            if nxt in seen or pages >= max_pages:
+                nxt = None
+            if nxt:
+                seen.add(nxt)
+            pending = asyncio.ensure_future(fetch(nxt, None)) if nxt else None
+            for e in bundle.get("entry", []):
+                if e.get("search", {}).get("mode") != "outcome" and "resource" in e:
+                    yield e["resource"]
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
 @app.command("get")
 def get(base: str = typer.Argument(..., help="FHIR base, e.g. https://hapi.fhir.org/baseR4"),
         path: str = typer.Argument(..., help="resource path, e.g. Patient/123 or Observation?code=..."),
@@ -20,3 +124,23 @@ def get(base: str = typer.Argument(..., help="FHIR base, e.g. https://hapi.fhir.
         raise typer.Exit(1)
     data = r.json()
     typer.echo(json.dumps(data, indent=2 if pretty else None))
+
+@app.command("search")
+def search(base: str = typer.Argument(..., help="FHIR base, e.g. https://hapi.fhir.org/baseR4"),
+           query: str = typer.Argument(..., help="search, e.g. Observation?subject=Patient/123"),
+           elements: str = typer.Option("", help="comma-separated _elements to keep"),
+           summary: str = typer.Option("", help="_summary: true|text|data|count"),
+           count: int = typer.Option(100, help="_count page size"),
+           max_pages: int = typer.Option(MAX_PAGES, help="stop after this many pages")):
+    """Follow every Bundle page and print one resource per line (NDJSON)."""
+    resource, _, qs = query.partition("?")
+    params = parse_qsl(qs, keep_blank_values=True)
+    if not any(k == "_count" for k, _ in params):
+        params.append(("_count", str(count)))
+    n = 0
+    with _client() as c:
+        for res in iter_resources(c, base, resource, params, elements=[e for e in elements.split(",") if e],
+                                  summary=summary or None, max_pages=max_pages):
+            typer.echo(json.dumps(res, separators=(",", ":")))
+            n += 1
+    typer.echo(f"[OK] {n} resources", err=True)
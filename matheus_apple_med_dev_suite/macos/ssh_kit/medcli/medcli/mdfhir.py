@@ -1,6 +1,7 @@
 import os, re, json, typing as t
 import httpx, typer, yaml
 from rich import print
+from .fhir import iter_resources
 
 app = typer.Typer(help="Minimal MD<->FHIR sync (CarePlan/ServiceRequest via frontmatter)")
 
@@ -65,20 +66,18 @@ def md2fhir(md_path: str = typer.Argument(..., help="Markdown with frontmatter")
 @app.command("fhir2md")
 def fhir2md(base: str = typer.Option(...), patient: str = typer.Option(...), out_md: str = typer.Option("Plan.md")):
     """Read CarePlans and ServiceRequests for a patient and emit a Markdown summary with frontmatter."""
-    with _client() as c:
-        cps = c.get(f"{base.rstrip('/')}/CarePlan", params={"subject": f"Patient/{patient}"}, headers={"Accept":"application/fhir+json"}).json()
-        srs = c.get(f"{base.rstrip('/')}/ServiceRequest", params={"subject": f"Patient/{patient}"}, headers={"Accept":"application/fhir+json"}).json()
-
     careplan = {"title":"","notes":"","activities":[]}
-    if cps.get("entry"):
-        cp = cps["entry"][0]["resource"]
-        careplan["title"] = cp.get("title","")
-        careplan["notes"] = cp.get("description","")
-        careplan["activities"] = [a.get("detail",{}).get("description","") for a in cp.get("activity",[])]
-
     orders = []
-    for e in srs.get("entry",[]):
-        r = e["resource"]; orders.append({"code":"", "text": r.get("code",{}).get("text","")})
+    with _client() as c:
+        # only the first CarePlan is used: stop after one page instead of walking them all
+        cp = next(iter_resources(c, base, "CarePlan", {"subject": f"Patient/{patient}"},
+                                 elements=("title", "description", "activity"), prefetch=False), None)
+        if cp:
+            careplan["title"] = cp.get("title","")
+            careplan["notes"] = cp.get("description","")
+            careplan["activities"] = [a.get("detail",{}).get("description","") for a in cp.get("activity",[])]
+        for r in iter_resources(c, base, "ServiceRequest", {"subject": f"Patient/{patient}"}, elements=("code",)):
+            orders.append({"code":"", "text": r.get("code",{}).get("text","")})
 
     fm = {"careplan": careplan, "orders": orders}
     doc = f"---\n{yaml.safe_dump(fm, sort_keys=False)}---\n\n# Plan for Patient {patient}\n"
@@ -1,10 +1,19 @@
-import os, json, datetime as dt, typing as t
-import httpx, typer, pandas as pd
+import os, re, json, time, asyncio, hashlib, datetime as dt, typing as t
+from urllib.parse import parse_qsl
+import typer, pandas as pd
 from rich import print
+from .client import AsyncClient
+from .fhir import FHIR_JSON, aiter_resources
 
 app = typer.Typer(help="Obsidian bridge — render FHIR resources to Markdown notes")
 
-def _client(): return httpx.Client(timeout=30.0)
+# only what the note renders; servers that honor _elements send much smaller pages
+OBS_ELEMENTS = ("code", "valueQuantity", "effectiveDateTime", "issued")
+COND_ELEMENTS = ("code", "onsetDateTime")
+HASH_RE = re.compile(r"^content_hash: (\w+)$", re.M)
+
+def _md_escape(s: str) -> str:
+    return s.replace("|", "\\|")
 
 def _md_path(vault: str, *parts: str) -> str:
     path = os.path.join(vault, *parts)
@@ -16,6 +25,110 @@ def _write(path: str, text: str):
     with open(path, "w", encoding="utf-8") as f:
         f.write(text)
 
+def _coding(o: dict) -> t.Tuple[str, str]:
+    c = o.get("code", {}).get("coding", [{}])[0]
+    return c.get("code",""), c.get("display","")
+
+def _patient_name(patient: dict, pid: str) -> str:
+    n = patient.get("name",[{}])[0]
+    return " ".join([n.get("given",[""])[0], n.get("family","")]).strip() or f"Patient-{pid}"
+
+def render_note(pid: str, patient: dict, observations: t.Optional[t.List[dict]],
+                conditions: t.Optional[t.List[dict]]) -> t.Tuple[str, str]:
+    """(title, Markdown) for one patient, built in memory.
+
+    The frontmatter carries a hash of everything except the export date, so re-exports can
+    tell whether the clinical content changed.
+    """
+    title = f"{_patient_name(patient, pid)} — {pid}"
+    body = [f"\n# {title}\n"]
+    if observations:
+        rows = []
+        for o in observations:
+            code = _coding(o)
+            val = ""
+            if "valueQuantity" in o:
+                vq = o["valueQuantity"]; val = f"{vq.get('value','')} {vq.get('unit','')}"
+            rows.append([o.get("effectiveDateTime", o.get("issued","")), code[0], code[1], val])
+        md = ["\n## Observations\n", "| when | code | display | value |", "|---|---|---|---|"]
+        md += [f"| {r[0]} | {r[1]} | {_md_escape(r[2])} | {r[3]} |" for r in sorted(rows)]
+        body.append("\n".join(md))
+    if conditions:
+        rows = [[o.get("onsetDateTime",""), *_coding(o)] for o in conditions]
+        md = ["\n## Conditions\n", "| onset | code | display |", "|---|---|---|"]
+        md += [f"| {r[0]} | {r[1]} | {_md_escape(r[2])} |" for r in sorted(rows)]
+        body.append("\n".join(md))
+    content = "".join(body)
+    digest = hashlib.sha256(f"{title}\n{pid}\n{content}".encode("utf-8")).hexdigest()[:16]
+    today = dt.date.today().isoformat()
+    return title, f"---\ntitle: {title}\npatient_id: {pid}\ndate: {today}\ncontent_hash: {digest}\n---\n{content}"
+
+def write_note(path: str, text: str) -> bool:
+    """Write once; False (file untouched) when the existing note has the same content hash."""
+    new = HASH_RE.search(text).group(1)
+    try:
+        with open(path, encoding="utf-8") as f:
+            m = HASH_RE.search(f.read(4096))  # frontmatter is at the top
+        if m and m.group(1) == new:
+            return False
+    except FileNotFoundError:
+        pass
+    _write(path, text)
+    return True
+
+async def _fetch_patient(ac: AsyncClient, base: str, pid: str, include_obs: bool, include_cond: bool):
+    """Patient, Observations and Conditions requested concurrently (all pages)."""
+    async def read_patient():
+        r = await ac.get(f"{base.rstrip('/')}/Patient/{pid}", headers=FHIR_JSON)
+        r.raise_for_status()
+        return r.json()
+
+    async def collect(resource: str, elements: t.Sequence[str], wanted: bool):
+        if not wanted:
+            return None
+        return [o async for o in aiter_resources(ac, base, resource, {"subject": f"Patient/{pid}", "_count": "100"},
+                                                 elements=elements)]
+
+    return await asyncio.gather(read_patient(), collect("Observation", OBS_ELEMENTS, include_obs),
+                                collect("Condition", COND_ELEMENTS, include_cond))
+
+async def export_patients(base: str, pids: t.Sequence[str], vault: str, section: str = "Patients",
+                          include_obs: bool = True, include_cond: bool = True,
+                          concurrency: int = 8) -> t.List[dict]:
+    """Export many patients over one pooled async client; one result dict per patient."""
+    slots = asyncio.Semaphore(max(1, concurrency))
+    results: t.List[dict] = [{} for _ in pids]
+
+    async def one(i: int, pid: str):
+        async with slots:
+            t0 = time.perf_counter()
+            res = {"pid": pid, "status": "error", "path": "", "observations": 0, "conditions": 0, "error": ""}
+            try:
+                patient, obs, cond = await _fetch_patient(ac, base, pid, include_obs, include_cond)
+                title, text = render_note(pid, patient, obs, cond)
+                res["path"] = _md_path(vault, section, f"{title}.md")
+                res["status"] = "written" if write_note(res["path"], text) else "unchanged"
+                res["observations"], res["conditions"] = len(obs or []), len(cond or [])
+            except Exception as e:  # one patient failing doesn't stop the cohort
+                res["error"] = f"{type(e).__name__}: {e}"[:200]
+            res["seconds"] = time.perf_counter() - t0
+            results[i] = res
+
+    async with AsyncClient(use_cache=False, max_connections=max(1, concurrency) * 3) as ac:
+        await asyncio.gather(*(one(i, pid) for i, pid in enumerate(pids)))
+    return results
+
+async def _search_ids(base: str, query: str, limit: int) -> t.List[str]:
+    resource, _, qs = query.partition("?")
+    ids = []
+    async with AsyncClient(use_cache=False) as ac:
+        async for p in aiter_resources(ac, base, resource or "Patient", parse_qsl(qs, keep_blank_values=True),
+                                       elements=("id",)):
+            ids.append(p["id"])
+            if len(ids) >= limit:
+                break
+    return ids
+
 @app.command("patient")
 def patient(base: str = typer.Option(..., help="FHIR base URL"),
             pid: str = typer.Option(..., help="Patient ID (e.g., 123)"),
@@ -24,56 +137,40 @@ def patient(base: str = typer.Option(..., help="FHIR base URL"),
             include_obs: bool = typer.Option(True, help="Include Observations"),
             include_cond: bool = typer.Option(True, help="Include Conditions")):
     """Render a Patient summary and related Observations/Conditions into Obsidian Markdown."""
-    with _client() as c:
-        # patient
-        pr = c.get(f"{base.rstrip('/')}/Patient/{pid}", headers={"Accept":"application/fhir+json"})
-        pr.raise_for_status(); patient = pr.json()
-        name = " ".join([patient.get("name",[{}])[0].get("given",[""])[0], patient.get("name",[{}])[0].get("family","")]).strip() or f"Patient-{pid}"
-
-        today = dt.date.today().isoformat()
-        title = f"{name} — {pid}"
-        header = f"---\ntitle: {title}\npatient_id: {pid}\ndate: {today}\n---\n\n# {title}\n"
-        path = _md_path(vault, section, f"{title}.md")
-        _write(path, header)
-        print(f"[OK] wrote {path}")
-
-        # observations
-        if include_obs:
-            orq = c.get(f"{base.rstrip('/')}/Observation", params={"subject": f"Patient/{pid}", "_count":"100"},
-                        headers={"Accept":"application/fhir+json"})
-            orq.raise_for_status()
-            bundle = orq.json()
-            rows = []
-            for e in bundle.get("entry", []):
-                o = e.get("resource", {})
-                code = (o.get("code", {}).get("coding", [{}])[0].get("code",""),
-                        o.get("code", {}).get("coding", [{}])[0].get("display",""))
-                val = ""
-                if "valueQuantity" in o:
-                    vq = o["valueQuantity"]; val = f"{vq.get('value','')} {vq.get('unit','')}"
-                eff = o.get("effectiveDateTime", o.get("issued",""))
-                rows.append([eff, code[0], code[1], val])
-            if rows:
-                md = ["\n## Observations\n", "| when | code | display | value |", "|---|---|---|---|"]
-                for r in sorted(rows):
-                    md.append(f"| {r[0]} | {r[1]} | {r[2].replace('|','\\|')} | {r[3]} |")
-                with open(path, "a", encoding="utf-8") as f: f.write("\n".join(md))
-
-        # conditions
-        if include_cond:
-            crq = c.get(f"{base.rstrip('/')}/Condition", params={"subject": f"Patient/{pid}", "_count":"100"},
-                        headers={"Accept":"application/fhir+json"})
-            crq.raise_for_status()
-            bundle = crq.json()
-            rows = []
-            for e in bundle.get("entry", []):
-                o = e.get("resource", {})
-                code = (o.get("code", {}).get("coding", [{}])[0].get("code",""),
-                        o.get("code", {}).get("coding", [{}])[0].get("display",""))
-                onset = o.get("onsetDateTime","")
-                rows.append([onset, code[0], code[1]])
-            if rows:
-                md = ["\n## Conditions\n", "| onset | code | display |", "|---|---|---|"]
-                for r in sorted(rows):
-                    md.append(f"| {r[0]} | {r[1]} | {r[2].replace('|','\\|')} |")
-                with open(path, "a", encoding="utf-8") as f: f.write("\n".join(md))
+    res = asyncio.run(export_patients(base, [pid], vault, section, include_obs, include_cond, concurrency=1))[0]
+    if res["error"]:
+        typer.echo(f"[ERR] {pid}: {res['error']}", err=True)
+        raise typer.Exit(1)
+    print(f"[OK] {'wrote' if res['status'] == 'written' else 'unchanged'} {res['path']}")
+
+@app.command("cohort")
+def cohort(base: str = typer.Option(..., help="FHIR base URL"),
+           vault: str = typer.Option(..., help="Obsidian vault path"),
+           pids: str = typer.Option("", help="Comma-separated Patient IDs"),
+           pid_file: str = typer.Option("", help="File with one Patient ID per line"),
+           search: str = typer.Option("", help="FHIR search for the cohort, e.g. 'Patient?address-city=Boston'"),
+           limit: int = typer.Option(500, help="Max patients taken from --search"),
+           section: str = typer.Option("Patients", help="Folder inside vault"),
+           include_obs: bool = typer.Option(True, help="Include Observations"),
+           include_cond: bool = typer.Option(True, help="Include Conditions"),
+           concurrency: int = typer.Option(8, min=1, help="Patients exported at the same time")):
+    """Export many patients concurrently; unchanged notes are left untouched."""
+    ids = [p.strip() for p in pids.split(",") if p.strip()]
+    if pid_file:
+        with open(pid_file, encoding="utf-8") as f:
+            ids += [l.split("#", 1)[0].strip() for l in f if l.split("#", 1)[0].strip()]
+    if search:
+        ids += asyncio.run(_search_ids(base, search, limit))
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise typer.BadParameter("no patients: use --pids, --pid-file or --search")
+    t0 = time.perf_counter()
+    results = asyncio.run(export_patients(base, ids, vault, section, include_obs, include_cond, concurrency))
+    for r in results:
+        detail = r["error"] or f"obs={r['observations']} cond={r['conditions']}  {os.path.basename(r['path'])}"
+        print(f"{r['pid']:>14}  {r['status']:9}  {r['seconds']:6.2f}s  {detail}")
+    counts = {s: sum(1 for r in results if r["status"] == s) for s in ("written", "unchanged", "error")}
+    print(f"[OK] {len(results)} patients in {time.perf_counter() - t0:.1f}s: {counts['written']} written, "
+          f"{counts['unchanged']} unchanged, {counts['error']} failed -> {os.path.join(vault, section)}")
+    if counts["error"]:
+        raise typer.Exit(1)
@@ -1,16 +1,16 @@
-import json, urllib.parse
-import httpx, typer
+import json
+import typer
 from rich import print
+from .client import OPENFDA, get_client
 
 app = typer.Typer(help="OpenFDA (drugs)")
 
-BASE="https://api.fda.gov/drug"
+BASE=f"{OPENFDA}/drug"
 
 @app.command("query")
 def query(endpoint: str = typer.Argument("label", help="label|event|enforcement"),
           search: str = typer.Argument('openfda.brand_name:"aspirin"'),
           limit: int = 5, skip: int = 0):
-    url = f"{BASE}/{endpoint}.json?search={urllib.parse.quote(search)}&limit={limit}&skip={skip}"
-    r = httpx.get(url, timeout=30.0)
+    r = get_client().get(f"{BASE}/{endpoint}.json", params={"search": search, "limit": limit, "skip": skip})
     r.raise_for_status()
     print(r.json())
@@ -1,6 +1,8 @@
-import os, json, typing as t, datetime as dt
+import os, re, json, sqlite3, time, typing as t, datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 import httpx, typer
 from rich import print
+from .fhir import iter_resources
 
 # We use matplotlib without specifying styles or colors.
 import matplotlib
@@ -11,31 +13,53 @@ app = typer.Typer(help="Plot utilities (FHIR Observations -> PNG)")
 
 def _client(): return httpx.Client(timeout=30.0)
 
-@app.command("obs")
-def plot_obs(base: str = typer.Option(..., help="FHIR base URL"),
-             patient: str = typer.Option(..., help="Patient ID"),
-             code: str = typer.Option(..., help="LOINC code or code display"),
-             out_png: str = typer.Option("obs.png", help="Output PNG path"),
-             title: str = typer.Option("", help="Optional chart title")):
-    """Fetch Observations for a patient filtered by `code` and plot value over time."""
-    with _client() as c:
-        params = {"subject": f"Patient/{patient}", "_count":"200"}
-        r = c.get(f"{base.rstrip('/')}/Observation", params=params, headers={"Accept":"application/fhir+json"})
-        r.raise_for_status(); bundle = r.json()
-
-    xs, ys = [], []
-    unit = ""
-    for e in bundle.get("entry", []):
-        o = e.get("resource", {})
-        coding = (o.get("code",{}).get("coding",[{}])[0])
-        ccode = str(coding.get("code","")).lower()
-        cdisp = str(coding.get("display","")).lower()
-        if not (code.lower() in ccode or code.lower() in cdisp):
+OBS_ELEMENTS = ("code", "valueQuantity", "effectiveDateTime", "issued")
+LOINC_SYSTEM = "http://loinc.org"
+LOINC_RE = re.compile(r"^\d{1,7}-\d$")
+SERIES_TTL = 3600
+
+# --- series cache (extracted points only, for re-plotting without refetching) ---
+
+def _series_db() -> sqlite3.Connection:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    path = os.environ.get("MEDCLI_OBS_CACHE") or os.path.join(base, "medcli", "obs.sqlite")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    con = sqlite3.connect(path, check_same_thread=False)
+    con.execute("CREATE TABLE IF NOT EXISTS series(key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, data TEXT NOT NULL)")
+    return con
+
+def _series_key(base: str, patient: str, code: str, since: str, until: str) -> str:
+    return "|".join([base.rstrip("/"), patient, code, since, until])
+
+# --- fetch ---
+
+def server_code(code: str) -> t.Optional[str]:
+    """Token for the `code` search param, or None when `code` is display text (client-side match)."""
+    if "|" in code:
+        return code
+    if LOINC_RE.match(code):
+        return f"{LOINC_SYSTEM}|{code}"
+    return None
+
+def _matches(o: dict, code: str) -> bool:
+    """Client-side check; also guards against servers that silently ignore search params."""
+    system, _, value = code.rpartition("|") if "|" in code else ("", "", code)
+    for coding in o.get("code", {}).get("coding", []) or [{}]:
+        if "|" in code:
+            if str(coding.get("code", "")) == value and (not system or coding.get("system") == system):
+                return True
+        elif code.lower() in str(coding.get("code", "")).lower() or code.lower() in str(coding.get("display", "")).lower():
+            return True
+    return False
+
+def _points(resources: t.Iterable[dict], code: str) -> t.Tuple[t.List[t.Tuple[str, float]], str, str]:
+    pts, unit, label = [], "", ""
+    for o in resources:
+        if not _matches(o, code):
             continue
         when = o.get("effectiveDateTime") or o.get("issued")
-        if not when: 
+        if not when:
             continue
-        x = dt.datetime.fromisoformat(when.replace("Z","+00:00"))
         y = None
         if "valueQuantity" in o:
             vq = o["valueQuantity"]
@@ -45,17 +69,102 @@ def plot_obs(base: str = typer.Option(..., help="FHIR base URL"),
             except Exception:
                 y = None
         if y is not None:
-            xs.append(x); ys.append(y)
+            pts.append((when, y))
+            label = label or o.get("code", {}).get("text") or (o.get("code", {}).get("coding") or [{}])[0].get("display", "")
+    return pts, unit, label
+
+def fetch_series(c: httpx.Client, base: str, patient: str, code: str, since: str = "", until: str = "") -> dict:
+    """Points for one code, filtered on the server when possible.
+
+    LOINC codes (or system|code tokens) go to the server as `code=` with `date=` bounds and
+    `_sort=date`; a bare LOINC code that finds nothing as `http://loinc.org|code` is retried
+    without the system. An empty filtered result is the answer: only when the server rejects the
+    params (400/422) do we fall back to a plain subject search filtered here. Servers that ignore
+    `code` need no fallback, since every resource still goes through `_matches`. Display text is
+    always matched client-side.
+    """
+    t0 = time.perf_counter()
+    subject = {"subject": f"Patient/{patient}", "_count": "200"}
+    dates = [("date", f"ge{since}")] * bool(since) + [("date", f"le{until}")] * bool(until)
+    attempts = []
+    token = server_code(code)
+    if token:
+        attempts.append(("server", list(subject.items()) + [("code", token), ("_sort", "date")] + dates))
+        if "|" in token and "|" not in code:
+            attempts.append(("server", list(subject.items()) + [("code", code), ("_sort", "date")] + dates))
+    attempts.append(("client", list(subject.items()) + dates))
+    found = None
+    for mode, params in attempts:
+        if mode == "client" and found is not None:
+            break  # the server filtered and answered (possibly empty): don't page the whole history
+        try:
+            found = _points(iter_resources(c, base, "Observation", params, elements=OBS_ELEMENTS), code), mode
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (400, 422) and mode == "server":
+                continue
+            raise
+        if found[0][0]:
+            break
+    (pts, unit, label), mode = found
+    pts.sort()
+    return {"code": code, "label": label or code, "unit": unit, "points": pts, "mode": mode,
+            "seconds": time.perf_counter() - t0}
+
+def load_series(base: str, patient: str, codes: t.Sequence[str], since: str = "", until: str = "",
+                max_age: int = SERIES_TTL, refresh: bool = False, workers: int = 4) -> t.List[dict]:
+    """Series for every code: cached ones from disk, the rest fetched concurrently."""
+    con = _series_db()
+    out: t.Dict[str, dict] = {}
+    try:
+        if not refresh:
+            for code in codes:
+                row = con.execute("SELECT fetched_at, data FROM series WHERE key = ?",
+                                  (_series_key(base, patient, code, since, until),)).fetchone()
+                if row and time.time() - row[0] < max_age:
+                    out[code] = {**json.loads(row[1]), "mode": "cache", "seconds": 0.0}
+        missing = [code for code in dict.fromkeys(codes) if code not in out]
+        if missing:
+            with _client() as c, ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+                for series in pool.map(lambda code: fetch_series(c, base, patient, code, since, until), missing):
+                    out[series["code"]] = series
+                    data = {k: series[k] for k in ("code", "label", "unit", "points")}
+                    con.execute("INSERT OR REPLACE INTO series VALUES (?,?,?)",
+                                (_series_key(base, patient, series["code"], since, until), time.time(), json.dumps(data)))
+            con.commit()
+    finally:
+        con.close()
+    return [out[code] for code in dict.fromkeys(codes)]
 
-    if not xs:
+@app.command("obs")
+def plot_obs(base: str = typer.Option(..., help="FHIR base URL"),
+             patient: str = typer.Option(..., help="Patient ID"),
+             code: t.List[str] = typer.Option(..., help="LOINC code, system|code or code display (repeatable)"),
+             out_png: str = typer.Option("obs.png", help="Output PNG path"),
+             title: str = typer.Option("", help="Optional chart title"),
+             since: str = typer.Option("", help="Only observations on/after this date (YYYY-MM-DD)"),
+             until: str = typer.Option("", help="Only observations on/before this date"),
+             max_age: int = typer.Option(SERIES_TTL, help="Reuse cached series younger than this (s)"),
+             refresh: bool = typer.Option(False, "--refresh", help="Ignore the local series cache")):
+    """Fetch Observations for a patient filtered by `code` and plot value over time."""
+    all_series = load_series(base, patient, code, since, until, max_age=max_age, refresh=refresh)
+    for s in all_series:
+        print(f"{s['code']}: {len(s['points'])} points ({s['mode']}, {s['seconds']:.2f}s)")
+    all_series = [s for s in all_series if s["points"]]
+    if not all_series:
         typer.echo("[WARN] no matching observations found"); raise typer.Exit(1)
 
-    # Plot (single line)
-    plt.figure()              # single, no style, no color set
-    plt.plot(xs, ys, marker="o")
+    # Plot (one line per code)
+    plt.figure()              # no style, no color set
+    for s in all_series:
+        xs = [dt.datetime.fromisoformat(w.replace("Z","+00:00")) for w, _ in s["points"]]
+        plt.plot(xs, [y for _, y in s["points"]], marker="o", label=s["label"])
     plt.xlabel("time")
+    units = {s["unit"] for s in all_series}
+    unit = units.pop() if len(units) == 1 else ""
     ylabel = f"value {('('+unit+')') if unit else ''}"
     plt.ylabel(ylabel)
+    if len(all_series) > 1:
+        plt.legend()
     if title:
         plt.title(title)
     plt.grid(True, which="both", axis="both")
@@ -1,20 +1,18 @@
-import json, urllib.parse
-import httpx, typer
+import json
+import typer
 from rich import print
+from .client import RXNAV, get_client
 
 app = typer.Typer(help="RxNav / RxNorm")
 
 @app.command("rxcui")
 def rxcui(term: str):
-    url = f"https://rxnav.nlm.nih.gov/REST/approximateTerm.json?term={urllib.parse.quote(term)}"
-    r = httpx.get(url, timeout=30.0); r.raise_for_status(); print(r.json())
+    print(get_client().get_json(f"{RXNAV}/approximateTerm.json", params={"term": term}))
 
 @app.command("properties")
 def properties(rxcui: int):
-    url = f"https://rxnav.nlm.nih.gov/REST/rxcui/{rxcui}/properties.json"
-    r = httpx.get(url, timeout=30.0); r.raise_for_status(); print(r.json())
+    print(get_client().get_json(f"{RXNAV}/rxcui/{rxcui}/properties.json"))
 
 @app.command("interactions")
 def interactions(rxcui: int):
-    url = f"https://rxnav.nlm.nih.gov/REST/interaction/interaction.json?rxcui={rxcui}"
-    r = httpx.get(url, timeout=30.0); r.raise_for_status(); print(r.json())
+    print(get_client().get_json(f"{RXNAV}/interaction/interaction.json", params={"rxcui": rxcui}))
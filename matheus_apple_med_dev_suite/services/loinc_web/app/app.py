@@ -1,22 +1,167 @@
-import os, sqlite3, typing as t
+import os, queue, re, sqlite3, threading, time, typing as t, unicodedata
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 
 DB_PATH = os.environ.get("DB_PATH", "/data/loinc.sqlite")
-app = FastAPI(title="LOINC Web", version="1.0.0")
+POOL_SIZE = int(os.environ.get("LOINC_POOL_SIZE", "8"))
+MMAP_MB = int(os.environ.get("LOINC_MMAP_MB", "256"))
+CACHE_MB = int(os.environ.get("LOINC_CACHE_MB", "32"))
+# Intervalo (s) para reverificar se o arquivo do banco foi trocado (reimport)
+RECHECK_S = float(os.environ.get("LOINC_DB_RECHECK", "5"))
+
+# SQL fixo em constantes: o cache de statements do sqlite3 (por conexão) reaproveita
+# o statement preparado entre requisições.
+# bm25 com pesos por coluna do loinc_fts: long_name, component, class
+BM25 = "bm25(loinc_fts, 10.0, 5.0, 1.0)"
+SQL_CODE = "SELECT * FROM loinc WHERE code = ?"
+SQL_SEARCH_FTS = f"SELECT l.* FROM loinc_fts f JOIN loinc l ON l.rowid=f.rowid WHERE loinc_fts MATCH ? ORDER BY {BM25} LIMIT ? OFFSET ?"
+SQL_SEARCH_LIKE = "SELECT * FROM loinc WHERE long_name LIKE ? OR component LIKE ? LIMIT ? OFFSET ?"
+UI_COLS = "code,long_name,component,property,time_aspct,system,scale_typ,method_typ,class"
+SQL_UI_FTS = ("SELECT l.code, l.long_name, l.component, l.property, l.time_aspct, l.system, l.scale_typ, l.method_typ, l.class "
+              f"FROM loinc_fts f JOIN loinc l ON l.rowid=f.rowid WHERE loinc_fts MATCH ? ORDER BY {BM25} LIMIT ?")
+SQL_UI_LIKE = f"SELECT {UI_COLS} FROM loinc WHERE long_name LIKE ? OR component LIKE ? LIMIT ?"
+# Autocomplete: códigos por faixa na PK (LIKE não usa o índice BINARY) + nomes numa única consulta
+SQL_SUGGEST_CODES = "SELECT 'code' AS kind, code, long_name FROM (SELECT code, long_name FROM loinc WHERE code >= ? AND code < ? ORDER BY code LIMIT ?)"
+SQL_SUGGEST_TYPEAHEAD = SQL_SUGGEST_CODES + (
+    " UNION ALL SELECT 'name', code, long_name FROM ("
+    "SELECT l.code, l.long_name FROM loinc_typeahead t JOIN loinc l ON l.code=t.code WHERE t.prefix=? ORDER BY t.pos LIMIT ?)")
+SQL_SUGGEST_FTS = SQL_SUGGEST_CODES + (
+    " UNION ALL SELECT 'name', code, long_name FROM ("
+    f"SELECT l.code, l.long_name FROM loinc_fts f JOIN loinc l ON l.rowid=f.rowid WHERE loinc_fts MATCH ? ORDER BY {BM25} LIMIT ?)")
+SQL_SUGGEST_NAME = "SELECT 'name' AS kind, code, long_name FROM loinc WHERE long_name LIKE ? ORDER BY long_name LIMIT ?"
+# Mesmo limite usado em scripts/loinc_import.py ao gerar loinc_typeahead
+TYPEAHEAD_MAX_PREFIX = 12
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_words(text: str) -> t.List[str]:
+    """Palavras em minúsculas e sem acentos (mesma regra do importador)."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _WORD_RE.findall(text)
+
+
+def fts_query(text: str, column: t.Optional[str] = None, max_terms: int = 8) -> t.Optional[str]:
+    """Converte texto livre numa expressão MATCH segura.
+
+    Cada palavra vira uma frase entre aspas (operadores/aspas do usuário não chegam
+    ao FTS5) e a última ganha '*' para casar por prefixo enquanto se digita.
+    """
+    words = normalize_words(text)[:max_terms]
+    if not words:
+        return None
+    expr = " ".join(f'"{w}"' for w in words) + "*"
+    return f"{column} : ({expr})" if column else expr
+
+class LoincDB:
+    """Pool de conexões somente leitura ao SQLite, por processo (worker).
+
+    A detecção de FTS5/typeahead é feita uma vez ao abrir o banco; o arquivo só é
+    reverificado (stat) a cada RECHECK_S segundos, e se for substituído
+    (inode/mtime diferentes) o pool é descartado e reaberto.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.has_fts = False
+        self.has_typeahead = False
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._sig: t.Optional[tuple] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False, cached_statements=64)
+        con.row_factory = sqlite3.Row
+        con.execute("PRAGMA query_only=1")
+        con.execute(f"PRAGMA mmap_size={MMAP_MB * 1024 * 1024}")
+        con.execute(f"PRAGMA cache_size=-{CACHE_MB * 1024}")
+        con.execute("PRAGMA temp_store=MEMORY")
+        return con
+
+    def _drain(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def refresh(self, force: bool = False):
+        """(Re)abre o pool se o arquivo mudou; barato quando chamado com frequência."""
+        now = time.monotonic()
+        if not force and self._sig is not None and now - self._checked < RECHECK_S:
+            return
+        with self._lock:
+            if not force and self._sig is not None and now - self._checked < RECHECK_S:
+                return
+            self._checked = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._drain()
+                self._sig = None
+                raise FileNotFoundError(f"DB not found at {self.path}. Did you import LOINC?")
+            sig = (st.st_ino, st.st_mtime_ns)
+            if sig == self._sig:
+                return
+            self._drain()
+            con = self._connect()
+            tables = {r[0] for r in con.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('loinc_fts','loinc_typeahead')")}
+            self.has_fts = "loinc_fts" in tables
+            self.has_typeahead = "loinc_typeahead" in tables
+            self._pool.put(con)
+            self._sig = sig
+
+    @contextmanager
+    def connection(self):
+        self.refresh()
+        sig = self._sig
+        try:
+            con = self._pool.get_nowait()
+        except queue.Empty:
+            con = self._connect()
+        try:
+            yield con
+        finally:
+            # Conexões além do tamanho do pool, ou de um banco já substituído, são fechadas
+            if sig == self._sig and self._pool.qsize() < self.size:
+                self._pool.put(con)
+            else:
+                con.close()
+
+    def close(self):
+        with self._lock:
+            self._drain()
+            self._sig = None
+
+
+DB = LoincDB(DB_PATH)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        DB.refresh(force=True)
+    except FileNotFoundError:
+        pass  # banco ainda não importado: abre na primeira requisição
+    yield
+    DB.close()
+
+
+app = FastAPI(title="LOINC Web", version="1.0.0", lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
 os.makedirs("/data", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 def get_conn():
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"DB not found at {DB_PATH}. Did you import LOINC?")
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
+    return DB.connection()
 
 @app.get("/api/ping")
 def ping():
@@ -25,7 +170,7 @@ def ping():
 @app.get("/api/loinc/code/{code}")
 def get_code(code: str):
     with get_conn() as con:
-        cur = con.execute("SELECT * FROM loinc WHERE code = ?", (code,))
+        cur = con.execute(SQL_CODE, (code,))
         row = cur.fetchone()
         if not row:
             raise HTTPException(404, "LOINC code not found")
@@ -35,23 +180,37 @@ def get_code(code: str):
 def search_loinc(q: str = Query(..., min_length=1, max_length=100), limit: int = 25, offset: int = 0):
     with get_conn() as con:
         # Use FTS when available; fallback to LIKE
-        has_fts = con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='loinc_fts'").fetchone() is not None
-        if has_fts:
-            sql = "SELECT l.* FROM loinc l JOIN loinc_fts f ON l.rowid=f.rowid WHERE loinc_fts MATCH ? LIMIT ? OFFSET ?"
-            params = (q.strip(), limit, offset)
+        if DB.has_fts:
+            match = fts_query(q)
+            if match is None:
+                return {"items": [], "count": 0, "limit": limit, "offset": offset}
+            sql = SQL_SEARCH_FTS
+            params = (match, limit, offset)
         else:
-            sql = "SELECT * FROM loinc WHERE long_name LIKE ? OR component LIKE ? LIMIT ? OFFSET ?"
+            sql = SQL_SEARCH_LIKE
             params = (f"%{q}%", f"%{q}%", limit, offset)
         rows = [dict(r) for r in con.execute(sql, params).fetchall()]
         return {"items": rows, "count": len(rows), "limit": limit, "offset": offset}
 
 @app.get("/api/loinc/suggest")
-def suggest(prefix: str = Query(..., min_length=1), limit: int = 10):
-    pref = prefix.strip() + "%"
+def suggest(prefix: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50)):
+    pref = prefix.strip()
+    code_range = (pref, pref + "\uffff", limit)
+    words = normalize_words(pref)
     with get_conn() as con:
-        rows = [r["code"] for r in con.execute("SELECT code FROM loinc WHERE code LIKE ? ORDER BY code LIMIT ?", (pref, limit)).fetchall()]
-        names = [r["long_name"] for r in con.execute("SELECT long_name FROM loinc WHERE long_name LIKE ? ORDER BY long_name LIMIT ?", (pref, limit)).fetchall()]
-        return {"codes": rows, "names": names}
+        if DB.has_typeahead and len(words) == 1 and len(words[0]) <= TYPEAHEAD_MAX_PREFIX:
+            rows = con.execute(SQL_SUGGEST_TYPEAHEAD, code_range + (words[0], limit)).fetchall()
+        elif DB.has_fts and words:
+            rows = con.execute(SQL_SUGGEST_FTS, code_range + (fts_query(pref, "long_name"), limit)).fetchall()
+        else:
+            rows = con.execute(SQL_SUGGEST_CODES, code_range).fetchall()
+            rows += con.execute(SQL_SUGGEST_NAME, (pref + "%", limit)).fetchall()
+    items = [dict(r) for r in rows]
+    return {
+        "codes": [r["code"] for r in items if r["kind"] == "code"],
+        "names": [r["long_name"] for r in items if r["kind"] == "name"],
+        "items": items,
+    }
 
 # ---- UI (HTMX) ----
 @app.get("/", response_class=HTMLResponse)
@@ -61,12 +220,14 @@ def index(request: Request):
 @app.get("/ui/search", response_class=HTMLResponse)
 def ui_search(request: Request, q: str = Query(...), limit: int = 25):
     with get_conn() as con:
-        has_fts = con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='loinc_fts'").fetchone() is not None
-        if has_fts:
-            sql = "SELECT l.code, l.long_name, l.component, l.property, l.time_aspct, l.system, l.scale_typ, l.method_typ, l.class FROM loinc l JOIN loinc_fts f ON l.rowid=f.rowid WHERE loinc_fts MATCH ? LIMIT ?"
-            params = (q.strip(), limit)
+        if DB.has_fts:
+            match = fts_query(q)
+            if match is None:
+                return templates.TemplateResponse("_rows.html", {"request": request, "rows": []})
+            sql = SQL_UI_FTS
+            params = (match, limit)
         else:
-            sql = "SELECT code,long_name,component,property,time_aspct,system,scale_typ,method_typ,class FROM loinc WHERE long_name LIKE ? OR component LIKE ? LIMIT ?"
+            sql = SQL_UI_LIKE
             params = (f"%{q}%", f"%{q}%", limit)
         rows = [dict(r) for r in con.execute(sql, params).fetchall()]
     return templates.TemplateResponse("_rows.html", {"request": request, "rows": rows})
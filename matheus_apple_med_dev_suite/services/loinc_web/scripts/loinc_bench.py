@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+loinc_bench.py — Benchmark de carga do /api/loinc/search (requisições/s e latência).
+Só usa a biblioteca padrão; rode contra um servidor já no ar (uvicorn/Docker).
+Uso:
+  python loinc_bench.py --url http://localhost:8080 --concurrency 16 --duration 10
+  python loinc_bench.py --url http://localhost:8080 --queries glucose,sodium,hemoglobin
+"""
+import argparse, http.client, threading, time, urllib.parse
+
+DEFAULT_QUERIES = "glucose,hemoglobin,sodium,potassium,creatinine,albumin,cholesterol,troponin"
+
+def worker(host, port, queries, limit, deadline, lat, errors, idx):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    i = idx
+    while time.perf_counter() < deadline:
+        q = queries[i % len(queries)]
+        i += 1
+        path = "/api/loinc/search?" + urllib.parse.urlencode({"q": q, "limit": limit})
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors.append(resp.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        lat.append(time.perf_counter() - t0)
+    conn.close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8080")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0, help="Segundos de carga")
+    ap.add_argument("--limit", type=int, default=25)
+    ap.add_argument("--queries", default=DEFAULT_QUERIES, help="Termos separados por vírgula")
+    args = ap.parse_args()
+
+    u = urllib.parse.urlparse(args.url)
+    queries = [q.strip() for q in args.queries.split(",") if q.strip()]
+    lat, errors = [], []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=worker, args=(u.hostname, u.port or 80, queries, args.limit, deadline, lat, errors, i))
+               for i in range(args.concurrency)]
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t0
+
+    lat.sort()
+    pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] * 1000 if lat else 0.0
+    print(f"requisições: {len(lat)}  erros: {len(errors)}  tempo: {elapsed:.1f}s  concorrência: {args.concurrency}")
+    print(f"req/s: {len(lat) / elapsed:.1f}")
+    print(f"latência ms  p50={pct(0.50):.1f}  p95={pct(0.95):.1f}  p99={pct(0.99):.1f}")
+
+if __name__ == "__main__":
+    main()
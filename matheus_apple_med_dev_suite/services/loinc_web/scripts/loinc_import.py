@@ -4,76 +4,256 @@ loinc_import.py — Importa LOINC (CSV) para SQLite com FTS5.
 Requer: arquivo CSV oficial (ex.: LoincTableCore.csv) após aceitar a licença no site LOINC.
 Uso:
   python loinc_import.py --csv /path/LoincTableCore.csv --db /data/loinc.sqlite
+  python loinc_import.py --csv /path/LoincTableCore.csv --db /data/loinc.sqlite --delta
+
+O banco é sempre montado numa cópia-sombra (<db>.shadow) e publicado por troca
+atômica: o arquivo vira <db>.<timestamp> e <db> passa a ser um symlink para ele
+(os -wal/-shm de cada versão ficam separados, leitores antigos seguem na versão
+anterior até reabrir). Com --delta a sombra parte do banco atual e só as linhas
+novas/alteradas/removidas (por code + hash do conteúdo) são gravadas; o FTS
+acompanha via triggers.
+
+Além da tabela FTS5 (com índices de prefixo), gera loinc_typeahead: para cada
+prefixo (até TYPEAHEAD_MAX_PREFIX caracteres) de cada palavra do long_name, os
+TYPEAHEAD_K códigos mais curtos/genéricos, já ordenados — o autocomplete vira
+uma busca por chave primária.
+"""
+import csv, sqlite3, argparse, glob, hashlib, os, re, sys, time, unicodedata
+
+TYPEAHEAD_MAX_PREFIX = 12
+TYPEAHEAD_K = 20
+FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS loinc_fts
+  USING fts5(long_name, component, class, content='loinc', content_rowid='rowid',
+             prefix='2 3', tokenize='unicode61 remove_diacritics 2');
 """
-import csv, sqlite3, argparse, os, sys
+COLS = ("code", "long_name", "short_name", "component", "property", "time_aspct",
+        "system", "scale_typ", "method_typ", "class")
+CSV_COLS = ("LOINC_NUM", "LONG_COMMON_NAME", "SHORTNAME", "COMPONENT", "PROPERTY",
+            "TIME_ASPCT", "SYSTEM", "SCALE_TYP", "METHOD_TYP", "CLASS")
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS loinc(
+  code TEXT PRIMARY KEY,
+  long_name TEXT,
+  short_name TEXT,
+  component TEXT,
+  property TEXT,
+  time_aspct TEXT,
+  system TEXT,
+  scale_typ TEXT,
+  method_typ TEXT,
+  class TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_loinc_name ON loinc(long_name);
+CREATE INDEX IF NOT EXISTS idx_loinc_component ON loinc(component);
+-- hash do conteúdo por código, para o modo --delta
+CREATE TABLE IF NOT EXISTS loinc_hash(code TEXT PRIMARY KEY, hash TEXT NOT NULL) WITHOUT ROWID;
+"""
+# Mantém loinc_fts (external content) em sincronia com upserts/deletes do delta
+FTS_TRIGGERS_SQL = """
+CREATE TRIGGER IF NOT EXISTS loinc_ai AFTER INSERT ON loinc BEGIN
+  INSERT INTO loinc_fts(rowid, long_name, component, class) VALUES (new.rowid, new.long_name, new.component, new.class);
+END;
+CREATE TRIGGER IF NOT EXISTS loinc_ad AFTER DELETE ON loinc BEGIN
+  INSERT INTO loinc_fts(loinc_fts, rowid, long_name, component, class) VALUES ('delete', old.rowid, old.long_name, old.component, old.class);
+END;
+CREATE TRIGGER IF NOT EXISTS loinc_au AFTER UPDATE ON loinc BEGIN
+  INSERT INTO loinc_fts(loinc_fts, rowid, long_name, component, class) VALUES ('delete', old.rowid, old.long_name, old.component, old.class);
+  INSERT INTO loinc_fts(rowid, long_name, component, class) VALUES (new.rowid, new.long_name, new.component, new.class);
+END;
+"""
+UPSERT_SQL = (f"INSERT INTO loinc VALUES({','.join('?' * len(COLS))}) ON CONFLICT(code) DO UPDATE SET "
+              + ", ".join(f"{c}=excluded.{c}" for c in COLS[1:]))
+BATCH = 5000
+KEEP_VERSIONS = 2
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_words(text):
+    """Palavras em minúsculas e sem acentos (mesma regra de app.py)."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return _WORD_RE.findall(text)
+
+def build_typeahead(conn, max_prefix=TYPEAHEAD_MAX_PREFIX, k=TYPEAHEAD_K):
+    """(Re)gera loinc_typeahead(prefix, pos, code) a partir da tabela loinc."""
+    conn.executescript("""
+    DROP TABLE IF EXISTS loinc_typeahead;
+    CREATE TABLE loinc_typeahead(
+      prefix TEXT NOT NULL,
+      pos INTEGER NOT NULL,
+      code TEXT NOT NULL,
+      PRIMARY KEY(prefix, pos)
+    ) WITHOUT ROWID;
+    """)
+    # Percorre do nome mais curto ao mais longo: os K primeiros de cada prefixo são os melhores
+    top = {}
+    for code, name in conn.execute("SELECT code, long_name FROM loinc WHERE long_name IS NOT NULL ORDER BY length(long_name), code"):
+        seen = set()
+        for word in normalize_words(name):
+            for n in range(1, min(len(word), max_prefix) + 1):
+                pref = word[:n]
+                if pref in seen:
+                    continue
+                seen.add(pref)
+                codes = top.setdefault(pref, [])
+                if len(codes) < k:
+                    codes.append(code)
+    conn.executemany(
+        "INSERT INTO loinc_typeahead VALUES(?,?,?)",
+        ((pref, pos, code) for pref, codes in top.items() for pos, code in enumerate(codes)),
+    )
+    conn.commit()
+    return len(top)
+
+def row_hash(values):
+    return hashlib.sha1("\x1f".join(v or "" for v in values).encode("utf-8")).hexdigest()
+
+def ensure_fts(cur):
+    """Cria loinc_fts (recria índices antigos sem prefix=). Retorna (has_fts, criado_agora)."""
+    old = cur.execute("SELECT sql FROM sqlite_master WHERE name='loinc_fts'").fetchone()
+    if old and "prefix=" in old[0]:
+        return True, False
+    if old:
+        cur.execute("DROP TABLE loinc_fts")
+    try:
+        cur.executescript(FTS_SQL)
+        return True, True
+    except sqlite3.OperationalError:
+        print("[WARN] FTS5 não disponível. Buscas usarão LIKE.", file=sys.stderr)
+        return False, False
+
+def load_hashes(cur):
+    """code -> hash atual; calcula o hash de bancos gerados antes do modo --delta."""
+    hashes = dict(cur.execute("SELECT code, hash FROM loinc_hash"))
+    if not hashes:
+        rows = cur.execute(f"SELECT {','.join(COLS)} FROM loinc").fetchall()
+        hashes = {r[0]: row_hash(r) for r in rows}
+        cur.executemany("INSERT INTO loinc_hash VALUES(?,?)", hashes.items())
+    return hashes
+
+def apply_csv(cur, csv_path, hashes):
+    """Aplica o CSV sobre a tabela: upsert do que é novo/alterado, delete do que sumiu."""
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    seen = set()
+    rows, hash_rows = [], []
+
+    def flush():
+        cur.executemany(UPSERT_SQL, rows)
+        cur.executemany("INSERT OR REPLACE INTO loinc_hash VALUES(?,?)", hash_rows)
+        rows.clear(); hash_rows.clear()
+
+    with open(csv_path, newline='', encoding="utf-8", errors="ignore") as f:
+        for row in csv.DictReader(f):
+            values = tuple(row.get(c) for c in CSV_COLS)
+            code = values[0]
+            if not code:
+                continue
+            seen.add(code)
+            h = row_hash(values)
+            old = hashes.get(code)
+            if old == h:
+                stats["unchanged"] += 1
+                continue
+            stats["added" if old is None else "updated"] += 1
+            hashes[code] = h
+            rows.append(values); hash_rows.append((code, h))
+            if len(rows) >= BATCH:
+                flush()
+    if rows:
+        flush()
+    gone = [(c,) for c in hashes if c not in seen]
+    cur.executemany("DELETE FROM loinc WHERE code=?", gone)
+    cur.executemany("DELETE FROM loinc_hash WHERE code=?", gone)
+    stats["deleted"] = len(gone)
+    return stats
+
+def copy_db(src, dst):
+    """Cópia consistente do banco publicado (API de backup do SQLite)."""
+    s = sqlite3.connect(f"file:{src}?mode=ro", uri=True)
+    d = sqlite3.connect(dst)
+    with d:
+        s.backup(d)
+    s.close(); d.close()
+
+def _remove_db_files(path):
+    for p in (path, path + "-wal", path + "-shm", path + "-journal"):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+def publish(shadow, db, keep=KEEP_VERSIONS):
+    """Troca atômica: shadow -> <db>.<ts> e <db> vira symlink para ele."""
+    target = f"{db}.{time.strftime('%Y%m%d%H%M%S')}"
+    while os.path.exists(target):   # duas publicações no mesmo segundo
+        time.sleep(1)
+        target = f"{db}.{time.strftime('%Y%m%d%H%M%S')}"
+    os.replace(shadow, target)
+    link = db + ".lnk"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, db)
+    # versões antigas: mantém as `keep` mais recentes (leitores podem estar na anterior)
+    versions = sorted(p for p in glob.glob(glob.escape(db) + ".[0-9]*") if re.search(r"\.\d{14}$", p))
+    for old in versions[:-keep]:
+        _remove_db_files(old)
+    return target
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--csv", required=True, help="Caminho para LoincTableCore.csv (ou mapeado equivalente)")
     ap.add_argument("--db", default="/data/loinc.sqlite", help="Arquivo SQLite de saída")
+    ap.add_argument("--delta", action="store_true",
+                    help="Parte do banco atual e grava só linhas novas/alteradas/removidas")
     args = ap.parse_args()
 
     os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
+    shadow = args.db + ".shadow"
+    _remove_db_files(shadow)
+    delta = args.delta and os.path.exists(args.db)
+    if delta:
+        copy_db(args.db, shadow)
 
-    cur.executescript("""
-    PRAGMA journal_mode=WAL;
-    CREATE TABLE IF NOT EXISTS loinc(
-      code TEXT PRIMARY KEY,
-      long_name TEXT,
-      short_name TEXT,
-      component TEXT,
-      property TEXT,
-      time_aspct TEXT,
-      system TEXT,
-      scale_typ TEXT,
-      method_typ TEXT,
-      class TEXT
-    );
-    CREATE INDEX IF NOT EXISTS idx_loinc_name ON loinc(long_name);
-    CREATE INDEX IF NOT EXISTS idx_loinc_component ON loinc(component);
-    """)
+    t0 = time.time()
+    conn = sqlite3.connect(shadow)
+    cur = conn.cursor()
+    # A sombra não é lida por ninguém até a troca: sem WAL e sem fsync durante a carga
+    cur.execute("PRAGMA journal_mode=MEMORY")
+    cur.execute("PRAGMA synchronous=OFF")
+    cur.executescript(SCHEMA_SQL)
+    has_fts, fts_created = ensure_fts(cur)
+    fresh_fts = fts_created or not delta
+    if has_fts and not fresh_fts:
+        cur.executescript(FTS_TRIGGERS_SQL)   # delta: FTS acompanha linha a linha
 
-    # Try to ensure FTS5
-    try:
-        cur.executescript("""
-        CREATE VIRTUAL TABLE IF NOT EXISTS loinc_fts
-          USING fts5(long_name, component, class, content='loinc', content_rowid='rowid');
-        -- Backfill FTS
-        INSERT INTO loinc_fts(loinc_fts) VALUES('rebuild');
-        """)
-        has_fts = True
-    except sqlite3.OperationalError:
-        has_fts = False
-        print("[WARN] FTS5 não disponível. Buscas usarão LIKE.", file=sys.stderr)
+    hashes = load_hashes(cur) if delta else {}
+    stats = apply_csv(cur, args.csv, hashes)
+    changed = stats["added"] + stats["updated"] + stats["deleted"]
+    print("[..] {added} novos, {updated} alterados, {deleted} removidos, {unchanged} iguais".format(**stats))
 
-    # Clear
-    cur.execute("DELETE FROM loinc")
-
-    # Columns expected (core file)
-    # LOINC_NUM,LONG_COMMON_NAME,SHORTNAME,COMPONENT,PROPERTY,TIME_ASPCT,SYSTEM,SCALE_TYP,METHOD_TYP,CLASS
-    with open(args.csv, newline='', encoding="utf-8", errors="ignore") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for i, row in enumerate(reader, 1):
-            rows.append((
-                row.get("LOINC_NUM"), row.get("LONG_COMMON_NAME"), row.get("SHORTNAME"),
-                row.get("COMPONENT"), row.get("PROPERTY"), row.get("TIME_ASPCT"),
-                row.get("SYSTEM"), row.get("SCALE_TYP"), row.get("METHOD_TYP"), row.get("CLASS")
-            ))
-            if len(rows) >= 5000:
-                cur.executemany("INSERT OR REPLACE INTO loinc VALUES(?,?,?,?,?,?,?,?,?,?)", rows)
-                rows.clear()
-        if rows:
-            cur.executemany("INSERT OR REPLACE INTO loinc VALUES(?,?,?,?,?,?,?,?,?,?)", rows)
+    if delta and not changed and not fts_created:
+        conn.close(); _remove_db_files(shadow)
+        print("[OK] sem mudanças; banco publicado mantido:", args.db)
+        return
 
-    conn.commit()
     if has_fts:
-        cur.execute("INSERT INTO loinc_fts(loinc_fts) VALUES('rebuild')")
+        if fresh_fts:
+            # carga completa: um único 'rebuild' no fim e triggers só depois
+            cur.execute("INSERT INTO loinc_fts(loinc_fts) VALUES('rebuild')")
+            cur.executescript(FTS_TRIGGERS_SQL)
+        cur.execute("INSERT INTO loinc_fts(loinc_fts) VALUES('optimize')")
+    conn.commit()
 
-    conn.commit(); conn.close()
-    print("[OK] import concluído:", args.db)
+    n = build_typeahead(conn)
+    print(f"[OK] typeahead: {n} prefixos")
+    cur.execute("PRAGMA journal_mode=DELETE")
+    cur.execute("PRAGMA synchronous=FULL")
+    cur.execute("PRAGMA optimize")
+    conn.close()
+    target = publish(shadow, args.db)
+    print(f"[OK] import concluído em {time.time() - t0:.1f}s: {args.db} -> {os.path.basename(target)}")
 
 if __name__ == "__main__":
     main()